@@ -0,0 +1,530 @@
+"""
+Benchmarks the archive pipeline against a synthetic guild and a fake
+DiscordChatExporter, so scheduling changes can be compared without Discord.
+
+Usage: python benchmarks/bench_archive.py --categories 10 --channels 20 --threads 5
+"""
+
+import argparse
+import asyncio
+import datetime
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import typing_extensions as typing
+
+if typing.TYPE_CHECKING:
+    from common.pipeline import ArchivePipeline
+    from common.plan import ArchivePlan
+
+BENCHMARK_FOLDER = Path(__file__).parent.absolute()
+sys.path.insert(0, BENCHMARK_FOLDER.parent.as_posix())
+
+# every channel's messages are numbered from its id times this, the same way
+# fake_dce.py numbers them
+MESSAGE_IDS_PER_CHANNEL = 10_000
+
+
+def message_id(channel_id: int, message_num: int) -> int:
+    return channel_id * MESSAGE_IDS_PER_CHANNEL + message_num + 1
+
+
+class FakeThread:
+    def __init__(self, thread_id: int, name: str, message_count: int) -> None:
+        self.id = thread_id
+        self.name = name
+        self.message_count = message_count
+
+    @property
+    def last_message_id(self) -> int:
+        return message_id(self.id, self.message_count - 1)
+
+
+class FakeMessage:
+    def __init__(self, message_id: int) -> None:
+        self.id = message_id
+
+
+class FakeThreadList:
+    def __init__(self, threads: list[FakeThread]) -> None:
+        self.threads = threads
+
+
+class FakeTextChannel:
+    def __init__(
+        self,
+        channel_id: int,
+        name: str,
+        message_count: int,
+        threads: list[FakeThread],
+        discovery_latency: float,
+    ) -> None:
+        self.id = channel_id
+        self.name = name
+        self.message_count = message_count
+        self.threads = threads
+        self.discovery_latency = discovery_latency
+
+    @property
+    def last_message_id(self) -> int:
+        return message_id(self.id, self.message_count - 1)
+
+    async def fetch_all_threads(self) -> FakeThreadList:
+        # stands in for the REST round-trips fetching threads takes
+        await asyncio.sleep(self.discovery_latency)
+        return FakeThreadList(self.threads)
+
+    async def fetch_messages(self, limit: int) -> list[FakeMessage]:
+        await asyncio.sleep(self.discovery_latency)
+        return [FakeMessage(self.last_message_id)][:limit]
+
+
+class FakeCategory:
+    def __init__(self, text_channels: list[FakeTextChannel]) -> None:
+        self.text_channels = text_channels
+
+
+class FakeGuild:
+    def __init__(self, categories: dict[int, FakeCategory]) -> None:
+        self.categories = categories
+
+    def get_channel(self, channel_id: int) -> FakeCategory:
+        return self.categories[channel_id]
+
+    def send_messages(self, count: int) -> None:
+        # so later runs have something new to export incrementally
+        for category in self.categories.values():
+            for channel in category.text_channels:
+                channel.message_count += count
+                for thread in channel.threads:
+                    thread.message_count += count
+
+
+class FakeHTTP:
+    """Stands in for the bot's http client when exporting small threads natively."""
+
+    def __init__(self, message_count: int, latency: float) -> None:
+        self.message_count = message_count
+        self.latency = latency
+
+    async def get_channel_messages(
+        self, channel_id: int, limit: int, *, after: int | None = None
+    ) -> list[dict]:
+        await asyncio.sleep(self.latency)
+
+        start = max((after or 0) - message_id(channel_id, -1), 0)
+        started_at = datetime.datetime(2023, 1, 1, tzinfo=datetime.timezone.utc)
+        messages = [
+            {
+                "id": str(message_id(channel_id, message_num)),
+                "content": f"message {message_num} in {channel_id}",
+                "timestamp": (
+                    started_at + datetime.timedelta(minutes=message_num)
+                ).isoformat(),
+                "author": {"id": str(message_num % 3), "username": "user"},
+            }
+            for message_num in range(start, min(start + limit, self.message_count))
+        ]
+        # discord sends pages back newest first
+        return messages[::-1]
+
+
+def build_guild(
+    args: argparse.Namespace, first_id: int
+) -> tuple[FakeGuild, list[dict], int]:
+    next_id = first_id
+    categories: dict[int, FakeCategory] = {}
+    category_entries: list[dict] = []
+
+    for category_num in range(args.categories):
+        category_id = next_id
+        next_id += 1
+
+        text_channels: list[FakeTextChannel] = []
+        for channel_num in range(args.channels):
+            channel_id = next_id
+            next_id += 1
+
+            threads: list[FakeThread] = []
+            for thread_num in range(args.threads):
+                threads.append(
+                    FakeThread(next_id, f"thread-{thread_num}", args.messages)
+                )
+                next_id += 1
+
+            text_channels.append(
+                FakeTextChannel(
+                    channel_id,
+                    f"channel-{channel_num}",
+                    args.messages,
+                    threads,
+                    args.discovery_latency,
+                )
+            )
+
+        categories[category_id] = FakeCategory(text_channels)
+        category_entries.append(
+            {
+                "id": category_id,
+                "name": f"Category {category_num}",
+                "internal_name": f"category_{category_num}",
+            }
+        )
+
+    return FakeGuild(categories), category_entries, next_id
+
+
+def init_publish_repo(archive_location: str) -> None:
+    # publishes go to a local bare repository rather than to github
+    for args in (
+        ("init", "--quiet", "--bare", f"{archive_location}.git"),
+        ("init", "--quiet", archive_location),
+        ("-C", archive_location, "config", "user.name", "Benchmark"),
+        ("-C", archive_location, "config", "user.email", "benchmark@example.com"),
+    ):
+        subprocess.run(("git", *args), check=True)
+
+
+def write_config(
+    folder: str, guild_entries: list[list[dict]], args: argparse.Namespace
+) -> None:
+    lines = [
+        f"max_concurrent_exports = {args.concurrency}",
+        f"max_concurrent_discovery = {args.discovery_concurrency}",
+        f"max_channels_per_export = {args.batch_size}",
+        f"max_total_exports = {args.pool_size}",
+        f"minify_html = {str(args.postprocess).lower()}",
+        f"extract_css = {str(args.postprocess).lower()}",
+        f"precompress_html = {str(args.postprocess).lower()}",
+        f"messages_per_page = {args.messages_per_page}",
+        f"search_index = {str(args.search).lower()}",
+        f"native_export_max_messages = {args.native_threshold}",
+        f'export_format = "{"json" if args.json else "html"}"',
+    ]
+
+    if args.publish:
+        lines.append("publish = true")
+
+    for guild_num, category_entries in enumerate(guild_entries):
+        # a single guild uses the top level of the config, like most setups do
+        if len(guild_entries) == 1:
+            archive_location = f"{folder}/archive"
+            profile_lines = [
+                f'archive_location = "{archive_location}"',
+                'github_name = "Benchmark"',
+            ]
+            table_name = "categories"
+        else:
+            archive_location = f"{folder}/archive_{guild_num}"
+            profile_lines = [
+                "",
+                "[[profiles]]",
+                f"guild_id = {guild_num}",
+                f'archive_location = "{archive_location}"',
+                f'github_name = "Benchmark-{guild_num}"',
+            ]
+            table_name = "profiles.categories"
+
+        if args.publish:
+            init_publish_repo(archive_location)
+            profile_lines.append(f'publish_remote = "{archive_location}.git"')
+
+        if len(guild_entries) == 1:
+            lines[:0] = profile_lines
+        else:
+            lines.extend(profile_lines)
+
+        for entry in category_entries:
+            lines.extend(
+                [
+                    "",
+                    f"[[{table_name}]]",
+                    f"id = {entry['id']}",
+                    f'name = "{entry["name"]}"',
+                    f'internal_name = "{entry["internal_name"]}"',
+                ]
+            )
+
+    with open(f"{folder}/kg_config.toml", "w", encoding="utf-8") as file:
+        file.write("\n".join(lines))
+
+
+async def archive_guild(
+    guild: FakeGuild, guild_id: int, http: FakeHTTP
+) -> tuple[dict[str, float], "ArchivePipeline", "ArchivePlan"]:
+    # imported here as the config is read from DIRECTORY_OF_FILE on import
+    from common.archive_queue import EXPORT_POOL
+    from common.job import ArchiveJob
+    from common.pipeline import ArchivePipeline, discover
+    from common.profiles import get_profile
+
+    profile = get_profile(guild_id)
+    timings: dict[str, float] = {}
+
+    started_at = time.perf_counter()
+    categories = await discover(guild, profile)
+    timings["discovery"] = time.perf_counter() - started_at
+
+    os.makedirs(profile.archive_location, exist_ok=True)
+    job = ArchiveJob(
+        f"{profile.archive_location}/.archive_job.json",
+        guild_id,
+        [category.to_dict() for category in categories],
+    )
+    job.save()
+
+    pipeline = ArchivePipeline(job, profile, pool=EXPORT_POOL, http=http)
+    archive_plan = pipeline.plan(categories)
+    await pipeline.run(categories)
+    timings.update(pipeline.stage_timings)
+    timings["total"] = time.perf_counter() - started_at
+
+    return timings, pipeline, archive_plan
+
+
+async def rerender_guild(guild_id: int) -> tuple[int, float]:
+    from common.index import load_tree
+    from common.job import ArchiveJob
+    from common.pipeline import ArchivePipeline
+    from common.profiles import get_profile
+
+    profile = get_profile(guild_id)
+    categories = load_tree(profile)
+    job = ArchiveJob(
+        f"{profile.archive_location}/.archive_job.json",
+        guild_id,
+        [category.to_dict() for category in categories],
+    )
+
+    started_at = time.perf_counter()
+    rendered = await ArchivePipeline(job, profile).rerender(categories)
+    return rendered, time.perf_counter() - started_at
+
+
+async def run_rerender(guild_count: int) -> None:
+    results = await asyncio.gather(
+        *(rerender_guild(guild_id) for guild_id in range(guild_count))
+    )
+
+    print("\nRerender:")  # noqa: T201
+    for guild_id, (rendered, duration) in enumerate(results):
+        print(  # noqa: T201
+            f"  guild {guild_id}: {rendered} export(s) rerendered in {duration:.3f}s"
+        )
+
+
+async def run_benchmark(guilds: list[FakeGuild], http: FakeHTTP, run_num: int) -> None:
+    import initialize
+
+    # the fake cli is always ready
+    initialize.CLI_READY.set()
+
+    # every guild is archived at once, sharing the export pool like the bot does
+    results = await asyncio.gather(
+        *(archive_guild(guild, guild_id, http) for guild_id, guild in enumerate(guilds))
+    )
+
+    print(f"\nRun {run_num}:")  # noqa: T201
+    for guild_id, (timings, pipeline, archive_plan) in enumerate(results):
+        if len(guilds) > 1:
+            print(f" Guild {guild_id}:")  # noqa: T201
+
+        for stage, duration in timings.items():
+            print(f"  {stage:<10} {duration:8.3f}s")  # noqa: T201
+        print(  # noqa: T201
+            f"  {pipeline.progress.channels_exported} channel(s) and"
+            f" {pipeline.progress.messages:,} message(s) exported in"
+            f" {len(pipeline.progress.results)} export(s)"
+        )
+        print(  # noqa: T201
+            f"  planned {len(archive_plan.exports)} export(s)"
+            f" ({sum(export.native for export in archive_plan.exports)} native),"
+            f" ~{archive_plan.messages:,} message(s) and"
+            f" {archive_plan.projected_duration:.3f}s of exports"
+        )
+        if pipeline.throttle:
+            print(f"  {pipeline.throttle.describe()}")  # noqa: T201
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--categories", type=int, default=5)
+    parser.add_argument("--channels", type=int, default=10, help="per category")
+    parser.add_argument("--threads", type=int, default=3, help="per channel")
+    parser.add_argument("--messages", type=int, default=100, help="per channel")
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="export seconds per channel"
+    )
+    parser.add_argument(
+        "--discovery-latency",
+        type=float,
+        default=0.05,
+        help="seconds per fetch_all_threads call",
+    )
+    parser.add_argument(
+        "--guilds", type=int, default=1, help="archived at once, each with a profile"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=4, help="concurrent exports per guild"
+    )
+    parser.add_argument(
+        "--pool-size", type=int, default=8, help="concurrent exports across guilds"
+    )
+    parser.add_argument("--discovery-concurrency", type=int, default=10)
+    parser.add_argument(
+        "--batch-size", type=int, default=250, help="max channels per CLI invocation"
+    )
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=2,
+        help="later runs exercise the incremental path",
+    )
+    parser.add_argument(
+        "--new-messages",
+        type=int,
+        default=10,
+        help="per channel, sent between runs",
+    )
+    parser.add_argument(
+        "--postprocess",
+        action="store_true",
+        help="minify, extract stylesheets and precompress exports",
+    )
+    parser.add_argument(
+        "--messages-per-page",
+        type=int,
+        default=0,
+        help="split exports into pages of about this many messages",
+    )
+    parser.add_argument(
+        "--rate-limits",
+        type=float,
+        default=0,
+        help="the chance of each CLI invocation reporting a rate limit",
+    )
+    parser.add_argument(
+        "--native-threshold",
+        type=int,
+        default=0,
+        help="export threads with at most this many messages through a fake bot",
+    )
+    parser.add_argument(
+        "--request-latency",
+        type=float,
+        default=0.05,
+        help="seconds per fake message fetch when exporting natively",
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="export json and render html from it, rather than exporting html",
+    )
+    parser.add_argument(
+        "--rerender",
+        action="store_true",
+        help="rerender every json export after the runs, like after a style change",
+    )
+    parser.add_argument(
+        "--search", action="store_true", help="build the full-text search index"
+    )
+    parser.add_argument(
+        "--publish",
+        action="store_true",
+        help="commit and push each run to a local bare repository",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="report peak Python memory, at the cost of slower timings",
+    )
+    parser.add_argument(
+        "--keep", action="store_true", help="keep the generated archive around"
+    )
+    args = parser.parse_args()
+
+    guilds: list[FakeGuild] = []
+    guild_entries: list[list[dict]] = []
+    next_id = 1000
+    for _ in range(args.guilds):
+        guild, category_entries, next_id = build_guild(args, next_id)
+        guilds.append(guild)
+        guild_entries.append(category_entries)
+
+    folder = tempfile.mkdtemp()
+    try:
+        write_config(folder, guild_entries, args)
+
+        fake_dce = BENCHMARK_FOLDER.joinpath("fake_dce.py")
+        os.environ.update(
+            {
+                "DIRECTORY_OF_FILE": folder,
+                "WEBSITE_BASE": "https://example.com/",
+                "MAIN_TOKEN": "benchmark",
+                "CLI_EXECUTABLE": fake_dce.as_posix(),
+                "FAKE_DCE_LATENCY": str(args.latency),
+                "FAKE_DCE_RATE_LIMITS": str(args.rate_limits),
+            }
+        )
+
+        print(  # noqa: T201
+            f"{args.guilds} guild(s) x {args.categories} categories x"
+            f" {args.channels} channels x {args.threads} threads,"
+            f" {args.concurrency} concurrent export(s) per guild"
+        )
+
+        # tracing slows every allocation down, including those made by the
+        # post-processing workers, so it's only done when asked for
+        if args.trace_memory:
+            tracemalloc.start()
+        message_count = args.messages
+        for run_num in range(1, args.runs + 1):
+            if run_num > 1:
+                message_count += args.new_messages
+                for guild in guilds:
+                    guild.send_messages(args.new_messages)
+
+            os.environ["FAKE_DCE_MESSAGES"] = str(message_count)
+            asyncio.run(
+                run_benchmark(
+                    guilds, FakeHTTP(message_count, args.request_latency), run_num
+                )
+            )
+        if args.rerender:
+            asyncio.run(run_rerender(len(guilds)))
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        import common.metrics as metrics
+
+        print(f"\n{metrics.summarize()}")  # noqa: T201
+
+    finally:
+        if args.keep:
+            print(f"\nArchive kept at {folder}")  # noqa: T201
+        else:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    # ru_maxrss is in kilobytes on linux, bytes on macos
+    rss_divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    print()  # noqa: T201
+    if args.trace_memory:
+        print(f"Peak Python memory: {peak_memory / 1024 / 1024:.2f} MiB")  # noqa: T201
+    print(  # noqa: T201
+        "Peak RSS:"
+        f" {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / rss_divisor:.2f} MiB"
+        " (bot),"
+        f" {resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / rss_divisor:.2f}"
+        " MiB (largest CLI process)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+A stand-in for DiscordChatExporter.Cli that never touches Discord.
+
+It accepts the same arguments the archive pipeline passes, sleeps to simulate
+export latency and writes HTML or JSON shaped like DiscordChatExporter's own.
+
+Tuned through environment variables:
+* FAKE_DCE_LATENCY - seconds each channel takes to export, defaults to 0.05
+* FAKE_DCE_MESSAGES - messages in each channel, defaults to 100. only those
+  after --after are written, like the real thing
+* FAKE_DCE_RATE_LIMITS - the chance of each run reporting a rate limit, defaults
+  to 0
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+
+# the real thing inlines a few hundred css rules into every page
+STYLESHEET = "\n".join(
+    f"""        .chatlog__rule-{rule} {{
+            margin: 0 0 {rule}px;
+            font-family: "gg sans", "Helvetica Neue", Helvetica, Arial, sans-serif;
+        }}"""
+    for rule in range(200)
+)
+
+PREAMBLE = """<!DOCTYPE html>
+<html lang="en">
+    <head>
+        <title>{channel_id}</title>
+        <style>
+{stylesheet}
+        </style>
+    </head>
+    <body>
+        <div class="preamble">
+            <div class="preamble__entry">Channel {channel_id}</div>
+        </div>
+        <div class="chatlog">
+"""
+
+MESSAGE_GROUP = """            <div class="chatlog__message-group">
+                <div class="chatlog__message-container" data-message-id="{message_id}">
+                    <div class="chatlog__message">
+                        <img class="chatlog__avatar" src="{avatar}">
+                        <span class="chatlog__author" title="{author}">{author}</span>
+                        <span class="chatlog__timestamp">
+                            <a href="#chatlog__message-container-{message_id}">01/01/2024 00:00</a>
+                        </span>
+                        <div class="chatlog__content chatlog__markdown">
+                            <span class="chatlog__markdown-preserve">Message {message_id} in channel {channel_id} about the {topic}</span>
+                        </div>
+                    </div>
+                </div>
+            </div>
+"""
+
+# gives the search index something to find
+AUTHORS = ("Kaede", "Shuichi", "Kokichi", "Kaito", "Maki")
+TOPICS = ("trial", "motive", "library", "courtyard", "casino", "dining hall")
+
+# matches the message ids bench_archive.py gives its fake channels
+MESSAGE_IDS_PER_CHANNEL = 10_000
+
+POSTAMBLE = """        </div>
+        <div class="postamble">
+            <div class="postamble__entry">Exported {message_count:,} message(s)</div>
+        </div>
+    </body>
+</html>
+"""
+
+
+def write_avatar(media_folder: str | None, channel_id: str) -> str:
+    if not media_folder:
+        return "https://cdn.discordapp.com/embed/avatars/0.png"
+
+    # every channel gets its "own" avatar url, but they all share the same
+    # content, like the same character avatar uploaded in several places
+    os.makedirs(media_folder, exist_ok=True)
+    avatar_path = os.path.join(media_folder, f"avatar-{channel_id}.png")
+    with open(avatar_path, "wb") as file:
+        file.write(b"not really a png")
+    return os.path.abspath(avatar_path)
+
+
+def message_id(channel_id: str, message_num: int) -> int:
+    return int(channel_id) * MESSAGE_IDS_PER_CHANNEL + message_num + 1
+
+
+def message_nums(channel_id: str, message_count: int, after: int | None) -> range:
+    # message ids only go up, so everything after --after is a run at the end
+    start = max((after or 0) - message_id(channel_id, -1), 0)
+    return range(min(start, message_count), message_count)
+
+
+def write_export(
+    path: str, channel_id: str, nums: range, media_folder: str | None
+) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    avatar = write_avatar(media_folder, channel_id)
+
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(PREAMBLE.format(channel_id=channel_id, stylesheet=STYLESHEET))
+        for message_num in nums:
+            file.write(
+                MESSAGE_GROUP.format(
+                    message_id=message_id(channel_id, message_num),
+                    channel_id=channel_id,
+                    avatar=avatar,
+                    author=AUTHORS[message_num % len(AUTHORS)],
+                    topic=TOPICS[message_num % len(TOPICS)],
+                )
+            )
+        file.write(POSTAMBLE.format(message_count=len(nums)))
+
+
+def write_json_export(
+    path: str, channel_id: str, nums: range, media_folder: str | None
+) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    avatar = write_avatar(media_folder, channel_id)
+
+    # written a message at a time, with the same indentation as the real thing
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(
+            "{\n"
+            f'  "guild": {{"id": "0", "name": "Guild"}},\n'
+            f'  "channel": {{"id": "{channel_id}", "category": "Category",'
+            f' "name": "Channel {channel_id}"}},\n'
+            '  "messages": [\n'
+        )
+        for message_num in nums:
+            message = {
+                "id": str(message_id(channel_id, message_num)),
+                "timestamp": f"2024-01-01T{message_num // 3600 % 24:02}:"
+                f"{message_num // 60 % 60:02}:{message_num % 60:02}+00:00",
+                "content": (
+                    f"Message {message_num} in channel {channel_id} about the"
+                    f" {TOPICS[message_num % len(TOPICS)]}"
+                ),
+                "author": {
+                    "id": str(message_num % len(AUTHORS)),
+                    "name": AUTHORS[message_num % len(AUTHORS)],
+                    "avatarUrl": avatar,
+                },
+                "attachments": [],
+                "embeds": [],
+            }
+            separator = ",\n" if message_num < nums.stop - 1 else "\n"
+            file.write(f"    {json.dumps(message, indent=2)}{separator}")
+        file.write(f'  ],\n  "messageCount": {len(nums)}\n}}\n')
+
+
+def main() -> int:
+    if "--version" in sys.argv:
+        print("v0.0.0")  # noqa: T201
+        return 0
+
+    parser = argparse.ArgumentParser(allow_abbrev=False)
+    parser.add_argument("command")
+    parser.add_argument("-c", "--channel", nargs="+", required=True)
+    parser.add_argument("-o", "--output", required=True)
+    parser.add_argument("--parallel", type=int, default=1)
+    parser.add_argument("--media-dir")
+    parser.add_argument("-f", "--format", default="HtmlDark")
+    parser.add_argument("--after", type=int)
+    # anything else the pipeline passes doesn't change what we do
+    args, _ = parser.parse_known_args()
+
+    latency = float(os.environ.get("FAKE_DCE_LATENCY", 0.05))
+    message_count = int(os.environ.get("FAKE_DCE_MESSAGES", 100))
+    rate_limit_chance = float(os.environ.get("FAKE_DCE_RATE_LIMITS", 0))
+
+    print(f"Exporting {len(args.channel)} channel(s)...", flush=True)  # noqa: T201
+
+    # channels are exported in waves of --parallel, like the real thing
+    waves = math.ceil(len(args.channel) / max(args.parallel, 1))
+    for wave in range(waves):
+        time.sleep(latency)
+        print(f"{(wave + 1) / waves:.0%}", flush=True)  # noqa: T201
+
+    if random.random() < rate_limit_chance:  # noqa: S311
+        print(  # noqa: T201
+            "Rate limited (429 Too Many Requests), retrying in 1s...", flush=True
+        )
+
+    for channel_id in args.channel:
+        (write_json_export if args.format == "Json" else write_export)(
+            args.output.replace("%c", channel_id),
+            channel_id,
+            message_nums(channel_id, message_count, args.after),
+            args.media_dir,
+        )
+
+    print(  # noqa: T201
+        f"Successfully exported {len(args.channel)} channel(s).", flush=True
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+import asyncio
+import collections
+import contextlib
+from collections.abc import AsyncIterator, Awaitable, Callable, Hashable
+
+import attrs
+
+from common.config import CONFIG
+
+__all__ = (
+    "ARCHIVES",
+    "EXPORT_POOL",
+    "AlreadyQueued",
+    "ArchiveQueue",
+    "FairLimiter",
+    "QueuedArchive",
+)
+
+
+class AlreadyQueued(ValueError):
+    """Raised when something is already queued or running under the same key."""
+
+
+class FairLimiter:
+    """
+    A semaphore shared between several keys, handing out free slots to each
+    waiting key in turn so no one key can hog every slot.
+    """
+
+    def __init__(self, limit: int) -> None:
+        if limit < 1:
+            raise ValueError("limit must be at least 1.")
+
+        self.limit = limit
+        self.in_use = 0
+        # insertion order doubles as the round-robin order
+        self.waiters: dict[Hashable, collections.deque[asyncio.Future[None]]] = {}
+
+    def _wake(self) -> None:
+        while self.in_use < self.limit and self.waiters:
+            key = next(iter(self.waiters))
+            waiters = self.waiters.pop(key)
+            future = waiters.popleft()
+            if waiters:
+                # back of the line for whoever just got a slot
+                self.waiters[key] = waiters
+
+            if not future.done():
+                self.in_use += 1
+                future.set_result(None)
+
+    async def acquire(self, key: Hashable) -> None:
+        if self.in_use < self.limit and not self.waiters:
+            self.in_use += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(key, collections.deque()).append(future)
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # got a slot right as we were cancelled, so give it back
+                self.release()
+            elif waiters := self.waiters.get(key):
+                with contextlib.suppress(ValueError):
+                    waiters.remove(future)
+                if not waiters:
+                    del self.waiters[key]
+            raise
+
+    def release(self) -> None:
+        self.in_use -= 1
+        self._wake()
+
+    def set_limit(self, limit: int) -> None:
+        # slots already handed out are kept, but no new ones are handed out
+        # until enough of them are released
+        if limit < 1:
+            raise ValueError("limit must be at least 1.")
+
+        self.limit = limit
+        self._wake()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, key: Hashable) -> AsyncIterator[None]:
+        await self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+@attrs.define()
+class QueuedArchive:
+    key: Hashable = attrs.field()
+    run: Callable[[], Awaitable[None]] = attrs.field()
+    on_position: Callable[[int], Awaitable[None]] = attrs.field()
+    position: int | None = attrs.field(default=None)
+    done: asyncio.Future[None] = attrs.field(
+        factory=lambda: asyncio.get_running_loop().create_future()
+    )
+
+
+class ArchiveQueue:
+    """
+    Runs archive requests, at most `max_active` at a time and otherwise in the
+    order they were made. Requests are keyed by what they archive to, and only
+    one request per key can be queued or running at once.
+    """
+
+    def __init__(self, max_active: int) -> None:
+        self.max_active = max_active
+        self.waiting: collections.deque[QueuedArchive] = collections.deque()
+        self.active: dict[Hashable, QueuedArchive] = {}
+        self.tasks: set[asyncio.Task] = set()
+
+    def position(self, key: Hashable) -> int | None:
+        # 0 means the archive is running
+        if key in self.active:
+            return 0
+        for index, queued in enumerate(self.waiting):
+            if queued.key == key:
+                return index + 1
+        return None
+
+    async def _run(self, queued: QueuedArchive) -> None:
+        try:
+            await queued.run()
+        except asyncio.CancelledError:
+            queued.done.cancel()
+            raise
+        except Exception as e:
+            queued.done.set_exception(e)
+        else:
+            queued.done.set_result(None)
+        finally:
+            del self.active[queued.key]
+            await self._advance()
+
+    async def _advance(self) -> None:
+        while len(self.active) < self.max_active and self.waiting:
+            queued = self.waiting.popleft()
+            self.active[queued.key] = queued
+            task = asyncio.create_task(self._run(queued))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+        for index, queued in enumerate(self.waiting, start=1):
+            if queued.position != index:
+                queued.position = index
+                await queued.on_position(index)
+
+    async def submit(
+        self,
+        key: Hashable,
+        run: Callable[[], Awaitable[None]],
+        on_position: Callable[[int], Awaitable[None]],
+    ) -> None:
+        """
+        Queues `run`, and waits for it to finish. `on_position` is called
+        whenever the request's place in the queue changes.
+
+        Raises AlreadyQueued if something with the same key is already queued or
+        running.
+        """
+        if self.position(key) is not None:
+            raise AlreadyQueued("That archive is already queued or running.")
+
+        queued = QueuedArchive(key, run, on_position)
+        self.waiting.append(queued)
+        await self._advance()
+        await queued.done
+
+
+ARCHIVES = ArchiveQueue(CONFIG.get("max_concurrent_archives", 2))
+EXPORT_POOL = FairLimiter(CONFIG.get("max_total_exports", 8))
@@ -0,0 +1,80 @@
+import asyncio
+import logging
+import os
+import shutil
+
+import common.metrics as metrics
+
+__all__ = ("DiskBudget", "format_size")
+
+logger = logging.getLogger("kgarchivebot")
+
+
+def format_size(size: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(size) < 1024:
+            return f"{size:,.1f} {unit}"
+        size /= 1024
+    return f"{size:,.1f} TiB"
+
+
+class DiskBudget:
+    """
+    Keeps an archive from filling up the disk it's written to.
+
+    Before every export, `wait_for_space` holds things up for as long as there's
+    less than `min_free_bytes` free, checking again every `poll_interval`
+    seconds, so the disk filling up pauses the run instead of leaving
+    half-written files behind.
+    """
+
+    def __init__(
+        self, path: str, min_free_bytes: int, *, poll_interval: float = 30
+    ) -> None:
+        self.path = path
+        self.min_free_bytes = min_free_bytes
+        self.poll_interval = poll_interval
+        self.lock = asyncio.Lock()
+        self.written: dict[str, int] = {}
+
+    def free_bytes(self) -> int:
+        # the archive folder might not have been made yet
+        path = os.path.abspath(self.path)
+        while not os.path.exists(path) and os.path.dirname(path) != path:
+            path = os.path.dirname(path)
+        return shutil.disk_usage(path).free
+
+    def available_bytes(self) -> int:
+        return max(self.free_bytes() - self.min_free_bytes, 0)
+
+    def has_space(self) -> bool:
+        return self.free_bytes() >= self.min_free_bytes
+
+    async def wait_for_space(self) -> None:
+        # only one export polls - the others queue up behind it
+        async with self.lock:
+            paused = False
+            while not await asyncio.to_thread(self.has_space):
+                if not paused:
+                    paused = True
+                    logger.warning(
+                        "Only %s is free under %s, pausing exports until at least"
+                        " %s is.",
+                        format_size(self.free_bytes()),
+                        self.path,
+                        format_size(self.min_free_bytes),
+                    )
+                await asyncio.sleep(self.poll_interval)
+
+            if paused:
+                logger.info("Enough space is free again, resuming exports.")
+
+    def record(self, category: str, size: int) -> None:
+        self.written[category] = self.written.get(category, 0) + size
+        metrics.WRITTEN_BYTES.inc(size, category=category)
+
+    def describe(self) -> str:
+        return "\n".join(
+            f"- `{category}`: {format_size(size)}"
+            for category, size in self.written.items()
+        )
@@ -0,0 +1,246 @@
+import json
+import os
+import re
+
+import attrs
+
+from common.files import write_atomic
+
+__all__ = (
+    "Page",
+    "count_messages",
+    "is_complete",
+    "last_message_id",
+    "load_pages",
+    "merge_exports",
+    "save_pages",
+    "split_export",
+)
+
+CHATLOG_START = '<div class="chatlog">'
+POSTAMBLE_START = '<div class="postamble">'
+MESSAGE_GROUP_START = '<div class="chatlog__message-group">'
+MESSAGE_COUNT_REGEX = re.compile(r"Exported ([\d,]+) message\(s\)")
+MESSAGE_ID_REGEX = re.compile(r'data-message-id="(\d+)"')
+MESSAGE_ID_BYTES_REGEX = re.compile(rb'data-message-id="(\d+)"')
+# the element each message is in, which carries its id
+MESSAGE_CONTAINER_REGEX = re.compile(r'<div[^>]*\bdata-message-id="(\d+)"')
+
+
+def _chatlog_end(content: str) -> int:
+    # DiscordChatExporter closes the chatlog div right before the postamble
+    postamble_index = content.index(POSTAMBLE_START)
+    return content.rindex("</div>", 0, postamble_index)
+
+
+def _message_count(content: str) -> int:
+    if match := MESSAGE_COUNT_REGEX.search(content):
+        return int(match.group(1).replace(",", ""))
+    return 0
+
+
+def _read_end(path: str) -> str:
+    with open(path, "rb") as file:
+        file.seek(0, os.SEEK_END)
+        file.seek(max(file.tell() - 65536, 0))
+        return file.read().decode("utf-8", errors="ignore")
+
+
+def count_messages(path: str) -> int:
+    # the message count is in the postamble, so only the end needs to be read
+    return _message_count(_read_end(path))
+
+
+def is_complete(path: str) -> bool:
+    # an export cut off part way through never got its postamble written
+    return POSTAMBLE_START in _read_end(path)
+
+
+def _last_message_id(content: str, end: int) -> int | None:
+    index = content.rfind('data-message-id="', 0, end)
+    if index == -1:
+        return None
+    return int(MESSAGE_ID_REGEX.match(content, index).group(1))  # type: ignore
+
+
+def last_message_id(path: str) -> int | None:
+    """
+    Finds the id of the last message in the HTML export at `path`, which is also
+    the newest one. Only reads as much of the end of the file as it has to.
+    """
+    with open(path, "rb") as file:
+        position = file.seek(0, os.SEEK_END)
+        # kept around in case an id is split between two reads
+        overlap = b""
+        while position > 0:
+            read_size = min(position, 65536)
+            position -= read_size
+            file.seek(position)
+            data = file.read(read_size) + overlap
+            if matches := MESSAGE_ID_BYTES_REGEX.findall(data):
+                return int(matches[-1])
+            overlap = data[:64]
+    return None
+
+
+def _split_groups(body: str) -> list[str]:
+    group_starts = [
+        match.start() for match in re.finditer(re.escape(MESSAGE_GROUP_START), body)
+    ]
+    if not group_starts:
+        # an empty channel has no messages, so no groups either
+        return []
+
+    return [
+        body[start:end]
+        for start, end in zip(group_starts, [*group_starts[1:], len(body)], strict=True)
+    ]
+
+
+def _drop_seen_messages(body: str, last_seen_id: int) -> tuple[str, int]:
+    """
+    Drops every message up to and including `last_seen_id` from a chatlog's
+    body, returning what's left and how many messages were dropped.
+    """
+    kept: list[str] = []
+    dropped = 0
+    for group in _split_groups(body):
+        containers = list(MESSAGE_CONTAINER_REGEX.finditer(group))
+        seen = sum(int(match.group(1)) <= last_seen_id for match in containers)
+        dropped += seen
+        if not seen:
+            kept.append(group)
+        elif seen < len(containers):
+            # messages are in order, so the ones already seen come first
+            kept.append(
+                group[: containers[0].start()] + group[containers[seen].start() :]
+            )
+    return "".join(kept), dropped
+
+
+def merge_exports(existing_path: str, new_path: str) -> None:
+    """
+    Appends the messages of the HTML export at `new_path` to the HTML export at
+    `existing_path`, in place. Messages the existing export already has are
+    left out, so exporting from too far back never duplicates anything.
+
+    Raises ValueError if either file does not look like a DiscordChatExporter
+    HTML export.
+    """
+    with open(existing_path, encoding="utf-8") as file:
+        existing = file.read()
+    with open(new_path, encoding="utf-8") as file:
+        new = file.read()
+
+    if CHATLOG_START not in new or POSTAMBLE_START not in existing:
+        raise ValueError("Could not find the chatlog in the exported files.")
+
+    existing_end = _chatlog_end(existing)
+    new_start = new.index(CHATLOG_START) + len(CHATLOG_START)
+    new_end = _chatlog_end(new)
+    new_body = new[new_start:new_end]
+    dropped = 0
+
+    # ids only ever go up, so the last one is the newest
+    existing_last_id = _last_message_id(existing, existing_end)
+    new_first_id = MESSAGE_ID_REGEX.search(new_body)
+    if (
+        existing_last_id is not None
+        and new_first_id
+        and int(new_first_id.group(1)) <= existing_last_id
+    ):
+        new_body, dropped = _drop_seen_messages(new_body, existing_last_id)
+
+    merged = existing[:existing_end] + new_body + existing[existing_end:]
+
+    message_count = _message_count(existing) + _message_count(new) - dropped
+    merged = MESSAGE_COUNT_REGEX.sub(
+        f"Exported {message_count:,} message(s)", merged, count=1
+    )
+
+    with write_atomic(existing_path) as file:
+        file.write(merged)
+
+
+@attrs.define()
+class Page:
+    number: int = attrs.field()
+    messages: int = attrs.field()
+    first_message_id: int | None = attrs.field()
+    last_message_id: int | None = attrs.field()
+
+
+def load_pages(pages_folder: str) -> list[Page]:
+    path = f"{pages_folder}/pages.json"
+    if not os.path.exists(path):
+        return []
+
+    with open(path, encoding="utf-8") as file:
+        return [Page(**page) for page in json.load(file)]
+
+
+def save_pages(pages_folder: str, pages: list[Page]) -> None:
+    with write_atomic(f"{pages_folder}/pages.json") as file:
+        json.dump([attrs.asdict(page) for page in pages], file)
+
+
+def split_export(
+    path: str, pages_folder: str, messages_per_page: int, first_page: int = 1
+) -> list[Page]:
+    """
+    Splits the HTML export at `path` into pages of about `messages_per_page`
+    messages each, written to `pages_folder` as `<number>.html` starting from
+    `first_page`. Message groups are never split up, so pages may run over a
+    little.
+
+    Raises ValueError if the file does not look like a DiscordChatExporter HTML
+    export.
+    """
+    with open(path, encoding="utf-8") as file:
+        content = file.read()
+
+    if CHATLOG_START not in content or POSTAMBLE_START not in content:
+        raise ValueError("Could not find the chatlog in the exported file.")
+
+    chatlog_start = content.index(CHATLOG_START) + len(CHATLOG_START)
+    chatlog_end = _chatlog_end(content)
+    head, body, tail = (
+        content[:chatlog_start],
+        content[chatlog_start:chatlog_end],
+        content[chatlog_end:],
+    )
+
+    groups = _split_groups(body)
+
+    # there's always at least one page, even if the whole export is empty
+    page_groups: list[list[str]] = [[]]
+    page_messages = 0
+    for group in groups:
+        if page_messages >= messages_per_page:
+            page_groups.append([])
+            page_messages = 0
+        page_groups[-1].append(group)
+        page_messages += len(MESSAGE_ID_REGEX.findall(group))
+
+    os.makedirs(pages_folder, exist_ok=True)
+    pages: list[Page] = []
+    for number, page_group in enumerate(page_groups, start=first_page):
+        page_body = "".join(page_group)
+        message_ids = [int(i) for i in MESSAGE_ID_REGEX.findall(page_body)]
+
+        page_tail = MESSAGE_COUNT_REGEX.sub(
+            f"Exported {len(message_ids):,} message(s)", tail, count=1
+        )
+        with write_atomic(f"{pages_folder}/{number}.html") as file:
+            file.write(head + "\n" + page_body + page_tail)
+
+        pages.append(
+            Page(
+                number,
+                len(message_ids),
+                min(message_ids, default=None),
+                max(message_ids, default=None),
+            )
+        )
+
+    return pages
@@ -0,0 +1,8 @@
+import os
+
+import tomli
+
+__all__ = ("CONFIG",)
+
+with open(f"{os.environ["DIRECTORY_OF_FILE"]}/kg_config.toml", "rb") as config_file:
+    CONFIG = tomli.load(config_file)
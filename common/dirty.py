@@ -0,0 +1,94 @@
+import json
+import os
+
+from common.files import write_atomic
+
+__all__ = ("DirtyChannels",)
+
+
+class DirtyChannels:
+    """
+    Keeps track of which channels have seen activity since they were last
+    archived, so scheduled archives only have to look at those.
+
+    `channels` holds the text channels whose threads and new messages need
+    archiving, while `refresh` holds the channels and threads that had messages
+    edited or deleted, which an incremental export would miss - those are
+    exported in full instead. `last_message_ids` holds the newest message seen
+    in each text channel, as the bot's cache never keeps track of it.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.channels: set[int] = set()
+        self.refresh: set[int] = set()
+        self.last_message_ids: dict[int, int] = {}
+        self.unsaved = False
+
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                data = json.load(file)
+            self.channels = set(data["channels"])
+            self.refresh = set(data["refresh"])
+            self.last_message_ids = {
+                int(channel_id): message_id
+                for channel_id, message_id in data.get("last_message_ids", {}).items()
+            }
+
+    def __bool__(self) -> bool:
+        return bool(self.channels)
+
+    def mark(
+        self,
+        channel_id: int,
+        *,
+        refresh: int | None = None,
+        message_id: int | None = None,
+    ) -> None:
+        self.unsaved = True
+        self.channels.add(channel_id)
+        if refresh is not None:
+            self.refresh.add(refresh)
+        if message_id is not None and message_id > self.last_message_ids.get(
+            channel_id, 0
+        ):
+            self.last_message_ids[channel_id] = message_id
+
+    def take(self) -> tuple[set[int], set[int], dict[int, int]]:
+        """
+        Empties out the set, returning the channels, the targets to refresh and
+        the newest messages that were in it.
+        """
+        taken = self.channels, self.refresh, self.last_message_ids
+        self.channels, self.refresh, self.last_message_ids = set(), set(), {}
+        self.unsaved = True
+        return taken
+
+    def restore(
+        self, channels: set[int], refresh: set[int], last_message_ids: dict[int, int]
+    ) -> None:
+        # for when archiving what was taken out fails, so it's tried again later
+        self.channels.update(channels)
+        self.refresh.update(refresh)
+        for channel_id, message_id in last_message_ids.items():
+            self.mark(channel_id, message_id=message_id)
+        self.unsaved = True
+
+    def save(self) -> None:
+        if not self.unsaved:
+            return
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with write_atomic(self.path) as file:
+            json.dump(
+                {
+                    "channels": sorted(self.channels),
+                    "refresh": sorted(self.refresh),
+                    "last_message_ids": {
+                        str(channel_id): message_id
+                        for channel_id, message_id in self.last_message_ids.items()
+                    },
+                },
+                file,
+            )
+        self.unsaved = False
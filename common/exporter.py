@@ -0,0 +1,95 @@
+import asyncio
+import os
+
+__all__ = ("Exporter",)
+
+# windows caps a command line at 32,767 characters, so stay well under that
+MAX_ARGUMENT_LENGTH = 24576
+
+
+class Exporter:
+    """
+    Runs DiscordChatExporter.Cli directly rather than through a shell, passing
+    the token through the environment instead of the command line.
+    """
+
+    def __init__(
+        self,
+        executable: str,
+        token: str,
+        *,
+        parallel: int = 10,
+        max_batch_size: int = 250,
+        media: bool = True,
+        media_folder: str | None = None,
+        export_json: bool = False,
+    ) -> None:
+        self.executable = executable
+        self.token = token
+        self.parallel = parallel
+        self.max_batch_size = max_batch_size
+        self.media = media
+        self.media_folder = media_folder
+        self.export_json = export_json
+
+    @property
+    def extension(self) -> str:
+        return "json" if self.export_json else "html"
+
+    def batch(self, channel_ids: list[int]) -> list[list[int]]:
+        # huge categories get split up so no one command gets too long
+        batches: list[list[int]] = []
+        current_batch: list[int] = []
+        current_length = 0
+
+        for channel_id in channel_ids:
+            id_length = len(str(channel_id)) + 1
+            if current_batch and (
+                len(current_batch) >= self.max_batch_size
+                or current_length + id_length > MAX_ARGUMENT_LENGTH
+            ):
+                batches.append(current_batch)
+                current_batch = []
+                current_length = 0
+
+            current_batch.append(channel_id)
+            current_length += id_length
+
+        if current_batch:
+            batches.append(current_batch)
+        return batches
+
+    def build_args(
+        self, channel_ids: list[int], output_folder: str, *, after: int | None = None
+    ) -> list[str]:
+        args = [
+            "export",
+            "-c",
+            *(str(channel_id) for channel_id in channel_ids),
+            "-o",
+            f"{output_folder}/%c.{self.extension}",
+            "--utc",
+            "--parallel",
+            str(self.parallel),
+            "--fuck-russia",
+        ]
+        if self.export_json:
+            args.extend(("--format", "Json"))
+        if self.media:
+            args.extend(("--media", "--reuse-media"))
+            if self.media_folder:
+                args.extend(("--media-dir", self.media_folder))
+        if after:
+            args.extend(("--after", str(after)))
+        return args
+
+    async def start(
+        self, channel_ids: list[int], output_folder: str, *, after: int | None = None
+    ) -> asyncio.subprocess.Process:
+        return await asyncio.create_subprocess_exec(
+            self.executable,
+            *self.build_args(channel_ids, output_folder, after=after),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            env=os.environ | {"DISCORD_TOKEN": self.token},
+        )
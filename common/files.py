@@ -0,0 +1,30 @@
+import contextlib
+import os
+import threading
+from collections.abc import Iterator
+
+import typing_extensions as typing
+
+__all__ = ("write_atomic",)
+
+
+@contextlib.contextmanager
+def write_atomic(path: str, mode: str = "w") -> Iterator[typing.IO[typing.Any]]:
+    """
+    Opens a temporary file next to `path` for writing, which replaces `path`
+    once the block finishes. If the block raises, the temporary file is removed
+    and `path` is left as it was, so nothing half-written is ever picked up.
+    """
+    # unique to the process and thread, as some files are written from several
+    # at once
+    tmp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+
+    try:
+        with open(tmp_path, mode, encoding=None if "b" in mode else "utf-8") as file:
+            yield file
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
+
+    os.replace(tmp_path, path)
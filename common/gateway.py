@@ -0,0 +1,84 @@
+import contextlib
+import sys
+
+import interactions as ipy
+import typing_extensions as typing
+from interactions.client.smart_cache import create_cache
+from interactions.client.utils.cache import NullCache
+
+from common.budget import format_size
+
+# not available on windows
+resource = None
+with contextlib.suppress(ImportError):
+    import resource
+
+__all__ = ("LEAN_INTENTS", "client_options", "memory_report")
+
+# all archiving needs is the channel tree, plus messages for prefixed commands
+LEAN_INTENTS = (
+    ipy.Intents.GUILDS | ipy.Intents.GUILD_MESSAGES | ipy.Intents.MESSAGE_CONTENT
+)
+
+
+def client_options(config: dict[str, typing.Any]) -> dict[str, typing.Any]:
+    """
+    Works out the intents and caches the bot should start with.
+
+    With `lean_mode` on, the bot only listens for what archiving needs, never
+    caches messages and only keeps a bounded number of members around, which
+    keeps it from slowly filling up with data from every server it's in.
+    Channels are always cached, as archiving looks them up constantly.
+    """
+    if not config.get("lean_mode", False):
+        return {"intents": ipy.Intents.DEFAULT | ipy.Intents.MESSAGE_CONTENT}
+
+    return {
+        "intents": LEAN_INTENTS,
+        "message_cache": NullCache(),
+        "member_cache": create_cache(
+            ttl=config.get("member_cache_ttl", 600),
+            hard_limit=config.get("member_cache_size", 1000),
+        ),
+    }
+
+
+def _rss_bytes() -> int | None:
+    # only linux makes the current rss easy to get at
+    with (
+        contextlib.suppress(OSError),
+        open("/proc/self/status", encoding="utf-8") as file,
+    ):
+        for line in file:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return None
+
+
+def memory_report(bot: ipy.Client) -> str:
+    """Sums up how much memory the bot is using, and what's in its caches."""
+    rss = _rss_bytes()
+    rss_line = f"RSS: {format_size(rss) if rss is not None else 'unknown'}"
+    if resource:
+        # ru_maxrss is in kilobytes on linux, bytes on macos
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform != "darwin":
+            peak_rss *= 1024
+        rss_line += f", peaked at {format_size(peak_rss)}"
+
+    lines = [
+        rss_line,
+        f"Intents: {'lean' if bot.intents == LEAN_INTENTS else 'default'}",
+        "",
+        "Cached:",
+    ]
+    caches = {
+        "Guilds": bot.cache.guild_cache,
+        "Channels": bot.cache.channel_cache,
+        "Members": bot.cache.member_cache,
+        "Users": bot.cache.user_cache,
+        "Roles": bot.cache.role_cache,
+        "Messages": bot.cache.message_cache,
+    }
+    lines.extend(f"- {name}: {len(cache):,}" for name, cache in caches.items())
+    return "\n".join(lines)
@@ -0,0 +1,151 @@
+import html
+import json
+import os
+
+from common.chatlog import Page, load_pages
+from common.files import write_atomic
+from common.models import Category, Channel, ExportTarget, snowflake_time
+from common.profiles import Profile
+
+__all__ = (
+    "build_indexes",
+    "category_index_path",
+    "load_tree",
+    "render_category_index",
+    "render_home_index",
+    "render_page_index",
+    "save_tree",
+    "tree_path",
+    "write_category_index",
+    "write_if_changed",
+)
+
+
+def tree_path(profile: Profile) -> str:
+    return f"{profile.archive_location}/.archive_tree.json"
+
+
+def save_tree(profile: Profile, categories: list[Category]) -> None:
+    with write_atomic(tree_path(profile)) as file:
+        json.dump([category.to_dict() for category in categories], file)
+
+
+def load_tree(profile: Profile) -> list[Category] | None:
+    path = tree_path(profile)
+    if not os.path.exists(path):
+        return None
+
+    with open(path, encoding="utf-8") as file:
+        return [Category.from_dict(data, profile) for data in json.load(file)]
+
+
+def describe_page(page: Page) -> str:
+    if page.first_message_id is None or page.last_message_id is None:
+        return f"Page {page.number}"
+
+    first_date = snowflake_time(page.first_message_id).strftime("%Y-%m-%d")
+    last_date = snowflake_time(page.last_message_id).strftime("%Y-%m-%d")
+    date_range = (
+        first_date if first_date == last_date else f"{first_date} to {last_date}"
+    )
+    return f"Page {page.number} ({date_range})"
+
+
+def _page_lines(target: ExportTarget, indent: str) -> list[str]:
+    # paginated exports get a link to every page, not just to the page index
+    pages = load_pages(target.pages_path)
+    if len(pages) < 2:
+        return []
+    return [
+        f"{indent}* [{describe_page(page)}]({target.page_url_path(page.number)})"
+        for page in pages
+    ]
+
+
+def render_page_index(target: ExportTarget, pages: list[Page]) -> str:
+    folder_name = os.path.basename(target.pages_path)
+    title = html.escape(
+        target.proper_name if isinstance(target, Channel) else target.name
+    )
+
+    lines = [
+        "<!DOCTYPE html>",
+        '<html lang="en">',
+        "<head>",
+        '<meta charset="utf-8">',
+        f"<title>{title}</title>",
+        "</head>",
+        "<body>",
+        f"<h1>{title}</h1>",
+        "<ul>",
+    ]
+    lines.extend(
+        f'<li><a href="{folder_name}/{page.number}.html">'
+        f"{html.escape(describe_page(page))}</a> - {page.messages:,} message(s)</li>"
+        for page in pages
+    )
+    lines.extend(("</ul>", "</body>", "</html>", ""))
+    return "\n".join(lines)
+
+
+def render_category_index(category: Category) -> str:
+    lines = [f"# {category.name}", "", "All Locations:"]
+
+    # TODO: add some control over this
+    # lines[0] = f"# Season {category.profile.get('season_num')} - {category.name}"
+    for channel in category.channels:
+        lines.append(f"* [{channel.proper_name}]({channel.url_path})")
+        lines.extend(_page_lines(channel, "  "))
+
+        for thread in channel.threads:
+            lines.append(f"  * [{thread.name}]({thread.url_path})")
+            lines.extend(_page_lines(thread, "    "))
+
+    lines.extend(("", f"[Back to Home]({category.base_url})"))
+    return "\n".join(lines)
+
+
+def render_home_index(categories: list[Category], *, search: bool = False) -> str:
+    lines = ["# Home Page", "", "All Categories:"]
+    lines.extend(f"* [{category.name}]({category.url_path})" for category in categories)
+    if search and categories:
+        lines.extend(("", f"[Search]({categories[0].base_url}/search.html)"))
+    return "\n".join(lines) + "\n"
+
+
+def write_if_changed(path: str, content: str) -> bool:
+    # leaving unchanged files alone keeps their mtimes, and so keeps git and
+    # github pages from doing any extra work
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as file:
+            if file.read() == content:
+                return False
+
+    with write_atomic(path) as file:
+        file.write(content)
+    return True
+
+
+def category_index_path(category: Category) -> str:
+    return f"{category.path}/{category.internal_name}.md"
+
+
+def write_category_index(category: Category) -> bool:
+    category.mkdir()
+    return write_if_changed(
+        category_index_path(category), render_category_index(category)
+    )
+
+
+def build_indexes(profile: Profile, categories: list[Category]) -> int:
+    """
+    Writes every category index and the home page in one pass, returning how
+    many files actually changed.
+    """
+    written = sum(write_category_index(category) for category in categories)
+    os.makedirs(profile.archive_location, exist_ok=True)
+    written += write_if_changed(
+        f"{profile.archive_location}/README.md",
+        render_home_index(categories, search=profile.get("search_index", False)),
+    )
+    return written
@@ -0,0 +1,78 @@
+import datetime
+import json
+import os
+import threading
+
+import attrs
+import typing_extensions as typing
+
+from common.files import write_atomic
+
+__all__ = ("ArchiveJob",)
+
+
+@attrs.define()
+class ArchiveJob:
+    """
+    A persisted archive run, checkpointed as exports finish so an interrupted
+    run can pick up where it left off.
+    """
+
+    path: str = attrs.field()
+    guild_id: int = attrs.field()
+    tree: list[dict[str, typing.Any]] = attrs.field()
+    started_at: str = attrs.field(
+        factory=lambda: datetime.datetime.now(datetime.timezone.utc).isoformat()
+    )
+    completed: set[int] = attrs.field(factory=set)
+    finished: bool = attrs.field(default=False)
+    # completed channels are marked on the event loop while saves happen in
+    # worker threads
+    lock: threading.Lock = attrs.field(factory=threading.Lock, init=False)
+    save_lock: threading.Lock = attrs.field(factory=threading.Lock, init=False)
+
+    @classmethod
+    def load(cls, path: str) -> "typing.Self | None":
+        if not os.path.exists(path):
+            return None
+
+        with open(path, encoding="utf-8") as file:
+            data = json.load(file)
+
+        return cls(
+            path,
+            data["guild_id"],
+            data["tree"],
+            data["started_at"],
+            set(data["completed"]),
+            data["finished"],
+        )
+
+    def is_completed(self, channel_id: int) -> bool:
+        return channel_id in self.completed
+
+    def mark_completed(self, *channel_ids: int) -> None:
+        # saved along with the manifest, rather than after every export
+        with self.lock:
+            self.completed.update(channel_ids)
+
+    def mark_finished(self) -> None:
+        self.finished = True
+        self.save()
+
+    def save(self) -> None:
+        with self.save_lock:
+            with self.lock:
+                completed = sorted(self.completed)
+
+            with write_atomic(self.path) as file:
+                json.dump(
+                    {
+                        "guild_id": self.guild_id,
+                        "tree": self.tree,
+                        "started_at": self.started_at,
+                        "completed": completed,
+                        "finished": self.finished,
+                    },
+                    file,
+                )
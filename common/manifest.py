@@ -0,0 +1,93 @@
+import datetime
+import hashlib
+import json
+import os
+import threading
+
+import attrs
+
+from common.chatlog import count_messages
+from common.files import write_atomic
+
+__all__ = ("ExportManifest", "ManifestEntry", "hash_file")
+
+
+def hash_file(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+@attrs.define()
+class ManifestEntry:
+    last_message_id: int | None = attrs.field()
+    exported_at: str = attrs.field()
+    output_path: str = attrs.field()
+    hash: str = attrs.field()
+    messages: int | None = attrs.field(default=None)
+
+
+class ExportManifest:
+    """
+    Keeps track of what has already been exported for each channel and thread,
+    so that later runs only have to export what is new.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        # entries are recorded from worker threads while the manifest is saved
+        # from others
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.entries: dict[int, ManifestEntry] = {}
+
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                data = json.load(file)
+
+            self.entries = {
+                int(channel_id): ManifestEntry(**entry)
+                for channel_id, entry in data.items()
+            }
+
+    def get(self, channel_id: int) -> ManifestEntry | None:
+        with self.lock:
+            return self.entries.get(channel_id)
+
+    def record(
+        self,
+        channel_id: int,
+        last_message_id: int | None,
+        output_path: str,
+        *,
+        messages: int | None = None,
+    ) -> ManifestEntry:
+        # paginated exports pass their message count in, since the output path
+        # is only the page index
+        entry = ManifestEntry(
+            last_message_id,
+            datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            output_path,
+            hash_file(output_path),
+            count_messages(output_path) if messages is None else messages,
+        )
+        with self.lock:
+            self.entries[channel_id] = entry
+        return entry
+
+    def save(self) -> None:
+        # saves are done one at a time, so an older snapshot can never replace
+        # a newer one
+        with self.save_lock:
+            with self.lock:
+                data = {
+                    str(channel_id): attrs.asdict(entry)
+                    for channel_id, entry in self.entries.items()
+                }
+
+            # write to a temporary file first so a crash mid-write can't corrupt
+            # the existing manifest
+            with write_atomic(self.path) as file:
+                json.dump(data, file)
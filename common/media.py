@@ -0,0 +1,128 @@
+import json
+import os
+import re
+import shutil
+import threading
+import urllib.parse
+
+import common.metrics as metrics
+from common.files import write_atomic
+from common.manifest import hash_file
+
+__all__ = ("MediaStore",)
+
+# matches any attribute or css url() pointing into the media cache, whether the
+# cli wrote it as a relative or an absolute path
+MEDIA_REFERENCE_REGEX = re.compile(
+    r"""(["'(])[^"'()<>]*?\.media_cache/([^"'()<>?#]+)"""
+)
+
+
+class MediaStore:
+    """
+    A content-addressed store for exported media, shared by every export.
+
+    DiscordChatExporter downloads media into a shared cache named after each
+    file's url. Once a page is exported, every file it references is stored
+    under a hash of its contents - so the same avatar fetched through several
+    urls is only kept once - and the page is rewritten to point at the stored
+    file with a relative path.
+    """
+
+    def __init__(self, archive_location: str) -> None:
+        self.cache_path = f"{archive_location}/.media_cache"
+        self.store_path = f"{archive_location}/media"
+        self.manifest_path = f"{self.store_path}/manifest.json"
+        self.lock = threading.Lock()
+        self.files: dict[str, str] = {}
+        self.stored = 0
+        self.stored_bytes = 0
+
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, encoding="utf-8") as file:
+                self.files = json.load(file)
+
+    def store(self, cache_name: str) -> tuple[str | None, int]:
+        """
+        Stores a file from the media cache, returning its name in the store and
+        how many bytes storing it took up (0 if it was already stored).
+        """
+        with self.lock:
+            if stored_name := self.files.get(cache_name):
+                return stored_name, 0
+
+        cache_file = os.path.join(self.cache_path, cache_name)
+        if not os.path.isfile(cache_file):
+            return None, 0
+        new_bytes = 0
+
+        digest = hash_file(cache_file)
+        stored_name = f"{digest[:2]}/{digest}{os.path.splitext(cache_name)[1]}"
+        stored_path = os.path.join(self.store_path, stored_name)
+
+        with self.lock:
+            if not os.path.exists(stored_path):
+                os.makedirs(os.path.dirname(stored_path), exist_ok=True)
+                try:
+                    os.link(cache_file, stored_path)
+                except OSError:
+                    # hard links don't work across filesystems
+                    shutil.copyfile(cache_file, stored_path)
+                new_bytes = os.path.getsize(stored_path)
+                self.stored += 1
+                self.stored_bytes += new_bytes
+                metrics.MEDIA_FILES.inc()
+            elif not os.path.samefile(cache_file, stored_path):
+                # a duplicate download - link it to the stored copy so it only
+                # takes up space once, while the cli can still reuse it
+                tmp_path = f"{cache_file}.tmp"
+                try:
+                    os.link(stored_path, tmp_path)
+                    os.replace(tmp_path, cache_file)
+                except OSError:
+                    pass
+
+            self.files[cache_name] = stored_name
+
+        return stored_name, new_bytes
+
+    def process(self, html_path: str) -> int:
+        """
+        Stores every file the page at `html_path` references and points the page
+        at them, returning how many bytes of new files were stored.
+        """
+        with open(html_path, encoding="utf-8") as file:
+            content = file.read()
+
+        html_folder = os.path.dirname(html_path)
+        new_bytes = 0
+
+        def replace(match: re.Match[str]) -> str:
+            nonlocal new_bytes
+            stored_name, stored_bytes = self.store(urllib.parse.unquote(match.group(2)))
+            new_bytes += stored_bytes
+            if not stored_name:
+                return match.group(0)
+
+            relative_path = os.path.relpath(
+                os.path.join(self.store_path, stored_name), html_folder
+            )
+            return match.group(1) + urllib.parse.quote(
+                relative_path.replace(os.sep, "/")
+            )
+
+        new_content = MEDIA_REFERENCE_REGEX.sub(replace, content)
+        if new_content != content:
+            with write_atomic(html_path) as file:
+                file.write(new_content)
+
+        # the store's manifest is saved along with the export manifest, rather
+        # than after every page
+        return new_bytes
+
+    def save(self) -> None:
+        os.makedirs(self.store_path, exist_ok=True)
+
+        with self.lock:
+            with write_atomic(self.manifest_path) as file:
+                json.dump(self.files, file)
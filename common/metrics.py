@@ -0,0 +1,292 @@
+import bisect
+import contextlib
+import threading
+import time
+from collections.abc import Iterator
+
+__all__ = (
+    "CLI_EXPORTS",
+    "CLI_EXPORT_SECONDS",
+    "DISCOVERY_CALLS",
+    "DISCOVERY_SECONDS",
+    "ERRORS",
+    "EXPORTED_BYTES",
+    "EXPORTED_MESSAGES",
+    "MEDIA_FILES",
+    "NATIVE_EXPORTS",
+    "POSTPROCESS_SAVED_BYTES",
+    "REGISTRY",
+    "REST_REQUESTS",
+    "REST_SECONDS",
+    "STAGE_SECONDS",
+    "WRITTEN_BYTES",
+    "Counter",
+    "Histogram",
+    "MetricsRegistry",
+    "summarize",
+)
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+
+LabelKey = tuple[tuple[str, str], ...]
+
+
+def _label_key(labels: dict[str, str]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _matches(key: LabelKey, labels: dict[str, str]) -> bool:
+    return set(_label_key(labels)) <= set(key)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: LabelKey, extra: LabelKey = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+
+    formatted = ",".join(f'{name}="{_escape(value)}"' for name, value in pairs)
+    return f"{{{formatted}}}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.lock = threading.Lock()
+        self.values: dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels: str) -> float:
+        # sums every label set that includes the given labels
+        with self.lock:
+            return sum(
+                value for key, value in self.values.items() if _matches(key, labels)
+            )
+
+    def by_label(self, name: str) -> dict[str, float]:
+        # totals for every value the label has been given
+        totals: dict[str, float] = {}
+        with self.lock:
+            for key, value in self.values.items():
+                if label_value := dict(key).get(name):
+                    totals[label_value] = totals.get(label_value, 0) + value
+        return totals
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} counter",
+        ]
+        with self.lock:
+            lines.extend(
+                f"{self.name}{_format_labels(key)} {_format_value(value)}"
+                for key, value in self.values.items()
+            )
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        # per label set: a count for each bucket, then the sum and total count
+        self.values: dict[LabelKey, tuple[list[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _label_key(labels)
+        with self.lock:
+            bucket_counts, total, count = self.values.get(
+                key, ([0] * len(self.buckets), 0.0, 0)
+            )
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                bucket_counts[index] += 1
+            self.values[key] = (bucket_counts, total + value, count + 1)
+
+    @contextlib.contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_at, **labels)
+
+    def get(self, **labels: str) -> tuple[int, float]:
+        # the number of observations and their sum, across every label set that
+        # includes the given labels
+        with self.lock:
+            matching = [
+                (count, total)
+                for key, (_, total, count) in self.values.items()
+                if _matches(key, labels)
+            ]
+        return sum(count for count, _ in matching), sum(t for _, t in matching)
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self.lock:
+            for key, (bucket_counts, total, count) in self.values.items():
+                cumulative = 0
+                for bucket, bucket_count in zip(
+                    self.buckets, bucket_counts, strict=True
+                ):
+                    cumulative += bucket_count
+                    lines.append(
+                        f"{self.name}_bucket"
+                        f"{_format_labels(key, (('le', _format_value(bucket)),))}"
+                        f" {cumulative}"
+                    )
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(key, (('le', '+Inf'),))}"
+                    f" {count}"
+                )
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total!r}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Holds every metric the bot records, and renders them in the Prometheus text
+    format.
+    """
+
+    def __init__(self) -> None:
+        self.metrics: dict[str, Counter | Histogram] = {}
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        counter = Counter(name, documentation)
+        self.metrics[name] = counter
+        return counter
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        histogram = Histogram(name, documentation, buckets)
+        self.metrics[name] = histogram
+        return histogram
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+DISCOVERY_CALLS = REGISTRY.counter(
+    "kgarchive_discovery_calls_total", "Thread lists fetched during discovery."
+)
+DISCOVERY_SECONDS = REGISTRY.histogram(
+    "kgarchive_discovery_seconds", "Time taken to fetch a channel's threads."
+)
+CLI_EXPORTS = REGISTRY.counter(
+    "kgarchive_cli_exports_total", "DiscordChatExporter invocations, by result."
+)
+NATIVE_EXPORTS = REGISTRY.counter(
+    "kgarchive_native_exports_total", "Small threads exported through the bot itself."
+)
+CLI_EXPORT_SECONDS = REGISTRY.histogram(
+    "kgarchive_cli_export_seconds", "Time taken by each DiscordChatExporter run."
+)
+EXPORTED_MESSAGES = REGISTRY.counter(
+    "kgarchive_exported_messages_total", "Messages written to exports."
+)
+EXPORTED_BYTES = REGISTRY.counter(
+    "kgarchive_exported_bytes_total", "Bytes of HTML written by exports."
+)
+MEDIA_FILES = REGISTRY.counter(
+    "kgarchive_media_files_total", "New media files added to the media store."
+)
+POSTPROCESS_SAVED_BYTES = REGISTRY.counter(
+    "kgarchive_postprocess_saved_bytes_total",
+    "Bytes saved by minifying exports and extracting their stylesheets.",
+)
+STAGE_SECONDS = REGISTRY.histogram(
+    "kgarchive_stage_seconds", "Time taken by each stage of an archive run."
+)
+REST_REQUESTS = REGISTRY.counter(
+    "kgarchive_rest_requests_total", "Discord API requests made, by result."
+)
+REST_SECONDS = REGISTRY.histogram(
+    "kgarchive_rest_seconds",
+    "Discord API request latency.",
+    (0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+WRITTEN_BYTES = REGISTRY.counter(
+    "kgarchive_written_bytes_total",
+    "Bytes of pages and media written to the archive, by category.",
+)
+ERRORS = REGISTRY.counter(
+    "kgarchive_errors_total", "Errors handled by the error handler, by type."
+)
+
+
+def _average(histogram: Histogram) -> float:
+    count, total = histogram.get()
+    return total / count if count else 0
+
+
+def summarize() -> str:
+    """Sums up everything recorded since the bot started, for Discord."""
+    lines = [
+        f"Discovery: {DISCOVERY_CALLS.get():,.0f} thread fetch(es),"
+        f" {_average(DISCOVERY_SECONDS):.2f}s on average",
+        f"CLI exports: {CLI_EXPORTS.get(result='success'):,.0f} succeeded,"
+        f" {CLI_EXPORTS.get(result='failure'):,.0f} failed,"
+        f" {_average(CLI_EXPORT_SECONDS):.1f}s on average",
+        f"Native exports: {NATIVE_EXPORTS.get():,.0f}",
+        f"Exported: {EXPORTED_MESSAGES.get():,.0f} message(s),"
+        f" {EXPORTED_BYTES.get() / 1024 / 1024:,.1f} MiB of HTML,"
+        f" {POSTPROCESS_SAVED_BYTES.get() / 1024 / 1024:,.1f} MiB saved by"
+        " post-processing",
+        f"Media: {MEDIA_FILES.get():,.0f} new file(s) stored",
+        f"Discord API: {REST_REQUESTS.get():,.0f} request(s),"
+        f" {REST_REQUESTS.get(result='error'):,.0f} failed,"
+        f" {_average(REST_SECONDS) * 1000:.0f}ms on average",
+        f"Errors handled: {ERRORS.get():,.0f}",
+    ]
+
+    if written := WRITTEN_BYTES.by_label("category"):
+        lines.append("\nWritten per category:")
+        lines.extend(
+            f"- {category}: {size / 1024 / 1024:,.1f} MiB"
+            for category, size in written.items()
+        )
+
+    stage_lines = []
+    for stage in ("discovery", "exports", "indexes", "search", "publish"):
+        runs, total = STAGE_SECONDS.get(stage=stage)
+        if runs:
+            stage_lines.append(f"- {stage}: {total:,.1f}s over {runs} run(s)")
+    if stage_lines:
+        lines.append("\nTime spent per stage:")
+        lines.extend(stage_lines)
+
+    return "\n".join(lines)
@@ -0,0 +1,220 @@
+import datetime
+import os
+import urllib.parse
+
+import attrs
+import typing_extensions as typing
+
+if typing.TYPE_CHECKING:
+    import interactions as ipy
+
+    from common.profiles import Profile
+
+__all__ = (
+    "BaseChannel",
+    "Category",
+    "Channel",
+    "ExportTarget",
+    "Thread",
+    "snowflake_time",
+    "to_optional_int",
+)
+
+
+@attrs.define()
+class BaseChannel:
+    id: int = attrs.field()
+    name: str = attrs.field()
+    last_message_id: int | None = attrs.field(default=None, kw_only=True)
+    message_count: int | None = attrs.field(default=None, kw_only=True)
+
+    @property
+    def profile(self) -> "Profile":
+        raise NotImplementedError
+
+    @property
+    def path(self) -> str:
+        return self.profile.archive_location
+
+    @property
+    def base_url(self) -> str:
+        return os.environ["WEBSITE_BASE"] + self.profile.github_name
+
+    @property
+    def pages_path(self) -> str:
+        # only used by channels and threads, when exports are paginated
+        return f"{self.path.removesuffix('.html')}-pages"
+
+    @property
+    def json_path(self) -> str:
+        # only used by channels and threads, when exporting to json
+        return f"{self.path.removesuffix('.html')}.json"
+
+    def page_url_path(self, number: int) -> str:
+        return f"{self.url_path.removesuffix('.html')}-pages/{number}.html"
+
+
+@attrs.define()
+class Category(BaseChannel):
+    internal_name: str = attrs.field()
+    channels: list["Channel"] = attrs.field(factory=list)
+    profile: "Profile" = attrs.field(kw_only=True, repr=False)
+
+    @property
+    def path(self) -> str:
+        return f"{super().path}/{self.internal_name}"
+
+    @property
+    def url_quote(self) -> str:
+        return urllib.parse.quote(f"{self.internal_name}/{self.internal_name}")
+
+    @property
+    def url_path(self) -> str:
+        return f"{self.base_url}/{self.url_quote}"
+
+    def mkdir(self) -> None:
+        os.makedirs(self.path, exist_ok=True)
+
+    def to_dict(self) -> dict[str, typing.Any]:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "last_message_id": self.last_message_id,
+            "message_count": self.message_count,
+            "internal_name": self.internal_name,
+            "channels": [channel.to_dict() for channel in self.channels],
+        }
+
+    @classmethod
+    def from_dict(
+        cls, data: dict[str, typing.Any], profile: "Profile"
+    ) -> "typing.Self":
+        category = cls(
+            data["id"],
+            data["name"],
+            data["internal_name"],
+            last_message_id=data["last_message_id"],
+            message_count=data.get("message_count"),
+            profile=profile,
+        )
+        category.channels = [
+            Channel.from_dict(channel_data, category)
+            for channel_data in data["channels"]
+        ]
+        return category
+
+
+@attrs.define()
+class Channel(BaseChannel):
+    category: Category = attrs.field()
+    threads: list["Thread"] = attrs.field(factory=list)
+
+    @property
+    def profile(self) -> "Profile":
+        return self.category.profile
+
+    @property
+    def path(self) -> str:
+        return f"{super().path}/{self.category.internal_name}/{self.id}.html"
+
+    @property
+    def url_quote(self) -> str:
+        return urllib.parse.quote(f"{self.category.internal_name}/{self.id}.html")
+
+    @property
+    def url_path(self) -> str:
+        return f"{self.base_url}/{self.url_quote}"
+
+    @property
+    def folder_path(self) -> str:
+        return self.path.replace(".html", "")
+
+    @property
+    def proper_name(self) -> str:
+        return self.name.replace("-", " ").title()
+
+    def mkdir(self) -> None:
+        os.makedirs(self.folder_path, exist_ok=True)
+
+    def to_dict(self) -> dict[str, typing.Any]:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "last_message_id": self.last_message_id,
+            "message_count": self.message_count,
+            "threads": [thread.to_dict() for thread in self.threads],
+        }
+
+    @classmethod
+    def from_dict(
+        cls, data: dict[str, typing.Any], category: Category
+    ) -> "typing.Self":
+        channel = cls(
+            data["id"],
+            data["name"],
+            category,
+            last_message_id=data["last_message_id"],
+            message_count=data.get("message_count"),
+        )
+        channel.threads = [
+            Thread.from_dict(thread_data, channel) for thread_data in data["threads"]
+        ]
+        return channel
+
+
+@attrs.define()
+class Thread(BaseChannel):
+    channel: Channel = attrs.field()
+
+    @property
+    def profile(self) -> "Profile":
+        return self.channel.profile
+
+    @property
+    def category(self) -> Category:
+        return self.channel.category
+
+    @property
+    def path(self) -> str:
+        return f"{super().path}/{self.channel.category.internal_name}/{self.channel.id}/{self.id}.html"
+
+    @property
+    def url_quote(self) -> str:
+        return urllib.parse.quote(
+            f"{self.channel.category.internal_name}/{self.channel.id}/{self.id}.html"
+        )
+
+    @property
+    def url_path(self) -> str:
+        return f"{self.base_url}/{self.url_quote}"
+
+    def to_dict(self) -> dict[str, typing.Any]:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "last_message_id": self.last_message_id,
+            "message_count": self.message_count,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, typing.Any], channel: Channel) -> "typing.Self":
+        return cls(
+            data["id"],
+            data["name"],
+            channel,
+            last_message_id=data["last_message_id"],
+            message_count=data.get("message_count"),
+        )
+
+
+ExportTarget = Channel | Thread
+
+
+def to_optional_int(snowflake: "ipy.Snowflake_Type | None") -> int | None:
+    return int(snowflake) if snowflake else None
+
+
+def snowflake_time(snowflake: int) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(
+        ((snowflake >> 22) + 1420070400000) / 1000, tz=datetime.timezone.utc
+    )
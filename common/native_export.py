@@ -0,0 +1,318 @@
+"""
+Exports small channels straight through the bot's own connection to Discord,
+rather than starting up DiscordChatExporter.Cli for them.
+
+Messages are converted into the shape DiscordChatExporter's JSON export gives
+them, then written out as JSON or rendered into HTML by `common.render`, just
+like the CLI's own JSON exports are.
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+import urllib.parse
+
+import aiohttp
+import typing_extensions as typing
+
+from common.files import write_atomic
+from common.render import ChatlogRenderer, JsonExportWriter
+
+if typing.TYPE_CHECKING:
+    from interactions.api.http.http_client import HTTPClient
+
+    from common.models import ExportTarget
+
+__all__ = ("NativeExporter",)
+
+PAGE_SIZE = 100
+MENTION_REGEX = re.compile(r"<@!?(\d+)>")
+CUSTOM_EMOJI_REGEX = re.compile(r"<(a?):(\w+):(\d+)>")
+UNSAFE_FILENAME_REGEX = re.compile(r"[^\w.-]")
+
+# what the cli calls each message type, and what it says for system messages
+MESSAGE_TYPES = {
+    0: ("Default", None),
+    1: ("RecipientAdd", "Added a recipient."),
+    2: ("RecipientRemove", "Removed a recipient."),
+    3: ("Call", "Started a call."),
+    4: ("ChannelNameChange", "Changed the channel name."),
+    5: ("ChannelIconChange", "Changed the channel icon."),
+    6: ("ChannelPinnedMessage", "Pinned a message."),
+    7: ("GuildMemberJoin", "Joined the server."),
+    18: ("ThreadCreated", "Started a thread."),
+    19: ("Reply", None),
+}
+STICKER_FORMATS = {1: "Png", 2: "Apng", 3: "Lottie", 4: "Gif"}
+
+
+def _author_name(message: dict[str, typing.Any]) -> str:
+    author = message["author"]
+    return (
+        (message.get("member") or {}).get("nick")
+        or author.get("global_name")
+        or author["username"]
+    )
+
+
+def _avatar_url(user: dict[str, typing.Any]) -> str:
+    if avatar := user.get("avatar"):
+        return f"https://cdn.discordapp.com/avatars/{user['id']}/{avatar}.png"
+    return f"https://cdn.discordapp.com/embed/avatars/{(int(user['id']) >> 22) % 6}.png"
+
+
+def _convert_emoji(emoji: dict[str, typing.Any]) -> dict[str, typing.Any]:
+    if not emoji.get("id"):
+        # a unicode emoji, which is shown as-is
+        return {"id": None, "name": emoji.get("name"), "isAnimated": False}
+
+    extension = "gif" if emoji.get("animated") else "png"
+    return {
+        "id": emoji["id"],
+        "name": emoji.get("name"),
+        "isAnimated": bool(emoji.get("animated")),
+        "imageUrl": f"https://cdn.discordapp.com/emojis/{emoji['id']}.{extension}",
+    }
+
+
+def _convert_embed(embed: dict[str, typing.Any]) -> dict[str, typing.Any]:
+    return {
+        "title": embed.get("title"),
+        "url": embed.get("url"),
+        "description": embed.get("description"),
+        "color": f"#{embed['color']:06x}" if embed.get("color") is not None else None,
+        "author": {"name": embed["author"].get("name")}
+        if embed.get("author")
+        else None,
+        "fields": [
+            {
+                "name": field.get("name"),
+                "value": field.get("value"),
+                "isInline": bool(field.get("inline")),
+            }
+            for field in embed.get("fields", [])
+        ],
+        "image": {"url": embed["image"].get("url")} if embed.get("image") else None,
+        "thumbnail": {"url": embed["thumbnail"].get("url")}
+        if embed.get("thumbnail")
+        else None,
+        "footer": {"text": embed["footer"].get("text")}
+        if embed.get("footer")
+        else None,
+    }
+
+
+def _convert_sticker(sticker: dict[str, typing.Any]) -> dict[str, typing.Any]:
+    sticker_format = STICKER_FORMATS.get(sticker.get("format_type", 1), "Png")
+    extension = "gif" if sticker_format == "Gif" else "png"
+    return {
+        "id": sticker["id"],
+        "name": sticker.get("name"),
+        "format": sticker_format,
+        "sourceUrl": f"https://media.discordapp.net/stickers/{sticker['id']}.{extension}",
+    }
+
+
+class NativeExporter:
+    """
+    Exports channels page by page through the bot's http client, writing each
+    page of messages out as soon as it's fetched.
+
+    Only worth it for small channels - the CLI is much better at big ones, but
+    takes a few seconds just to start up.
+    """
+
+    def __init__(
+        self,
+        http: "HTTPClient",
+        *,
+        media_folder: str | None = None,
+    ) -> None:
+        self.http = http
+        self.media_folder = media_folder
+        self.session: aiohttp.ClientSession | None = None
+
+    async def close(self) -> None:
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+    async def download(self, url: str) -> str:
+        """
+        Downloads `url` into the media cache, returning the path to it there, or
+        the url itself if the download fails.
+        """
+        if not self.media_folder:
+            return url
+
+        filename = UNSAFE_FILENAME_REGEX.sub(
+            "_", urllib.parse.urlsplit(url).path.rsplit("/", 1)[-1]
+        )
+        cache_path = os.path.join(
+            self.media_folder,
+            f"{hashlib.sha256(url.encode()).hexdigest()[:16]}-{filename}",
+        )
+        if await asyncio.to_thread(os.path.exists, cache_path):
+            return cache_path
+
+        if not self.session:
+            self.session = aiohttp.ClientSession()
+
+        try:
+            async with self.session.get(
+                url, timeout=aiohttp.ClientTimeout(total=60)
+            ) as response:
+                response.raise_for_status()
+                content = await response.read()
+        except (aiohttp.ClientError, TimeoutError):
+            return url
+
+        def write() -> None:
+            os.makedirs(self.media_folder, exist_ok=True)  # type: ignore
+            with write_atomic(cache_path, "wb") as file:
+                file.write(content)
+
+        await asyncio.to_thread(write)
+        return cache_path
+
+    async def convert_message(
+        self, message: dict[str, typing.Any]
+    ) -> dict[str, typing.Any]:
+        """
+        Converts a message from Discord's API into the shape DiscordChatExporter's
+        JSON export gives it, downloading its media along the way.
+        """
+        author = message["author"]
+        message_type, system_content = MESSAGE_TYPES.get(
+            message.get("type", 0), ("Default", None)
+        )
+
+        # mentions are shown by name, as ids mean nothing to readers
+        names = {user["id"]: user for user in message.get("mentions", [])}
+
+        def mention(match: re.Match[str]) -> str:
+            if user := names.get(match.group(1)):
+                return f"@{user.get('global_name') or user['username']}"
+            return match.group(0)
+
+        # the cli writes custom emojis out as :name:, and lists them separately
+        inline_emojis: list[dict[str, typing.Any]] = []
+
+        def custom_emoji(match: re.Match[str]) -> str:
+            inline_emojis.append(
+                _convert_emoji(
+                    {
+                        "id": match.group(3),
+                        "name": match.group(2),
+                        "animated": bool(match.group(1)),
+                    }
+                )
+            )
+            return f":{match.group(2)}:"
+
+        content = system_content or message.get("content") or ""
+        content = CUSTOM_EMOJI_REGEX.sub(
+            custom_emoji, MENTION_REGEX.sub(mention, content)
+        )
+        reference = message.get("message_reference") or {}
+
+        return {
+            "id": message["id"],
+            "type": message_type,
+            "timestamp": message["timestamp"],
+            "timestampEdited": message.get("edited_timestamp"),
+            "content": content,
+            "author": {
+                "id": author["id"],
+                "name": author["username"],
+                "nickname": _author_name(message),
+                "isBot": bool(author.get("bot")),
+                # avatars are linked rather than downloaded, so a small thread
+                # isn't held up by a download for every author in it
+                "avatarUrl": _avatar_url(author),
+            },
+            "attachments": [
+                {
+                    "id": attachment.get("id"),
+                    "url": await self.download(attachment["url"]),
+                    "fileName": attachment["filename"],
+                    "fileSizeBytes": attachment.get("size"),
+                }
+                for attachment in message.get("attachments", [])
+            ],
+            "embeds": [_convert_embed(embed) for embed in message.get("embeds", [])],
+            "stickers": [
+                _convert_sticker(sticker)
+                for sticker in message.get("sticker_items", [])
+            ],
+            "reactions": [
+                {"emoji": _convert_emoji(reaction["emoji"]), "count": reaction["count"]}
+                for reaction in message.get("reactions", [])
+            ],
+            "inlineEmojis": inline_emojis,
+            "reference": {
+                "messageId": reference.get("message_id"),
+                "channelId": reference.get("channel_id"),
+                "guildId": reference.get("guild_id"),
+            }
+            if reference
+            else None,
+        }
+
+    async def export(
+        self,
+        target: "ExportTarget",
+        output_path: str,
+        *,
+        after: int | None = None,
+    ) -> int:
+        """
+        Exports every message in `target` (after `after`, if given) to
+        `output_path`, returning how many messages were exported. The export is
+        JSON if `output_path` ends in .json, and HTML otherwise.
+        """
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        json_writer: JsonExportWriter | None = None
+        renderer = ChatlogRenderer()
+        message_count = 0
+
+        # every write goes through a thread, as pages can be big
+        with write_atomic(output_path) as file:
+            if output_path.endswith(".json"):
+                json_writer = await asyncio.to_thread(
+                    JsonExportWriter,
+                    file,
+                    {"channel": {"id": str(target.id), "name": target.name}},
+                )
+            else:
+                await asyncio.to_thread(file.write, renderer.preamble(target.name))
+            cursor = after or 0
+
+            while True:
+                page = await self.http.get_channel_messages(
+                    target.id, PAGE_SIZE, after=cursor
+                )
+                if not page:
+                    break
+
+                # discord hands pages back newest first
+                page.sort(key=lambda message: int(message["id"]))
+                cursor = int(page[-1]["id"])
+                messages = [await self.convert_message(message) for message in page]
+                message_count += len(messages)
+
+                if json_writer:
+                    await asyncio.to_thread(json_writer.write, messages)
+                else:
+                    await asyncio.to_thread(file.write, renderer.render(messages))
+
+                if len(page) < PAGE_SIZE:
+                    break
+
+            if json_writer:
+                await asyncio.to_thread(json_writer.close)
+            else:
+                await asyncio.to_thread(file.write, renderer.postamble())
+
+        return message_count
@@ -0,0 +1,170 @@
+import asyncio
+import collections
+import hashlib
+import logging
+import traceback
+
+import attrs
+import interactions as ipy
+
+from common.config import CONFIG
+
+__all__ = ("NOTIFICATIONS", "NotificationQueue", "error_signature")
+
+logger = logging.getLogger("kgarchivebot")
+
+# discord's limits for a single message
+MAX_EMBEDS = 10
+MAX_MESSAGE_LENGTH = 6000
+MAX_DESCRIPTION_LENGTH = 4096
+# past this, new errors are only counted, so a runaway loop can't eat up memory
+MAX_PENDING = 50
+
+
+def error_signature(error: BaseException) -> str:
+    """
+    Identifies where an error came from, ignoring its message - so the same
+    failure with a different channel id in it is still the same failure.
+    """
+    frames = traceback.extract_tb(error.__traceback__)
+    key = "\n".join(
+        [type(error).__name__]
+        + [f"{frame.filename}:{frame.lineno}:{frame.name}" for frame in frames]
+    )
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+@attrs.define()
+class PendingNotification:
+    title: str | None = attrs.field()
+    description: str = attrs.field()
+    color: ipy.Color = attrs.field()
+    count: int = attrs.field(default=1)
+
+    def to_embed(self) -> ipy.Embed:
+        description = self.description
+        if len(description) > MAX_DESCRIPTION_LENGTH - 50:
+            description = f"{description[: MAX_DESCRIPTION_LENGTH - 53]}..."
+        if self.count > 1:
+            description += f"\n*Happened {self.count:,} times.*"
+
+        return ipy.Embed(
+            title=self.title,
+            description=description,
+            color=self.color,
+            timestamp=ipy.Timestamp.utcnow(),
+        )
+
+
+class NotificationQueue:
+    """
+    Collects messages for the bot owner and sends them in the background, every
+    `interval` seconds, so whatever sent them never waits on Discord.
+
+    Repeats of the same error are counted rather than sent again, and
+    everything pending is packed into as few messages as Discord allows.
+    """
+
+    def __init__(self, interval: float = 10) -> None:
+        self.interval = interval
+        self.pending: collections.OrderedDict[str, PendingNotification] = (
+            collections.OrderedDict()
+        )
+        self.dropped = 0
+        self.lock = asyncio.Lock()
+
+    def _add(self, key: str, notification: PendingNotification) -> None:
+        if existing := self.pending.get(key):
+            existing.count += notification.count
+        elif len(self.pending) >= MAX_PENDING:
+            self.dropped += 1
+        else:
+            self.pending[key] = notification
+
+    def notify(self, content: str | ipy.Embed) -> None:
+        if isinstance(content, ipy.Embed):
+            notification = PendingNotification(
+                content.title,
+                content.description or "",
+                content.color or ipy.MaterialColors.BLUE,
+            )
+        else:
+            notification = PendingNotification(None, content, ipy.MaterialColors.BLUE)
+        self._add(
+            hashlib.sha256(
+                f"{notification.title}\n{notification.description}".encode()
+            ).hexdigest(),
+            notification,
+        )
+
+    def report_error(self, error: BaseException) -> None:
+        formatted = "".join(traceback.format_exception(error))
+        # the end of a traceback is the most useful part
+        limit = MAX_DESCRIPTION_LENGTH - 100
+        if len(formatted) > limit:
+            formatted = f"...{formatted[-limit:]}"
+
+        self._add(
+            error_signature(error),
+            PendingNotification(
+                "Error", f"```py\n{formatted}\n```", ipy.MaterialColors.ORANGE
+            ),
+        )
+
+    def pack(self) -> list[list[ipy.Embed]]:
+        """Takes everything pending, packed into as few messages as possible."""
+        embeds = [notification.to_embed() for notification in self.pending.values()]
+        if self.dropped:
+            embeds.append(
+                ipy.Embed(
+                    description=f"{self.dropped:,} more notification(s) were dropped.",
+                    color=ipy.MaterialColors.ORANGE,
+                    timestamp=ipy.Timestamp.utcnow(),
+                )
+            )
+        self.pending.clear()
+        self.dropped = 0
+
+        messages: list[list[ipy.Embed]] = []
+        length = 0
+        for embed in embeds:
+            embed_length = len(embed.title or "") + len(embed.description or "")
+            if (
+                not messages
+                or len(messages[-1]) >= MAX_EMBEDS
+                or length + embed_length > MAX_MESSAGE_LENGTH
+            ):
+                messages.append([])
+                length = 0
+            messages[-1].append(embed)
+            length += embed_length
+        return messages
+
+    async def flush(self, bot: ipy.Client) -> None:
+        if not self.pending and not self.dropped:
+            return
+
+        # nothing can be sent before the bot knows who its owner is
+        if not bot.is_ready:
+            return
+
+        async with self.lock:
+            for embeds in self.pack():
+                try:
+                    await bot.owner.send(embeds=embeds)
+                except ipy.errors.HTTPException:
+                    # reporting this to the owner would just fail again
+                    logger.warning("Could not notify the owner.", exc_info=True)
+
+    async def run(self, bot: ipy.Client) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush(bot)
+            except Exception:
+                # not reported to the owner, as that's what just failed - but
+                # the queue has to keep going, or nothing would be sent again
+                logger.exception("Could not send owner notifications.")
+
+
+NOTIFICATIONS = NotificationQueue(CONFIG.get("notification_interval", 10))
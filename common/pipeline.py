@@ -0,0 +1,975 @@
+import asyncio
+import collections
+import concurrent.futures
+import functools
+import logging
+import os
+import shutil
+import time
+
+import typing_extensions as typing
+
+import common.chatlog as chatlog
+import common.index as index
+import common.metrics as metrics
+import common.postprocess as postprocess
+import common.render as render
+import common.search as search
+import initialize
+from common.archive_queue import FairLimiter
+from common.budget import DiskBudget
+from common.exporter import Exporter
+from common.job import ArchiveJob
+from common.manifest import ExportManifest
+from common.media import MediaStore
+from common.models import Category, Channel, ExportTarget, Thread, to_optional_int
+from common.native_export import NativeExporter
+from common.plan import (
+    ArchivePlan,
+    PlannedExport,
+    estimate_messages,
+    messages_per_day,
+)
+from common.profiles import Profile
+from common.progress import ExportProgress, ExportResult, iter_lines
+from common.publisher import GitPublisher, PublishResult
+from common.scheduler import ExportScheduler
+from common.stats import ThroughputStats
+from common.throttle import ExportThrottle
+
+if typing.TYPE_CHECKING:
+    import interactions as ipy
+    from interactions.api.http.http_client import HTTPClient
+
+__all__ = (
+    "RELOADED_MODULES",
+    "ArchivePipeline",
+    "ThreadDiscovery",
+    "discover",
+)
+
+logger = logging.getLogger("kgarchivebot")
+
+# what extensions reload before this module, in dependency order, so it never
+# binds to stale copies. the archive queue and metrics hold state for the whole
+# process, so they're left alone
+RELOADED_MODULES = (
+    "common.files",
+    "common.chatlog",
+    "common.models",
+    "common.budget",
+    "common.throttle",
+    "common.progress",
+    "common.stats",
+    "common.manifest",
+    "common.job",
+    "common.exporter",
+    "common.index",
+    "common.postprocess",
+    "common.render",
+    "common.native_export",
+    "common.search",
+    "common.media",
+    "common.plan",
+    "common.publisher",
+    "common.scheduler",
+)
+
+# how often the manifest and job are saved while exports finish - each save
+# rewrites them in full, which adds up on big archives if done after every export
+CHECKPOINT_INTERVAL = 5
+
+
+class ThreadDiscovery:
+    """
+    Fetches the threads and last message of many channels concurrently, caching
+    the threads for the duration of a single run.
+    """
+
+    def __init__(self, max_concurrent: int) -> None:
+        # interactions.py handles rate limits for us, this just stops us from
+        # queueing hundreds of requests at once
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.cache: dict[int, asyncio.Task[list[ipy.ThreadChannel]]] = {}
+
+    async def _fetch_threads(
+        self, discord_channel: "ipy.GuildText"
+    ) -> "list[ipy.ThreadChannel]":
+        async with self.semaphore:
+            metrics.DISCOVERY_CALLS.inc()
+            with metrics.DISCOVERY_SECONDS.time():
+                thread_list = await discord_channel.fetch_all_threads()
+        return thread_list.threads
+
+    def fetch_threads(
+        self, discord_channel: "ipy.GuildText"
+    ) -> "asyncio.Task[list[ipy.ThreadChannel]]":
+        channel_id = int(discord_channel.id)
+        if channel_id not in self.cache:
+            self.cache[channel_id] = asyncio.create_task(
+                self._fetch_threads(discord_channel)
+            )
+        return self.cache[channel_id]
+
+    async def fetch_last_message_id(
+        self, discord_channel: "ipy.GuildText"
+    ) -> int | None:
+        # the cached last_message_id is only ever set when the bot connects, and
+        # never updated by new messages - so it's asked for every time
+        async with self.semaphore:
+            metrics.DISCOVERY_CALLS.inc()
+            with metrics.DISCOVERY_SECONDS.time():
+                messages = await discord_channel.fetch_messages(limit=1)
+        return int(messages[0].id) if messages else None
+
+    async def resolve(self, channel: Channel, discord_channel: "ipy.GuildText") -> None:
+        if channel.last_message_id is None:
+            discord_threads, channel.last_message_id = await asyncio.gather(
+                self.fetch_threads(discord_channel),
+                self.fetch_last_message_id(discord_channel),
+            )
+        else:
+            discord_threads = await self.fetch_threads(discord_channel)
+        channel.threads = [
+            Thread(
+                discord_thread.id,
+                discord_thread.name,
+                channel,
+                last_message_id=to_optional_int(discord_thread.last_message_id),
+                message_count=discord_thread.message_count,
+            )
+            for discord_thread in discord_threads
+        ]
+
+
+async def discover(
+    guild: "ipy.Guild",
+    profile: Profile,
+    *,
+    only: set[int] | None = None,
+    previous: list[Category] | None = None,
+    last_message_ids: dict[int, int] | None = None,
+) -> list[Category]:
+    """
+    Works out what there is to archive in `guild`. If `only` is given, only the
+    threads of those channels are fetched, and every other channel is carried
+    over from the `previous` tree as it was.
+
+    `last_message_ids` can hold the newest message of channels, if it's already
+    known - the rest are fetched.
+    """
+    discovery = ThreadDiscovery(profile.get("max_concurrent_discovery", 10))
+    categories: list[Category] = []
+    previous_channels = {
+        channel.id: channel
+        for category in previous or []
+        for channel in category.channels
+    }
+    resolving: list[typing.Coroutine[typing.Any, typing.Any, None]] = []
+
+    for category_entry in profile.categories:
+        category = Category(
+            category_entry["id"],
+            category_entry["name"],
+            category_entry["internal_name"],
+            profile=profile,
+        )
+
+        category_channel: ipy.GuildCategory | None = guild.get_channel(
+            category_entry["id"]
+        )
+        if not category_channel:
+            # like after the category was deleted
+            raise ValueError(f"Category {category_entry['id']} is not in {guild.name}.")
+
+        for discord_channel in category_channel.text_channels:
+            channel_id = int(discord_channel.id)
+            if (
+                only is not None
+                and channel_id not in only
+                and (previous_channel := previous_channels.get(channel_id))
+            ):
+                # nothing has happened here since the last archive
+                channel = Channel.from_dict(previous_channel.to_dict(), category)
+                channel.name = discord_channel.name
+                category.channels.append(channel)
+                continue
+
+            channel = Channel(
+                discord_channel.id,
+                discord_channel.name,
+                category,
+                last_message_id=(last_message_ids or {}).get(channel_id),
+            )
+            category.channels.append(channel)
+            resolving.append(discovery.resolve(channel, discord_channel))
+
+        categories.append(category)
+
+    # every channel's threads are fetched at once rather than one by one
+    with metrics.STAGE_SECONDS.time(stage="discovery"):
+        await asyncio.gather(*resolving)
+    return categories
+
+
+def modified_times(targets: list[ExportTarget]) -> dict[int, int | None]:
+    return {
+        target.id: os.stat(target.path).st_mtime_ns
+        if os.path.exists(target.path)
+        else None
+        for target in targets
+    }
+
+
+def existing_paths(paths: list[str]) -> list[str]:
+    return [path for path in paths if os.path.exists(path)]
+
+
+def count_exported(paths: list[str]) -> tuple[int, int]:
+    # how many messages the exports at `paths` hold, and how big they are
+    messages = 0
+    size = 0
+    for path in existing_paths(paths):
+        messages += chatlog.count_messages(path)
+        size += os.path.getsize(path)
+    return messages, size
+
+
+def output_size(paths: list[str]) -> int:
+    # includes any precompressed copies
+    return sum(
+        os.path.getsize(path)
+        for output_path in paths
+        for path in (output_path, f"{output_path}.gz", f"{output_path}.br")
+        if os.path.exists(path)
+    )
+
+
+class ArchivePipeline:
+    def __init__(
+        self,
+        job: ArchiveJob,
+        profile: Profile,
+        *,
+        pool: FairLimiter | None = None,
+        http: "HTTPClient | None" = None,
+        refresh: set[int] | None = None,
+    ) -> None:
+        self.job = job
+        self.profile = profile
+        # channels and threads to export in full even if we have them already,
+        # like after messages in them were edited or deleted
+        self.refresh = refresh or set()
+        self.budget = DiskBudget(
+            profile.archive_location,
+            profile.get("min_free_space_mb", 1024) * 1024 * 1024,
+            poll_interval=profile.get("disk_poll_interval", 30),
+        )
+        self.scheduler = ExportScheduler(
+            profile.get("max_concurrent_exports", 4),
+            pool=pool,
+            pool_key=profile.archive_location,
+            gate=self.wait_for_space,
+        )
+        self.manifest = ExportManifest(
+            f"{profile.archive_location}/.archive_manifest.json"
+        )
+        self.stats = ThroughputStats.load(
+            f"{profile.archive_location}/.archive_stats.json"
+        )
+        self.last_checkpoint = 0.0
+        self.progress = ExportProgress()
+        self.throttle = (
+            ExportThrottle(
+                max_exports=self.scheduler.max_concurrent,
+                max_parallel=profile.get("max_export_parallel", 16),
+                parallel=profile.get("export_parallel", 10),
+            )
+            if profile.get("adaptive_concurrency", True)
+            else None
+        )
+        self.progress.throttle = self.throttle
+        self.media = MediaStore(profile.archive_location)
+        self.exporter = Exporter(
+            os.environ["CLI_EXECUTABLE"],
+            os.environ["MAIN_TOKEN"],
+            parallel=self.throttle.parallel
+            if self.throttle
+            else profile.get("export_parallel", 10),
+            max_batch_size=profile.get("max_channels_per_export", 250),
+            media=profile.get("export_media", True),
+            media_folder=self.media.cache_path,
+            # json exports are rendered into html here, and kept around so they
+            # can be rendered again without going back to discord
+            export_json=profile.get("export_format", "html") == "json",
+        )
+        # small threads are exported through the bot itself, skipping the cli's
+        # startup time - this needs the bot's http client, so it's off without one
+        self.native_max_messages: int = profile.get("native_export_max_messages", 0)
+        self.native_exporter = (
+            NativeExporter(
+                http,
+                media_folder=self.media.cache_path if self.exporter.media else None,
+            )
+            if http and self.native_max_messages
+            else None
+        )
+        self.postprocess_options = postprocess.PostProcessOptions(
+            minify=profile.get("minify_html", False),
+            stylesheet_folder=(
+                f"{profile.archive_location}/styles"
+                if profile.get("extract_css", False)
+                else None
+            ),
+            compress=profile.get("precompress_html", False),
+        )
+        self.messages_per_page: int = profile.get("messages_per_page", 0)
+        self.search_index: bool = profile.get("search_index", False)
+        self.publisher = (
+            GitPublisher(
+                profile.archive_location,
+                remote=profile.get("publish_remote"),
+                branch=profile.get("publish_branch"),
+                max_batch_size=profile.get("publish_batch_mb", 100) * 1024 * 1024,
+            )
+            if profile.get("publish", False)
+            else None
+        )
+        self.publish_result: PublishResult | None = None
+        self.process_pool: concurrent.futures.ProcessPoolExecutor | None = None
+        self.stage_timings: collections.defaultdict[str, float] = (
+            collections.defaultdict(float)
+        )
+
+    def exports_natively(self, target: ExportTarget) -> bool:
+        # only threads know how many messages they have up front
+        return (
+            self.native_exporter is not None
+            and target.message_count is not None
+            and target.message_count <= self.native_max_messages
+        )
+
+    async def export_natively(
+        self, target: ExportTarget, output_folder: str, *, after: int | None = None
+    ) -> ExportResult | None:
+        """
+        Exports `target` through the bot, returning None if that failed and the
+        cli should be used instead.
+        """
+        export = self.progress.start(
+            os.path.relpath(output_folder, self.profile.archive_location), [target.id]
+        )
+        path = f"{output_folder}/{target.id}.html"
+
+        try:
+            messages = await self.native_exporter.export(  # type: ignore
+                target,
+                f"{output_folder}/{target.id}.{self.exporter.extension}",
+                after=after,
+            )
+            if self.exporter.export_json:
+                await self.render_json(f"{output_folder}/{target.id}.json", path)
+        except Exception:
+            logger.warning(
+                "Exporting %s through the bot failed, falling back to the CLI.",
+                target.id,
+                exc_info=True,
+            )
+            self.progress.active.remove(export)
+            return None
+
+        size = await asyncio.to_thread(os.path.getsize, path)
+        result = self.progress.finish(export, 0, messages, size)
+        metrics.NATIVE_EXPORTS.inc()
+        metrics.EXPORTED_BYTES.inc(size)
+        metrics.EXPORTED_MESSAGES.inc(messages)
+        return result
+
+    async def export_channels(
+        self,
+        targets: list[ExportTarget],
+        output_folder: str,
+        *,
+        after: int | None = None,
+    ) -> ExportResult:
+        if len(targets) == 1 and self.exports_natively(targets[0]):
+            result = await self.export_natively(targets[0], output_folder, after=after)
+            if result:
+                return result
+
+        channel_ids = [target.id for target in targets]
+        export = self.progress.start(
+            os.path.relpath(output_folder, self.profile.archive_location), channel_ids
+        )
+
+        process = await self.exporter.start(channel_ids, output_folder, after=after)
+        async for line in iter_lines(process.stdout):
+            export.feed(line)
+        return_code = await process.wait()
+
+        if self.exporter.export_json:
+            json_paths = await asyncio.to_thread(
+                existing_paths,
+                [f"{output_folder}/{channel_id}.json" for channel_id in channel_ids],
+            )
+            rendered = await asyncio.gather(
+                *(
+                    self.render_json(path, f"{path.removesuffix('.json')}.html")
+                    for path in json_paths
+                ),
+                return_exceptions=True,
+            )
+            for path, messages in zip(json_paths, rendered, strict=True):
+                if isinstance(messages, Exception):
+                    # likely cut off by the cli failing, so it's exported again
+                    # next time rather than added to
+                    await asyncio.to_thread(os.remove, path)
+
+        messages, size = await asyncio.to_thread(
+            count_exported,
+            [f"{output_folder}/{channel_id}.html" for channel_id in channel_ids],
+        )
+        metrics.EXPORTED_BYTES.inc(size)
+
+        result = self.progress.finish(export, return_code, messages, size)
+        # a failed export is as good a sign as any of pushing discord too hard
+        if self.throttle and self.throttle.record(
+            rate_limits=export.rate_limits, failed=not result.succeeded
+        ):
+            # only exports started from here on pick the new values up
+            self.exporter.parallel = self.throttle.parallel
+            self.scheduler.resize(self.throttle.exports)
+        metrics.CLI_EXPORTS.inc(result="success" if result.succeeded else "failure")
+        metrics.CLI_EXPORT_SECONDS.observe(result.duration)
+        metrics.EXPORTED_MESSAGES.inc(messages)
+        if not result.succeeded:
+            logger.error(
+                "Exporting %s exited with code %s:\n%s",
+                result.label,
+                return_code,
+                "\n".join(export.output),
+            )
+        return result
+
+    async def wait_for_space(self) -> None:
+        # checked before every export, so a full disk pauses the run rather than
+        # leaving half-written pages behind
+        if await asyncio.to_thread(self.budget.has_space):
+            return
+
+        self.progress.notice = "Paused until more disk space is free"
+        try:
+            await self.budget.wait_for_space()
+        finally:
+            self.progress.notice = None
+
+    async def render_json(self, json_path: str, html_path: str) -> int:
+        """
+        Renders a json export into html in another process, returning how many
+        messages it had.
+
+        """
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.process_pool, render.render_export, json_path, html_path
+            )
+        except Exception:
+            logger.exception("Could not render %s.", json_path)
+            raise
+
+    async def postprocess(self, path: str) -> None:
+        if not self.postprocess_options.enabled:
+            return
+
+        # parsing huge pages is cpu-bound, so it's done in another process
+        original_size, new_size = await asyncio.get_running_loop().run_in_executor(
+            self.process_pool,
+            postprocess.process_file,
+            path,
+            self.postprocess_options,
+        )
+        metrics.POSTPROCESS_SAVED_BYTES.inc(original_size - new_size)
+
+    def paginate(
+        self, target: ExportTarget, *, new_export: str | None = None
+    ) -> list[chatlog.Page]:
+        """
+        Splits the export at the target's path into pages, replacing it with an
+        index of them. If `new_export` is given, it holds messages newer than the
+        existing pages, and only the last page is merged with it and re-split.
+
+        Returns every page, and writes the ones that changed.
+        """
+        pages = chatlog.load_pages(target.pages_path)
+
+        if new_export and pages:
+            last_page = pages.pop()
+            last_page_path = f"{target.pages_path}/{last_page.number}.html"
+            chatlog.merge_exports(last_page_path, new_export)
+            changed = chatlog.split_export(
+                last_page_path,
+                target.pages_path,
+                self.messages_per_page,
+                first_page=last_page.number,
+            )
+        else:
+            if new_export:
+                chatlog.merge_exports(target.path, new_export)
+            # a full export replaces every page, so old ones can't be left over
+            pages = []
+            shutil.rmtree(target.pages_path, ignore_errors=True)
+            changed = chatlog.split_export(
+                target.path, target.pages_path, self.messages_per_page
+            )
+
+        pages.extend(changed)
+        chatlog.save_pages(target.pages_path, pages)
+        index.write_if_changed(target.path, index.render_page_index(target, pages))
+        return changed
+
+    async def checkpoint(self, *, force: bool = False) -> None:
+        """
+        Saves the media store, the manifest and the job off the event loop, at
+        most once every `CHECKPOINT_INTERVAL` seconds unless `force` is set. An
+        interrupted run only re-exports what finished since the last checkpoint.
+        """
+        now = time.monotonic()
+        if not force and now - self.last_checkpoint < CHECKPOINT_INTERVAL:
+            return
+        self.last_checkpoint = now
+
+        # the job goes last - resuming skips whatever it calls completed, so
+        # everything else has to know about it by then
+        await asyncio.to_thread(self.media.save)
+        await asyncio.to_thread(self.manifest.save)
+        await asyncio.to_thread(self.job.save)
+
+    def remove_stale_outputs(self, target: ExportTarget) -> None:
+        if not self.exporter.export_json and os.path.exists(target.json_path):
+            # json exports have been turned off, so this won't be kept up to date
+            os.remove(target.json_path)
+        if not self.messages_per_page and os.path.exists(target.pages_path):
+            # pagination has been turned off since the last export
+            shutil.rmtree(target.pages_path)
+
+    async def finish_export(
+        self, target: ExportTarget, *, new_export: str | None = None
+    ) -> None:
+        messages = None
+        last_message_id = None
+        output_paths = [target.path]
+
+        await asyncio.to_thread(self.remove_stale_outputs, target)
+
+        if not self.messages_per_page:
+            last_message_id = await asyncio.to_thread(
+                chatlog.last_message_id, target.path
+            )
+        else:
+            # split before processing media, as that links to media relative to
+            # wherever the page ends up
+            changed = await asyncio.to_thread(
+                self.paginate, target, new_export=new_export
+            )
+            output_paths = [
+                f"{target.pages_path}/{page.number}.html" for page in changed
+            ]
+            pages = await asyncio.to_thread(chatlog.load_pages, target.pages_path)
+            messages = sum(page.messages for page in pages)
+            last_message_id = max(
+                (page.last_message_id for page in pages if page.last_message_id),
+                default=None,
+            )
+
+        written = 0
+        for path in output_paths:
+            written += await asyncio.to_thread(self.media.process, path)
+            await self.postprocess(path)
+        if self.messages_per_page:
+            # the page index gets compressed too, if that's enabled
+            await self.postprocess(target.path)
+            output_paths.append(target.path)
+
+        written += await asyncio.to_thread(output_size, output_paths)
+        self.budget.record(target.category.internal_name, written)
+
+        # what was actually written, rather than what discovery saw - anything
+        # sent since is picked up by the next incremental export
+        await asyncio.to_thread(
+            self.manifest.record,
+            target.id,
+            last_message_id,
+            target.path,
+            messages=messages,
+        )
+
+    async def export_full(
+        self, targets: list[ExportTarget], output_folder: str
+    ) -> None:
+        modified_before = await asyncio.to_thread(modified_times, targets)
+        result = await self.export_channels(targets, output_folder)
+        modified_after = await asyncio.to_thread(modified_times, targets)
+
+        # only files this export wrote out in full count - anything else may be
+        # from the last run, or cut off part way through
+        exported: list[ExportTarget] = []
+        for target in targets:
+            if modified_after[target.id] in (None, modified_before[target.id]):
+                continue
+            if await asyncio.to_thread(chatlog.is_complete, target.path):
+                exported.append(target)
+            else:
+                # so the next run exports it in full, rather than adding to it
+                await asyncio.to_thread(os.remove, target.path)
+
+        if not result.succeeded:
+            # the cli doesn't say which channels failed, so the whole batch is
+            # left for the next run to retry
+            return
+
+        for target in exported:
+            await self.finish_export(target)
+        self.job.mark_completed(*(t.id for t in exported))
+        await self.checkpoint()
+
+    async def export_incremental(
+        self, target: ExportTarget, output_folder: str, after: int
+    ) -> None:
+        # the new messages are exported on their own, then appended to what we have
+        incremental_folder = f"{output_folder}/.incremental/{target.id}"
+        await asyncio.to_thread(os.makedirs, incremental_folder, exist_ok=True)
+
+        try:
+            result = await self.export_channels(
+                [target], incremental_folder, after=after
+            )
+
+            incremental_path = f"{incremental_folder}/{target.id}.html"
+            if not result.succeeded or not await asyncio.to_thread(
+                os.path.exists, incremental_path
+            ):
+                return
+
+            if self.exporter.export_json:
+                await asyncio.to_thread(
+                    render.merge_json_exports,
+                    target.json_path,
+                    f"{incremental_folder}/{target.id}.json",
+                )
+
+            if self.messages_per_page:
+                await self.finish_export(target, new_export=incremental_path)
+            else:
+                await asyncio.to_thread(
+                    chatlog.merge_exports, target.path, incremental_path
+                )
+                await self.finish_export(target)
+        finally:
+            await asyncio.to_thread(
+                shutil.rmtree, incremental_folder, ignore_errors=True
+            )
+
+        self.job.mark_completed(target.id)
+        await self.checkpoint()
+
+    def plan_exports(
+        self, targets: list[ExportTarget]
+    ) -> tuple[list[tuple[ExportTarget, int]], list[list[ExportTarget]]]:
+        """
+        Works out what has to be exported out of `targets`, returning the targets
+        that can be exported incrementally alongside the message to export after,
+        and batches of targets that have to be exported in full.
+        """
+        incremental: list[tuple[ExportTarget, int]] = []
+        full_targets: list[ExportTarget] = []
+
+        for target in targets:
+            if self.job.is_completed(target.id):
+                continue
+
+            entry = self.manifest.get(target.id)
+
+            if not entry or not os.path.exists(target.path):
+                full_targets.append(target)
+            elif target.id in self.refresh:
+                full_targets.append(target)
+            elif bool(self.messages_per_page) != os.path.exists(
+                f"{target.pages_path}/pages.json"
+            ):
+                # pagination was turned on or off since the last export - pages
+                # link to media from a different folder, so it's easier to start over
+                full_targets.append(target)
+            elif self.exporter.export_json and not os.path.exists(target.json_path):
+                # exported before json exports were turned on, so there's nothing
+                # to add the new messages to
+                full_targets.append(target)
+            elif target.last_message_id is None or (
+                entry.last_message_id is not None
+                and target.last_message_id <= entry.last_message_id
+            ):
+                # nothing new has been sent since the last export - the newest
+                # message may also have been deleted since
+                continue
+            elif entry.last_message_id is None:
+                full_targets.append(target)
+            else:
+                incremental.append((target, entry.last_message_id))
+
+        # small threads are exported one by one through the bot, so batching them
+        # with the rest would just send them through the cli instead
+        batches = [[target] for target in full_targets if self.exports_natively(target)]
+        targets_by_id = {
+            target.id: target
+            for target in full_targets
+            if not self.exports_natively(target)
+        }
+        batches.extend(
+            [targets_by_id[channel_id] for channel_id in batch]
+            for batch in self.exporter.batch(list(targets_by_id))
+        )
+        return incremental, batches
+
+    async def queue_exports(
+        self, targets: list[ExportTarget], output_folder: str
+    ) -> list[asyncio.Task]:
+        # planning checks which exports are already on disk
+        incremental, batches = await asyncio.to_thread(self.plan_exports, targets)
+        jobs: list[asyncio.Task] = []
+
+        for target, after in incremental:
+            self.progress.queue()
+            jobs.append(
+                self.scheduler.submit(
+                    functools.partial(
+                        self.export_incremental, target, output_folder, after
+                    )
+                )
+            )
+
+        for batch in batches:
+            self.progress.queue()
+            jobs.append(
+                self.scheduler.submit(
+                    functools.partial(self.export_full, batch, output_folder)
+                )
+            )
+
+        return jobs
+
+    def plan(self, categories: list[Category]) -> ArchivePlan:
+        rate = messages_per_day(self.manifest)
+        archive_plan = ArchivePlan(
+            self.scheduler.max_concurrent,
+            self.stats.seconds_per_message,
+            self.stats.bytes_per_message,
+            # media isn't going to take up any space if it isn't exported
+            self.stats.media_bytes_per_message if self.exporter.media else 0,
+            self.budget.available_bytes(),
+            categories=len(categories),
+        )
+
+        for category in categories:
+            archive_plan.channels += len(category.channels)
+            archive_plan.threads += sum(
+                len(channel.threads) for channel in category.channels
+            )
+
+            # grouped the same way run() groups them, so batches come out the same
+            target_groups = [
+                channel.threads for channel in category.channels if channel.threads
+            ]
+            target_groups.append(category.channels)
+
+            for targets in target_groups:
+                incremental, batches = self.plan_exports(targets)
+                archive_plan.skipped += (
+                    len(targets) - len(incremental) - sum(map(len, batches))
+                )
+
+                for target, _ in incremental:
+                    archive_plan.exports.append(
+                        PlannedExport(
+                            category.internal_name,
+                            [target.id],
+                            estimate_messages(
+                                target, self.manifest.get(target.id), rate
+                            ),
+                            incremental=True,
+                            native=self.exports_natively(target),
+                        )
+                    )
+                for batch in batches:
+                    archive_plan.exports.append(
+                        PlannedExport(
+                            category.internal_name,
+                            [target.id for target in batch],
+                            sum(
+                                estimate_messages(target, None, rate)
+                                for target in batch
+                            ),
+                            incremental=False,
+                            native=len(batch) == 1 and self.exports_natively(batch[0]),
+                        )
+                    )
+
+        return archive_plan
+
+    async def index_for_search(self, target: ExportTarget) -> None:
+        entry = self.manifest.get(target.id)
+        if not entry or not await asyncio.to_thread(os.path.exists, target.path):
+            return
+        if await asyncio.to_thread(search.cached_hash, target) == entry.hash:
+            # unchanged since it was last indexed
+            return
+
+        page_paths, page_urls = await asyncio.to_thread(search.export_pages, target)
+        docs, tokens = await asyncio.get_running_loop().run_in_executor(
+            self.process_pool,
+            search.index_export,
+            page_paths,
+            page_urls,
+            search.target_name(target),
+        )
+        await asyncio.to_thread(
+            search.save_export_index, target, entry.hash, docs, tokens
+        )
+
+    async def write_category_index(self, category: Category) -> None:
+        started_at = time.perf_counter()
+        await asyncio.to_thread(index.write_category_index, category)
+        self.stage_timings["indexes"] += time.perf_counter() - started_at
+
+        if self.search_index:
+            started_at = time.perf_counter()
+            await asyncio.gather(
+                *(
+                    self.index_for_search(target)
+                    for channel in category.channels
+                    for target in (channel, *channel.threads)
+                )
+            )
+            await asyncio.to_thread(search.build_category_index, category)
+            self.stage_timings["search"] += time.perf_counter() - started_at
+
+    async def run(self, categories: list[Category]) -> None:
+        await initialize.wait_for_cli()
+        started_at = time.perf_counter()
+
+        if (
+            self.postprocess_options.enabled
+            or self.search_index
+            or self.exporter.export_json
+        ):
+            self.process_pool = concurrent.futures.ProcessPoolExecutor(
+                self.profile.get("postprocess_workers")
+            )
+
+        try:
+            for category in categories:
+                await asyncio.to_thread(category.mkdir)
+                category_jobs: list[asyncio.Task] = []
+
+                for channel in category.channels:
+                    if channel.threads:
+                        # the folder has to exist before the thread export is queued
+                        await asyncio.to_thread(channel.mkdir)
+                        category_jobs.extend(
+                            await self.queue_exports(
+                                channel.threads, channel.folder_path
+                            )
+                        )
+
+                category_jobs.extend(
+                    await self.queue_exports(category.channels, category.path)
+                )
+                self.scheduler.submit(
+                    functools.partial(self.write_category_index, category),
+                    depends_on=category_jobs,
+                    bounded=False,
+                )
+
+            await self.scheduler.join()
+        finally:
+            # whatever finished before a failure still counts
+            await self.checkpoint(force=True)
+            if self.process_pool:
+                await asyncio.to_thread(self.process_pool.shutdown)
+                self.process_pool = None
+            if self.native_exporter:
+                await self.native_exporter.close()
+
+        self.stage_timings["exports"] = time.perf_counter() - started_at
+
+        self.stats.record(self.progress.results, self.media.stored_bytes)
+        await asyncio.to_thread(self.stats.save)
+
+        await self.finish_run(categories)
+        await asyncio.to_thread(self.job.mark_finished)
+
+    def rerenderable_targets(self, categories: list[Category]) -> list[ExportTarget]:
+        return [
+            target
+            for category in categories
+            for channel in category.channels
+            for target in (channel, *channel.threads)
+            if self.manifest.get(target.id) and os.path.exists(target.json_path)
+        ]
+
+    async def rerender(self, categories: list[Category]) -> int:
+        """
+        Renders every json export in `categories` into html again, without
+        exporting anything from Discord, then paginates, post-processes, indexes
+        and publishes them like a normal run would. Returns how many exports
+        were rendered.
+        """
+        started_at = time.perf_counter()
+        targets = await asyncio.to_thread(self.rerenderable_targets, categories)
+
+        # one export per worker, so only that many are in memory at once
+        workers = self.profile.get("postprocess_workers") or os.cpu_count() or 1
+        limiter = asyncio.Semaphore(workers)
+        self.process_pool = concurrent.futures.ProcessPoolExecutor(workers)
+
+        async def rerender_target(target: ExportTarget) -> None:
+            async with limiter:
+                await self.render_json(target.json_path, target.path)
+                await self.finish_export(target)
+
+        try:
+            await asyncio.gather(*(rerender_target(target) for target in targets))
+            await asyncio.to_thread(self.media.save)
+            await asyncio.to_thread(self.manifest.save)
+            self.stage_timings["render"] = time.perf_counter() - started_at
+
+            for category in categories:
+                await self.write_category_index(category)
+        finally:
+            await asyncio.to_thread(self.process_pool.shutdown)
+            self.process_pool = None
+
+        await self.finish_run(categories)
+        return len(targets)
+
+    async def finish_run(self, categories: list[Category]) -> None:
+        index_started_at = time.perf_counter()
+        # the tree is kept around so the indexes can be rebuilt without an
+        # export. all of this is done in threads, as big archives take long
+        # enough to hold up the gateway
+        await asyncio.to_thread(index.save_tree, self.profile, categories)
+        await asyncio.to_thread(index.build_indexes, self.profile, categories)
+        if self.search_index:
+            await asyncio.to_thread(
+                search.write_search_page, self.profile.archive_location, categories
+            )
+        self.stage_timings["indexes"] += time.perf_counter() - index_started_at
+
+        if self.publisher:
+            # only what changed since the last publish gets committed
+            publish_started_at = time.perf_counter()
+            self.publish_result = await self.publisher.publish(
+                self.manifest, categories
+            )
+            self.stage_timings["publish"] = time.perf_counter() - publish_started_at
+
+        for stage, duration in self.stage_timings.items():
+            metrics.STAGE_SECONDS.observe(duration, stage=stage)
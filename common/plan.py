@@ -0,0 +1,164 @@
+import attrs
+
+from common.budget import format_size
+from common.manifest import ExportManifest, ManifestEntry
+from common.models import ExportTarget
+
+__all__ = (
+    "ArchivePlan",
+    "PlannedExport",
+    "estimate_messages",
+    "format_duration",
+    "messages_per_day",
+)
+
+DISCORD_EPOCH = 1420070400000
+MILLISECONDS_PER_DAY = 86_400_000
+
+# used when there are no previous exports to go off of
+DEFAULT_MESSAGES_PER_DAY = 100
+DEFAULT_SECONDS_PER_MESSAGE = 0.01
+DEFAULT_BYTES_PER_MESSAGE = 2048
+
+
+def snowflake_days(snowflake: int) -> float:
+    return ((snowflake >> 22) + DISCORD_EPOCH) / MILLISECONDS_PER_DAY
+
+
+def messages_per_day(manifest: ExportManifest) -> float:
+    # previous exports say how busy channels in this server tend to be
+    messages = 0
+    days = 0.0
+    for channel_id, entry in manifest.entries.items():
+        if entry.messages and entry.last_message_id:
+            messages += entry.messages
+            days += max(
+                snowflake_days(entry.last_message_id) - snowflake_days(channel_id), 1
+            )
+    return messages / days if days else DEFAULT_MESSAGES_PER_DAY
+
+
+def estimate_messages(
+    target: ExportTarget, entry: ManifestEntry | None, rate: float
+) -> int:
+    """
+    Estimates how many messages exporting `target` will involve, past what
+    `entry` says has already been exported.
+
+    Threads know their own message count. Channels don't, so the time between
+    their creation (or the last export) and their last message is multiplied
+    by `rate`, in messages per day.
+    """
+    if target.message_count is not None:
+        exported = (entry.messages or 0) if entry else 0
+        return max(target.message_count - exported, 0)
+
+    if not target.last_message_id:
+        return 0
+
+    since = entry.last_message_id if entry and entry.last_message_id else target.id
+    days = snowflake_days(target.last_message_id) - snowflake_days(since)
+    return max(round(days * rate), 1)
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h {minutes}m"
+    return f"{minutes}m {seconds}s"
+
+
+@attrs.define()
+class PlannedExport:
+    category: str = attrs.field()
+    channel_ids: list[int] = attrs.field()
+    messages: int = attrs.field()
+    incremental: bool = attrs.field()
+    native: bool = attrs.field(default=False)
+
+
+@attrs.define()
+class ArchivePlan:
+    """What an archive run would export, and roughly how long it would take."""
+
+    concurrency: int = attrs.field()
+    seconds_per_message: float | None = attrs.field()
+    bytes_per_message: float | None = attrs.field(default=None)
+    media_bytes_per_message: float | None = attrs.field(default=None)
+    available_bytes: int | None = attrs.field(default=None)
+    categories: int = attrs.field(default=0)
+    channels: int = attrs.field(default=0)
+    threads: int = attrs.field(default=0)
+    skipped: int = attrs.field(default=0)
+    exports: list[PlannedExport] = attrs.field(factory=list)
+
+    @property
+    def messages(self) -> int:
+        return sum(export.messages for export in self.exports)
+
+    @property
+    def projected_duration(self) -> float:
+        seconds_per_message = self.seconds_per_message or DEFAULT_SECONDS_PER_MESSAGE
+        durations = [export.messages * seconds_per_message for export in self.exports]
+
+        # the run can't be any shorter than its longest export
+        return max(sum(durations) / self.concurrency, max(durations, default=0))
+
+    @property
+    def media_bytes(self) -> int:
+        return round(self.messages * (self.media_bytes_per_message or 0))
+
+    @property
+    def estimated_bytes(self) -> int:
+        bytes_per_message = self.bytes_per_message or DEFAULT_BYTES_PER_MESSAGE
+        return round(self.messages * bytes_per_message) + self.media_bytes
+
+    @property
+    def guessed_size(self) -> bool:
+        # no previous runs to go off of, so the size is only a default per message
+        return not self.bytes_per_message
+
+    @property
+    def fits(self) -> bool:
+        return (
+            self.available_bytes is None or self.estimated_bytes <= self.available_bytes
+        )
+
+    def describe(self) -> str:
+        cli_exports = [export for export in self.exports if not export.native]
+        lines = [
+            f"Categories: {self.categories}",
+            f"Channels: {self.channels}, plus {self.threads} thread(s)",
+            f"Up to date: {self.skipped} channel(s) and thread(s)",
+            f"CLI invocations: {len(cli_exports)}, {self.concurrency} at a time",
+            f"Exported through the bot: {len(self.exports) - len(cli_exports)}",
+            f"Estimated messages: ~{self.messages:,}",
+            f"Projected duration: ~{format_duration(self.projected_duration)}",
+            f"Estimated size: ~{format_size(self.estimated_bytes)},"
+            f" ~{format_size(self.media_bytes)} of it media",
+        ]
+        if self.available_bytes is not None:
+            lines.append(
+                f"Space available: {format_size(self.available_bytes)}"
+                + ("" if self.fits else " - **this might not fit!**")
+            )
+        if not self.seconds_per_message:
+            lines.append(
+                "*No previous runs have been recorded, so this is a rough guess.*"
+            )
+
+        lines.append("\nBatches:")
+        category_names = dict.fromkeys(export.category for export in self.exports)
+        for category_name in category_names:
+            exports = [e for e in self.exports if e.category == category_name]
+            full = [len(e.channel_ids) for e in exports if not e.incremental]
+            incremental = len(exports) - len(full)
+            lines.append(
+                f"- `{category_name}`: {len(full)} full export(s)"
+                f" ({', '.join(str(size) for size in full) or 'none'} channel(s)),"
+                f" {incremental} incremental export(s),"
+                f" ~{sum(e.messages for e in exports):,} message(s)"
+            )
+
+        return "\n".join(lines)
@@ -0,0 +1,200 @@
+"""
+Shrinks exported HTML after the fact. Everything here runs in worker processes,
+so it sticks to the standard library (and brotli, if it's installed).
+"""
+
+import contextlib
+import gzip
+import hashlib
+import html.parser
+import os
+import re
+
+import attrs
+
+from common.files import write_atomic
+
+__all__ = ("PostProcessOptions", "extract_stylesheets", "minify_html", "process_file")
+
+brotli = None
+with contextlib.suppress(ImportError):
+    import brotli  # type: ignore
+
+STYLE_REGEX = re.compile(r"<style>(.*?)</style>", re.DOTALL)
+CSS_COMMENT_REGEX = re.compile(r"/\*.*?\*/", re.DOTALL)
+CSS_WHITESPACE_REGEX = re.compile(r"\s+")
+CSS_PUNCTUATION_REGEX = re.compile(r"\s*([{};])\s*")
+WHITESPACE_REGEX = re.compile(r"\s+")
+
+VOID_ELEMENTS = frozenset(
+    {
+        "area",
+        "base",
+        "br",
+        "col",
+        "embed",
+        "hr",
+        "img",
+        "input",
+        "link",
+        "meta",
+        "source",
+        "track",
+        "wbr",
+    }
+)
+# whitespace inside these is shown as-is, so it has to be left alone
+PRESERVED_ELEMENTS = frozenset({"pre", "code", "textarea", "script", "style"})
+PRESERVED_CLASSES = ("chatlog__markdown-preserve", "chatlog__markdown-pre")
+
+
+@attrs.define()
+class PostProcessOptions:
+    minify: bool = attrs.field(default=False)
+    stylesheet_folder: str | None = attrs.field(default=None)
+    compress: bool = attrs.field(default=False)
+
+    @property
+    def enabled(self) -> bool:
+        return self.minify or bool(self.stylesheet_folder) or self.compress
+
+
+class _Minifier(html.parser.HTMLParser):
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=False)
+        self.output: list[str] = []
+        # every open element, and whether whitespace inside it matters
+        self.open_elements: list[tuple[str, bool]] = []
+        self.preserving = 0
+
+    def handle_starttag(
+        self, tag: str, tag_attrs: list[tuple[str, str | None]]
+    ) -> None:
+        self.output.append(self.get_starttag_text() or "")
+        if tag in VOID_ELEMENTS:
+            return
+
+        classes = next(
+            (value or "" for name, value in tag_attrs if name == "class"), ""
+        )
+        preserve = tag in PRESERVED_ELEMENTS or any(
+            preserved_class in classes for preserved_class in PRESERVED_CLASSES
+        )
+        self.open_elements.append((tag, preserve))
+        self.preserving += preserve
+
+    def handle_startendtag(
+        self, _tag: str, _tag_attrs: list[tuple[str, str | None]]
+    ) -> None:
+        # self-closing tags never contain anything
+        self.output.append(self.get_starttag_text() or "")
+
+    def handle_endtag(self, tag: str) -> None:
+        self.output.append(f"</{tag}>")
+
+        if not any(open_tag == tag for open_tag, _ in self.open_elements):
+            return
+        while self.open_elements:
+            open_tag, preserve = self.open_elements.pop()
+            self.preserving -= preserve
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data: str) -> None:
+        if self.preserving:
+            self.output.append(data)
+        elif data.isspace():
+            # indentation can go, but not the line break itself - it may be the
+            # only thing between two inline elements, and it keeps diffs small
+            self.output.append("\n" if "\n" in data else " ")
+        else:
+            self.output.append(WHITESPACE_REGEX.sub(" ", data))
+
+    def handle_entityref(self, name: str) -> None:
+        self.output.append(f"&{name};")
+
+    def handle_charref(self, name: str) -> None:
+        self.output.append(f"&#{name};")
+
+    def handle_comment(self, data: str) -> None:
+        pass
+
+    def handle_decl(self, decl: str) -> None:
+        self.output.append(f"<!{decl}>")
+
+    def handle_pi(self, data: str) -> None:
+        self.output.append(f"<?{data}>")
+
+    def unknown_decl(self, data: str) -> None:
+        self.output.append(f"<![{data}]>")
+
+
+def minify_html(content: str) -> str:
+    """
+    Strips comments and the indentation DiscordChatExporter lays its markup out
+    with, leaving anything whitespace-sensitive - like message content - alone.
+    """
+    minifier = _Minifier()
+    minifier.feed(content)
+    minifier.close()
+    return "".join(minifier.output)
+
+
+def minify_css(css: str) -> str:
+    css = CSS_COMMENT_REGEX.sub("", css)
+    css = CSS_WHITESPACE_REGEX.sub(" ", css)
+    return CSS_PUNCTUATION_REGEX.sub(r"\1", css).strip()
+
+
+def extract_stylesheets(content: str, html_path: str, stylesheet_folder: str) -> str:
+    """
+    Moves every inline stylesheet into a shared file named after its contents,
+    which is only ever written once no matter how many pages use it.
+    """
+    html_folder = os.path.dirname(html_path)
+
+    def replace(match: re.Match[str]) -> str:
+        css = minify_css(match.group(1)).encode()
+        stylesheet_path = os.path.join(
+            stylesheet_folder, f"{hashlib.sha256(css).hexdigest()[:16]}.css"
+        )
+        if not os.path.exists(stylesheet_path):
+            os.makedirs(stylesheet_folder, exist_ok=True)
+            # several workers may be writing the same stylesheet at once, which
+            # is fine as each writes to its own temporary file
+            with write_atomic(stylesheet_path, "wb") as file:
+                file.write(css)
+
+        relative_path = os.path.relpath(stylesheet_path, html_folder)
+        return f'<link rel="stylesheet" href="{relative_path.replace(os.sep, "/")}">'
+
+    return STYLE_REGEX.sub(replace, content)
+
+
+def process_file(path: str, options: PostProcessOptions) -> tuple[int, int]:
+    """
+    Post-processes the HTML export at `path` in place, returning its size
+    before and after.
+    """
+    with open(path, encoding="utf-8") as file:
+        content = file.read()
+    original_size = os.path.getsize(path)
+
+    if options.stylesheet_folder:
+        content = extract_stylesheets(content, path, options.stylesheet_folder)
+    if options.minify:
+        content = minify_html(content)
+
+    encoded = content.encode()
+    outputs = {path: encoded}
+    if options.compress:
+        # mtime is zeroed so an unchanged page always compresses the same way
+        outputs[f"{path}.gz"] = gzip.compress(encoded, compresslevel=9, mtime=0)
+        if brotli:
+            outputs[f"{path}.br"] = brotli.compress(encoded)
+
+    for output_path, output in outputs.items():
+        with write_atomic(output_path, "wb") as file:
+            file.write(output)
+
+    return original_size, len(encoded)
@@ -0,0 +1,78 @@
+import attrs
+import typing_extensions as typing
+
+from common.config import CONFIG
+
+__all__ = ("PROFILES", "Profile", "get_profile", "load_profiles")
+
+REQUIRED_KEYS = ("archive_location", "github_name", "categories")
+
+
+@attrs.define()
+class Profile:
+    """
+    The settings used to archive one server. Tuning settings a profile doesn't
+    set fall back to the top level of the config.
+    """
+
+    guild_id: int | None = attrs.field()
+    settings: dict[str, typing.Any] = attrs.field()
+
+    @property
+    def archive_location(self) -> str:
+        return self.settings["archive_location"]
+
+    @property
+    def github_name(self) -> str:
+        return self.settings["github_name"]
+
+    @property
+    def categories(self) -> list[dict[str, typing.Any]]:
+        return self.settings["categories"]
+
+    def get(self, key: str, default: typing.Any = None) -> typing.Any:
+        return self.settings.get(key, default)
+
+
+def load_profiles(config: dict[str, typing.Any]) -> list[Profile]:
+    """
+    Reads every `[[profiles]]` table in the config. If the top level has its own
+    categories, it becomes the profile for any server without one.
+
+    Raises ValueError if a profile is missing a required key, or if two
+    profiles share an archive location.
+    """
+    defaults = {key: value for key, value in config.items() if key != "profiles"}
+    # where a server is archived to is never shared with another server
+    shared = {key: value for key, value in defaults.items() if key not in REQUIRED_KEYS}
+    profiles = [
+        Profile(int(profile_settings["guild_id"]), shared | profile_settings)
+        for profile_settings in config.get("profiles", [])
+    ]
+    if "categories" in defaults:
+        profiles.append(Profile(None, defaults))
+
+    archive_locations: set[str] = set()
+    for profile in profiles:
+        name = "default" if profile.guild_id is None else f"guild {profile.guild_id}"
+        for key in REQUIRED_KEYS:
+            if key not in profile.settings:
+                raise ValueError(f"The {name} profile is missing {key}.")
+
+        if profile.archive_location in archive_locations:
+            raise ValueError(
+                f"The {name} profile shares its archive_location with another profile."
+            )
+        archive_locations.add(profile.archive_location)
+
+    return profiles
+
+
+def get_profile(guild_id: int) -> Profile | None:
+    for profile in PROFILES:
+        if profile.guild_id == guild_id:
+            return profile
+    return next((profile for profile in PROFILES if profile.guild_id is None), None)
+
+
+PROFILES = load_profiles(CONFIG)
@@ -0,0 +1,176 @@
+import asyncio
+import collections
+import re
+import time
+from collections.abc import AsyncIterator
+
+import attrs
+import typing_extensions as typing
+
+from common.throttle import RATE_LIMIT_REGEX
+
+if typing.TYPE_CHECKING:
+    from common.throttle import ExportThrottle
+
+__all__ = ("ActiveExport", "ExportProgress", "ExportResult", "iter_lines")
+
+ANSI_ESCAPE_REGEX = re.compile(r"\x1b\[[0-9;?]*[A-Za-z]")
+PERCENT_REGEX = re.compile(r"(\d{1,3}(?:\.\d+)?)\s*%")
+EXPORTED_REGEX = re.compile(r"Successfully exported (\d+) channel")
+FAILED_REGEX = re.compile(r"Failed to export (\d+) channel")
+
+
+async def iter_lines(stream: asyncio.StreamReader) -> AsyncIterator[str]:
+    # progress bars redraw themselves with carriage returns, so those count
+    # as line breaks too
+    buffer = b""
+    while chunk := await stream.read(4096):
+        buffer += chunk
+        *lines, buffer = re.split(rb"[\r\n]", buffer)
+        for line in lines:
+            if cleaned := ANSI_ESCAPE_REGEX.sub("", line.decode(errors="replace")):
+                yield cleaned.strip()
+
+    if cleaned := ANSI_ESCAPE_REGEX.sub("", buffer.decode(errors="replace")):
+        yield cleaned.strip()
+
+
+@attrs.define()
+class ExportResult:
+    label: str = attrs.field()
+    channel_ids: list[int] = attrs.field()
+    return_code: int = attrs.field()
+    duration: float = attrs.field()
+    exported: int = attrs.field()
+    failed: int = attrs.field()
+    messages: int = attrs.field()
+    bytes: int = attrs.field(default=0)
+
+    @property
+    def succeeded(self) -> bool:
+        return self.return_code == 0
+
+
+@attrs.define()
+class ActiveExport:
+    label: str = attrs.field()
+    channel_ids: list[int] = attrs.field()
+    started_at: float = attrs.field(factory=time.monotonic)
+    last_output_at: float = attrs.field(factory=time.monotonic)
+    percent: float | None = attrs.field(default=None)
+    exported: int = attrs.field(default=0)
+    failed: int = attrs.field(default=0)
+    rate_limits: int = attrs.field(default=0)
+    output: collections.deque[str] = attrs.field(
+        factory=lambda: collections.deque(maxlen=20)
+    )
+
+    def feed(self, line: str) -> None:
+        self.last_output_at = time.monotonic()
+        if not line:
+            return
+
+        self.output.append(line)
+        if RATE_LIMIT_REGEX.search(line):
+            self.rate_limits += 1
+
+        if match := EXPORTED_REGEX.search(line):
+            self.exported = int(match.group(1))
+        elif match := FAILED_REGEX.search(line):
+            self.failed = int(match.group(1))
+        elif match := PERCENT_REGEX.search(line):
+            self.percent = float(match.group(1))
+
+
+class ExportProgress:
+    """Keeps track of every export in a run, for reporting back to Discord."""
+
+    def __init__(self) -> None:
+        self.started_at = time.monotonic()
+        self.queued = 0
+        self.active: list[ActiveExport] = []
+        self.results: list[ExportResult] = []
+        # shown at the top of the progress message, like when exports are paused
+        self.notice: str | None = None
+        self.throttle: ExportThrottle | None = None
+
+    @property
+    def messages(self) -> int:
+        return sum(result.messages for result in self.results)
+
+    @property
+    def channels_exported(self) -> int:
+        return sum(result.exported for result in self.results)
+
+    @property
+    def channels_failed(self) -> int:
+        return sum(result.failed for result in self.results)
+
+    def queue(self, amount: int = 1) -> None:
+        self.queued += amount
+
+    def start(self, label: str, channel_ids: list[int]) -> ActiveExport:
+        export = ActiveExport(label, channel_ids)
+        self.active.append(export)
+        return export
+
+    def finish(
+        self,
+        export: ActiveExport,
+        return_code: int,
+        messages: int,
+        size: int = 0,
+    ) -> ExportResult:
+        self.active.remove(export)
+
+        # older cli versions do not print a summary, so fall back to the exit code
+        exported, failed = export.exported, export.failed
+        if not exported and not failed:
+            if return_code == 0:
+                exported = len(export.channel_ids)
+            else:
+                failed = len(export.channel_ids)
+
+        result = ExportResult(
+            export.label,
+            export.channel_ids,
+            return_code,
+            time.monotonic() - export.started_at,
+            exported,
+            failed,
+            messages,
+            size,
+        )
+        self.results.append(result)
+        return result
+
+    def describe(self) -> str:
+        now = time.monotonic()
+        elapsed = now - self.started_at
+        throughput = self.messages / elapsed if elapsed else 0
+
+        lines = [
+            f"Exports: {len(self.results)}/{self.queued} done,"
+            f" {len(self.active)} running",
+            f"Channels: {self.channels_exported} exported,"
+            f" {self.channels_failed} failed",
+            f"Messages: {self.messages:,} (~{throughput:,.1f}/s)",
+            f"Elapsed: {int(elapsed // 60)}m {int(elapsed % 60)}s",
+        ]
+        if self.throttle:
+            lines.append(self.throttle.describe())
+        if self.notice:
+            lines.insert(0, f"**{self.notice}**\n")
+
+        if self.active:
+            lines.append("\nRunning:")
+            for export in self.active:
+                percent = (
+                    f"{export.percent:.0f}%" if export.percent is not None else "?"
+                )
+                lines.append(
+                    f"- `{export.label}` - {percent}, last output"
+                    f" {int(now - export.last_output_at)}s ago"
+                )
+
+        return "\n".join(lines)
@@ -0,0 +1,232 @@
+import asyncio
+import datetime
+import json
+import logging
+import os
+
+import attrs
+
+import common.index as index
+from common.exporter import MAX_ARGUMENT_LENGTH
+from common.files import write_atomic
+from common.manifest import ExportManifest
+from common.models import Category
+
+__all__ = ("GitPublisher", "PublishResult")
+
+logger = logging.getLogger("kgarchivebot")
+
+# never published - the media cache is only there for the cli to reuse
+EXCLUDED_FOLDERS = frozenset({".media_cache", ".incremental", ".search_cache"})
+
+
+@attrs.define()
+class PublishResult:
+    files: int = attrs.field(default=0)
+    bytes: int = attrs.field(default=0)
+    commits: int = attrs.field(default=0)
+
+
+class GitPublisher:
+    """
+    Commits and pushes an archive that lives in a git repository.
+
+    Rather than having git look through the whole archive, the export manifest
+    says which exports changed since the last publish, and only those (plus the
+    indexes and media) are checked and staged. Changes are committed in batches
+    of about `max_batch_size` bytes, each pushed on its own, so no one push has
+    to send a giant packfile.
+    """
+
+    def __init__(
+        self,
+        repo_path: str,
+        *,
+        remote: str | None = None,
+        branch: str | None = None,
+        max_batch_size: int = 100 * 1024 * 1024,
+        executable: str = "git",
+    ) -> None:
+        self.repo_path = repo_path
+        self.remote = remote
+        self.branch = branch
+        self.max_batch_size = max_batch_size
+        self.executable = executable
+        self.state_path = f"{repo_path}/.archive_publish.json"
+
+    async def git(self, *args: str, stdin: bytes | None = None) -> bytes:
+        """
+        Runs git in the archive's repository, returning what it printed.
+
+        Raises RuntimeError if git fails.
+        """
+        process = await asyncio.create_subprocess_exec(
+            self.executable,
+            "--literal-pathspecs",
+            *args,
+            cwd=self.repo_path,
+            stdin=asyncio.subprocess.PIPE if stdin is not None else None,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        stdout, stderr = await process.communicate(stdin)
+        if process.returncode != 0:
+            raise RuntimeError(
+                f"git {args[0]} exited with code {process.returncode}:\n"
+                f"{stderr.decode(errors='replace').strip()}"
+            )
+        return stdout
+
+    def load_published_at(self) -> datetime.datetime | None:
+        if not os.path.exists(self.state_path):
+            return None
+
+        with open(self.state_path, encoding="utf-8") as file:
+            return datetime.datetime.fromisoformat(json.load(file)["published_at"])
+
+    def save_published_at(self, published_at: datetime.datetime) -> None:
+        with write_atomic(self.state_path) as file:
+            json.dump({"published_at": published_at.isoformat()}, file)
+
+    def candidate_paths(
+        self,
+        manifest: ExportManifest,
+        categories: list[Category],
+        since: datetime.datetime | None,
+    ) -> list[str]:
+        # everything here is relative to the repository, and may not exist
+        paths = ["README.md", "media", "styles", "search", "search.html"]
+        paths.extend(
+            os.path.relpath(index.category_index_path(category), self.repo_path)
+            for category in categories
+        )
+
+        for entry in manifest.entries.values():
+            if since and datetime.datetime.fromisoformat(entry.exported_at) < since:
+                continue
+
+            output_path = os.path.relpath(entry.output_path, self.repo_path)
+            paths.extend(
+                (
+                    output_path,
+                    f"{output_path}.gz",
+                    f"{output_path}.br",
+                    f"{output_path.removesuffix('.html')}-pages",
+                )
+            )
+
+        return [path.replace(os.sep, "/") for path in paths]
+
+    async def changed_files(self, paths: list[str]) -> list[tuple[str, int]]:
+        """
+        Asks git which files under `paths` have changed, returning each one
+        alongside its size (or 0 if it was deleted).
+        """
+        chunks: list[list[str]] = [[]]
+        chunk_length = 0
+        for path in paths:
+            if chunks[-1] and chunk_length + len(path) + 1 > MAX_ARGUMENT_LENGTH:
+                chunks.append([])
+                chunk_length = 0
+            chunks[-1].append(path)
+            chunk_length += len(path) + 1
+
+        changed: dict[str, int] = {}
+        for chunk in chunks:
+            output = await self.git(
+                "status",
+                "--porcelain=v1",
+                "-z",
+                "--untracked-files=all",
+                "--",
+                *chunk,
+            )
+
+            entries = iter(output.decode("utf-8", errors="surrogateescape").split("\0"))
+            for entry in entries:
+                if not entry:
+                    continue
+
+                status, path = entry[:2], entry[3:]
+                if "R" in status or "C" in status:
+                    # renames and copies are followed by their original path
+                    next(entries, None)
+                if EXCLUDED_FOLDERS.intersection(path.split("/")):
+                    continue
+
+                full_path = os.path.join(self.repo_path, path)
+                changed[path] = (
+                    os.path.getsize(full_path) if os.path.isfile(full_path) else 0
+                )
+
+        return sorted(changed.items())
+
+    def batch(self, files: list[tuple[str, int]]) -> list[list[tuple[str, int]]]:
+        batches: list[list[tuple[str, int]]] = []
+        current_batch: list[tuple[str, int]] = []
+        current_size = 0
+
+        for path, size in files:
+            if current_batch and current_size + size > self.max_batch_size:
+                batches.append(current_batch)
+                current_batch = []
+                current_size = 0
+
+            current_batch.append((path, size))
+            current_size += size
+
+        if current_batch:
+            batches.append(current_batch)
+        return batches
+
+    async def push(self) -> None:
+        if not self.remote:
+            return
+
+        refspec = f"HEAD:refs/heads/{self.branch}" if self.branch else "HEAD"
+        await self.git("push", "--quiet", self.remote, refspec)
+
+    async def publish(
+        self, manifest: ExportManifest, categories: list[Category]
+    ) -> PublishResult:
+        started_at = datetime.datetime.now(datetime.timezone.utc)
+        since = await asyncio.to_thread(self.load_published_at)
+
+        paths = self.candidate_paths(manifest, categories, since)
+        files = await self.changed_files(paths)
+        batches = self.batch(files)
+        result = PublishResult()
+
+        for batch_num, batch in enumerate(batches, start=1):
+            await self.git(
+                "add",
+                "--all",
+                "--pathspec-from-file=-",
+                "--pathspec-file-nul",
+                stdin="\0".join(path for path, _ in batch).encode(
+                    "utf-8", errors="surrogateescape"
+                ),
+            )
+
+            message = f"Update archive ({len(batch):,} file(s))"
+            if len(batches) > 1:
+                message += f" [{batch_num}/{len(batches)}]"
+            await self.git("commit", "--quiet", "-m", message)
+            await self.push()
+
+            result.files += len(batch)
+            result.bytes += sum(size for _, size in batch)
+            result.commits += 1
+            logger.info(
+                "Published batch %s/%s of %s file(s)",
+                batch_num,
+                len(batches),
+                len(batch),
+            )
+
+        if not batches:
+            # earlier commits might not have made it to the remote
+            await self.push()
+
+        await asyncio.to_thread(self.save_published_at, started_at)
+        return result
@@ -0,0 +1,635 @@
+"""
+Renders DiscordChatExporter's JSON exports into HTML.
+
+Exports made with `export_format = "json"` keep their JSON around, so changing
+anything here only means rendering them again - not exporting everything from
+Discord again. JSON exports are read one message at a time, so even the biggest
+channel only ever has a page or so of messages in memory.
+
+The HTML has the same structure as the CLI's own where it counts - message
+groups, message ids and the postamble - so merging, pagination,
+post-processing, the media store and search all work on it too. The markup
+itself lives in common/templates.
+"""
+
+import datetime
+import html
+import json
+import os
+import re
+import string
+from collections.abc import Iterable, Iterator
+
+import typing_extensions as typing
+
+from common.chatlog import MESSAGE_GROUP_START
+from common.files import write_atomic
+
+__all__ = (
+    "ChatlogRenderer",
+    "JsonExportReader",
+    "JsonExportWriter",
+    "merge_json_exports",
+    "render_export",
+)
+
+# the cli starts a new group after this long, too
+GROUP_GAP = datetime.timedelta(minutes=7)
+IMAGE_EXTENSIONS = frozenset({"png", "jpg", "jpeg", "gif", "webp"})
+VIDEO_EXTENSIONS = frozenset({"mp4", "webm", "mov"})
+AUDIO_EXTENSIONS = frozenset({"mp3", "ogg", "wav", "flac", "m4a"})
+# everything else, like pins and joins, is a system message
+REGULAR_MESSAGE_TYPES = frozenset({"Default", "Reply"})
+MESSAGES_KEY_REGEX = re.compile(r'"messages"\s*:\s*\[')
+READ_SIZE = 65536
+
+CODE_BLOCK_REGEX = re.compile(r"```(?:[\w+-]*\n)?(.*?)```", re.DOTALL)
+INLINE_CODE_REGEX = re.compile(r"(`+)(.+?)\1", re.DOTALL)
+MASKED_LINK_REGEX = re.compile(r"\[([^\[\]]+)\]\((https?://[^\s)]+)\)")
+# links wrapped in <> don't get embeds on discord, but are still links
+URL_REGEX = re.compile(r"<(https?://[^\s>]+)>|https?://[^\s<>\"]*[^\s<>\"'.,:;!?)\]]")
+EMOJI_NAME_REGEX = re.compile(r":([\w~-]+):")
+PLACEHOLDER_REGEX = re.compile(r"\x00(\d+)\x00")
+HEX_COLOR_REGEX = re.compile(r"#[0-9a-fA-F]{6}")
+MARKDOWN_HEADER_REGEX = re.compile(r"(#{1,3}) (.+)")
+QUOTE_REGEX = re.compile(r"> (.*)")
+# longest first, so ** is never read as two *
+INLINE_DELIMITER_REGEX = re.compile(r"\*\*|__|~~|\|\||\*|_")
+WORD_REGEX = re.compile(r"\w")
+INLINE_TEMPLATES = {
+    "**": "bold",
+    "__": "underline",
+    "*": "italic",
+    "_": "italic",
+    "~~": "strikethrough",
+    "||": "spoiler",
+}
+
+TEMPLATE_DIRECTORY = os.path.join(os.path.dirname(__file__), "templates")
+TEMPLATE_REGEX = re.compile(r'<template id="(\w+)">\n(.*?)\n</template>', re.DOTALL)
+
+
+def _read_template(filename: str) -> str:
+    with open(os.path.join(TEMPLATE_DIRECTORY, filename), encoding="utf-8") as file:
+        return file.read()
+
+
+# the page is split where the messages go, as they're written a chunk at a time
+PREAMBLE, POSTAMBLE = (
+    string.Template(part) for part in _read_template("chatlog.html").split("$messages")
+)
+TEMPLATES = {
+    match.group(1): string.Template(match.group(2))
+    for match in TEMPLATE_REGEX.finditer(_read_template("message.html"))
+}
+
+
+def _fill(template: str, **values: typing.Any) -> str:
+    return TEMPLATES[template].substitute(values)
+
+
+def _placeholder(stash: list[str], rendered: str) -> str:
+    stash.append(rendered)
+    return f"\x00{len(stash) - 1}\x00"
+
+
+def _can_open(delimiter: str, before: str, after: str) -> bool:
+    if delimiter == "*":
+        return not after.isspace()
+    if delimiter == "_":
+        # so snake_case stays as it is
+        return not WORD_REGEX.match(before)
+    return True
+
+
+def _can_close(delimiter: str, before: str, after: str) -> bool:
+    if delimiter == "*":
+        return not before.isspace()
+    if delimiter == "_":
+        return not WORD_REGEX.match(after)
+    return True
+
+
+def _unwind(stack: list[tuple[str, list[str]]]) -> None:
+    # a span that never got closed was just text all along
+    delimiter, rendered = stack.pop()
+    stack[-1][1].append(delimiter)
+    stack[-1][1].extend(rendered)
+
+
+def _render_inline(content: str) -> str:
+    # every open span, with what's been rendered inside it so far - a span is
+    # only ever closed with everything opened inside it, so tags always nest
+    stack: list[tuple[str, list[str]]] = [("", [])]
+    position = 0
+
+    for match in INLINE_DELIMITER_REGEX.finditer(content):
+        stack[-1][1].append(html.escape(content[position : match.start()], quote=False))
+        position = match.end()
+        delimiter = match.group()
+        before = content[match.start() - 1] if match.start() else " "
+        after = content[match.end()] if match.end() < len(content) else " "
+
+        open_index = next(
+            (
+                index
+                for index in range(len(stack) - 1, 0, -1)
+                if stack[index][0] == delimiter
+            ),
+            None,
+        )
+        if (
+            open_index is not None
+            and any(stack[-1][1])
+            and _can_close(delimiter, before, after)
+        ):
+            # like "**a *b** c*" - the * in between is left as it is
+            while len(stack) > open_index + 1:
+                _unwind(stack)
+            _, rendered = stack.pop()
+            stack[-1][1].append(
+                _fill(INLINE_TEMPLATES[delimiter], text="".join(rendered))
+            )
+        elif _can_open(delimiter, before, after):
+            stack.append((delimiter, []))
+        else:
+            stack[-1][1].append(delimiter)
+
+    stack[-1][1].append(html.escape(content[position:], quote=False))
+    while len(stack) > 1:
+        _unwind(stack)
+    return "".join(stack[0][1])
+
+
+def _render_blocks(content: str) -> str:
+    # headers and quotes are whole lines, and spans never go past them
+    rendered: list[str] = []
+    text: list[str] = []
+    lines = content.split("\n")
+
+    for index, line in enumerate(lines):
+        if match := MARKDOWN_HEADER_REGEX.fullmatch(line):
+            block = _fill(
+                "markdown_header",
+                level=len(match.group(1)),
+                text=_render_inline(match.group(2)),
+            )
+        elif match := QUOTE_REGEX.fullmatch(line):
+            block = _fill("quote", text=_render_inline(match.group(1)))
+        else:
+            text.append(line if index == len(lines) - 1 else f"{line}\n")
+            continue
+
+        # the block takes the place of its line break, too
+        rendered.append(_render_inline("".join(text)))
+        rendered.append(block)
+        text.clear()
+
+    rendered.append(_render_inline("".join(text)))
+    return "".join(rendered)
+
+
+def render_markdown(
+    content: str, emojis: dict[str, dict[str, typing.Any]] | None = None
+) -> str:
+    """
+    Renders Discord's flavour of markdown into HTML, escaping everything else.
+    `emojis` maps the names of custom emojis to their entry in the export, as
+    exports write them out as `:name:`.
+    """
+    # code and links are rendered first and set aside, so nothing inside them is
+    # mistaken for formatting
+    stash: list[str] = []
+    content = CODE_BLOCK_REGEX.sub(
+        lambda match: _placeholder(
+            stash, _fill("code_block", code=html.escape(match.group(1).strip("\n")))
+        ),
+        content,
+    )
+    content = INLINE_CODE_REGEX.sub(
+        lambda match: _placeholder(
+            stash, _fill("inline_code", code=html.escape(match.group(2)))
+        ),
+        content,
+    )
+    content = MASKED_LINK_REGEX.sub(
+        lambda match: _placeholder(
+            stash,
+            _fill(
+                "link",
+                url=html.escape(match.group(2)),
+                text=html.escape(match.group(1)),
+            ),
+        ),
+        content,
+    )
+    content = URL_REGEX.sub(
+        lambda match: _placeholder(
+            stash,
+            _fill(
+                "link",
+                url=html.escape(url := match.group(1) or match.group(0)),
+                text=html.escape(url),
+            ),
+        ),
+        content,
+    )
+    if emojis:
+        content = EMOJI_NAME_REGEX.sub(
+            lambda match: (
+                _placeholder(stash, _render_emoji(emoji))
+                if (emoji := emojis.get(match.group(1)))
+                else match.group(0)
+            ),
+            content,
+        )
+
+    return PLACEHOLDER_REGEX.sub(
+        lambda match: stash[int(match.group(1))], _render_blocks(content)
+    )
+
+
+def _render_emoji(emoji: dict[str, typing.Any]) -> str:
+    name = html.escape(emoji.get("name") or "")
+    if not (image_url := emoji.get("imageUrl")):
+        return name
+    return _fill("emoji", url=html.escape(image_url), name=name)
+
+
+def _color_style(color: str | None, css_property: str) -> str:
+    if not color or not HEX_COLOR_REGEX.fullmatch(color):
+        return ""
+    return _fill("color_style", property=css_property, color=color)
+
+
+def _render_attachment(attachment: dict[str, typing.Any]) -> str:
+    source = html.escape(attachment["url"])
+    filename = html.escape(attachment["fileName"])
+    extension = attachment["fileName"].rsplit(".", 1)[-1].lower()
+
+    if extension in IMAGE_EXTENSIONS:
+        return _fill("image_attachment", url=source, filename=filename)
+    if extension in VIDEO_EXTENSIONS:
+        return _fill("video_attachment", url=source)
+    if extension in AUDIO_EXTENSIONS:
+        return _fill("audio_attachment", url=source)
+    return _fill("attachment", url=source, filename=filename)
+
+
+def _render_embed(embed: dict[str, typing.Any]) -> str:
+    parts: list[str] = []
+
+    if author_name := (embed.get("author") or {}).get("name"):
+        parts.append(_fill("embed_author", name=html.escape(author_name)))
+    if title := embed.get("title"):
+        title = render_markdown(title)
+        if url := embed.get("url"):
+            title = _fill("link", url=html.escape(url), text=title)
+        parts.append(_fill("embed_title", title=title))
+    if description := embed.get("description"):
+        parts.append(
+            _fill("embed_description", description=render_markdown(description))
+        )
+
+    if fields := embed.get("fields"):
+        parts.append(
+            _fill(
+                "embed_fields",
+                fields="".join(
+                    _fill(
+                        "inline_embed_field"
+                        if field.get("isInline")
+                        else "embed_field",
+                        name=render_markdown(field.get("name") or ""),
+                        value=render_markdown(field.get("value") or ""),
+                    )
+                    for field in fields
+                ),
+            )
+        )
+
+    # the cli puts every image of a gallery-style embed in images, and the
+    # first one in image too
+    images = embed.get("images") or ([embed["image"]] if embed.get("image") else [])
+    if thumbnail := embed.get("thumbnail"):
+        images = [*images, thumbnail]
+    parts.extend(
+        _fill("embed_image", url=html.escape(image["url"]))
+        for image in images
+        if image.get("url")
+    )
+
+    if footer := (embed.get("footer") or {}).get("text"):
+        parts.append(_fill("embed_footer", text=html.escape(footer)))
+
+    if not parts:
+        return ""
+
+    return _fill(
+        "embed",
+        style=_color_style(embed.get("color"), "border-color"),
+        body="".join(parts),
+    )
+
+
+def render_message(message: dict[str, typing.Any], *, with_header: bool) -> str:
+    """Renders a message, as DiscordChatExporter's JSON export has it."""
+    message_id = message["id"]
+    author = message["author"]
+    timestamp = datetime.datetime.fromisoformat(message["timestamp"])
+    emojis = {
+        emoji["name"]: emoji
+        for emoji in message.get("inlineEmojis", [])
+        if emoji.get("id") and emoji.get("name")
+    }
+    parts: list[str] = []
+    author_name = html.escape(author.get("nickname") or author["name"])
+    author_style = _color_style(author.get("color"), "color")
+    permalink = _fill(
+        "permalink",
+        message_id=message_id,
+        timestamp=f"{timestamp.astimezone(datetime.timezone.utc):%Y-%m-%d %H:%M}",
+    )
+
+    if message.get("type", "Default") not in REGULAR_MESSAGE_TYPES:
+        # like pins and joins, which the cli shows as a single line
+        parts.append(
+            _fill(
+                "system_notification",
+                author_style=author_style,
+                author_id=author["id"],
+                author_name=author_name,
+                content=html.escape(message.get("content") or ""),
+                permalink=permalink,
+            )
+        )
+        return _fill("message", message_id=message_id, body="\n".join(parts))
+
+    if reference_id := (message.get("reference") or {}).get("messageId"):
+        parts.append(_fill("reply", message_id=reference_id))
+
+    if with_header:
+        if avatar_url := author.get("avatarUrl"):
+            parts.append(_fill("avatar", url=html.escape(avatar_url)))
+        parts.append(
+            _fill(
+                "header",
+                author_style=author_style,
+                author_username=html.escape(author["name"]),
+                author_id=author["id"],
+                author_name=author_name,
+                bot_tag=_fill("bot_tag") if author.get("isBot") else "",
+                permalink=permalink,
+            )
+        )
+
+    if content := message.get("content"):
+        parts.append(
+            _fill(
+                "content",
+                content=render_markdown(content, emojis),
+                edited=_fill("edited") if message.get("timestampEdited") else "",
+            )
+        )
+
+    parts.extend(
+        _render_attachment(attachment) for attachment in message.get("attachments", [])
+    )
+    parts.extend(
+        rendered
+        for embed in message.get("embeds", [])
+        if (rendered := _render_embed(embed))
+    )
+
+    for sticker in message.get("stickers", []):
+        name = html.escape(sticker.get("name") or "")
+        if sticker.get("format") != "Lottie" and sticker.get("sourceUrl"):
+            parts.append(
+                _fill("sticker", url=html.escape(sticker["sourceUrl"]), name=name)
+            )
+        else:
+            # animated lottie stickers need a player, so only their name is shown
+            parts.append(_fill("sticker_name", name=name))
+
+    if reactions := message.get("reactions"):
+        parts.append(
+            _fill(
+                "reactions",
+                reactions="\n".join(
+                    _fill(
+                        "reaction",
+                        emoji=_render_emoji(reaction["emoji"]),
+                        count=reaction.get("count", 1),
+                    )
+                    for reaction in reactions
+                ),
+            )
+        )
+
+    return _fill("message", message_id=message_id, body="\n".join(parts))
+
+
+class ChatlogRenderer:
+    """
+    Renders messages into HTML a chunk at a time, grouping consecutive messages
+    from the same author like the CLI does.
+    """
+
+    def __init__(self) -> None:
+        self.message_count = 0
+        self.last_author: str | None = None
+        self.last_timestamp: datetime.datetime | None = None
+        self.last_system = False
+        self.group_open = False
+
+    @staticmethod
+    def preamble(title: str) -> str:
+        return PREAMBLE.substitute(title=html.escape(title))
+
+    def render(self, messages: Iterable[dict[str, typing.Any]]) -> str:
+        chunk: list[str] = []
+        for message in messages:
+            timestamp = datetime.datetime.fromisoformat(message["timestamp"])
+            system = message.get("type", "Default") not in REGULAR_MESSAGE_TYPES
+            # like the cli, system messages and replies always start a new group
+            new_group = (
+                system
+                or self.last_system
+                or message.get("type") == "Reply"
+                or message["author"]["id"] != self.last_author
+                or self.last_timestamp is None
+                or timestamp - self.last_timestamp > GROUP_GAP
+            )
+            if new_group:
+                if self.group_open:
+                    chunk.append("</div>")
+                chunk.append(MESSAGE_GROUP_START)
+                self.group_open = True
+
+            chunk.append(render_message(message, with_header=new_group))
+            self.last_author = message["author"]["id"]
+            self.last_timestamp = timestamp
+            self.last_system = system
+            self.message_count += 1
+
+        return "\n".join(chunk) + "\n" if chunk else ""
+
+    def postamble(self) -> str:
+        closing = "</div>\n" if self.group_open else ""
+        return closing + POSTAMBLE.substitute(message_count=f"{self.message_count:,}")
+
+
+class JsonExportReader:
+    """
+    Reads a JSON export made by DiscordChatExporter, or by `JsonExportWriter`,
+    without loading all of it into memory.
+
+    `header` holds everything that comes before the messages, like the guild and
+    the channel, while `messages` goes through the messages one by one.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.file = open(path, encoding="utf-8")  # noqa: SIM115
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.position = 0
+
+        while not (match := MESSAGES_KEY_REGEX.search(self.buffer)):
+            if not self._read():
+                self.close()
+                raise ValueError(f"{path} does not look like a JSON export.")
+
+        # the header is everything up to the messages - closing it off early
+        # makes it valid json on its own
+        self.header: dict[str, typing.Any] = json.loads(
+            self.buffer[: match.start()].rstrip().removesuffix(",") + "}"
+        )
+        self.buffer = self.buffer[match.end() :]
+
+    def __enter__(self) -> typing.Self:
+        return self
+
+    def __exit__(self, *_: typing.Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.file.close()
+
+    def _read(self) -> bool:
+        # drops whatever has already been decoded, so the buffer stays small
+        data = self.file.read(READ_SIZE)
+        self.buffer = self.buffer[self.position :] + data
+        self.position = 0
+        return bool(data)
+
+    def messages(self) -> Iterator[dict[str, typing.Any]]:
+        while True:
+            # skips over whitespace and the commas between messages
+            while True:
+                while (
+                    self.position < len(self.buffer)
+                    and self.buffer[self.position] in " \t\r\n,"
+                ):
+                    self.position += 1
+                if self.position < len(self.buffer) or not self._read():
+                    break
+
+            if self.position >= len(self.buffer):
+                raise ValueError("The JSON export ended partway through.")
+            if self.buffer[self.position] == "]":
+                return
+
+            try:
+                message, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                # the message is cut off by the end of the buffer
+                if not self._read():
+                    raise
+                continue
+
+            self.position = end
+            yield message
+
+
+class JsonExportWriter:
+    """
+    Writes a JSON export in the same shape as DiscordChatExporter's, one message
+    at a time.
+    """
+
+    def __init__(self, file: typing.TextIO, header: dict[str, typing.Any]) -> None:
+        self.file = file
+        self.message_count = 0
+
+        header_json = json.dumps(header, ensure_ascii=False)
+        self.file.write(f'{header_json.removesuffix("}")}, "messages": [\n')
+
+    def write(self, messages: Iterable[dict[str, typing.Any]]) -> None:
+        for message in messages:
+            if self.message_count:
+                self.file.write(",\n")
+            self.file.write(json.dumps(message, ensure_ascii=False))
+            self.message_count += 1
+
+    def close(self) -> None:
+        self.file.write(f'\n], "messageCount": {self.message_count}}}\n')
+
+
+def _title(header: dict[str, typing.Any]) -> str:
+    channel = header.get("channel") or {}
+    if category := channel.get("category"):
+        return f"{category} / {channel.get('name', '')}"
+    return channel.get("name", "")
+
+
+def render_export(json_path: str, html_path: str) -> int:
+    """
+    Renders the JSON export at `json_path` into `html_path`, returning how many
+    messages there were. Meant to be run in a process pool.
+    """
+    renderer = ChatlogRenderer()
+
+    with JsonExportReader(json_path) as reader, write_atomic(html_path) as file:
+        file.write(renderer.preamble(_title(reader.header)))
+
+        batch: list[dict[str, typing.Any]] = []
+        for message in reader.messages():
+            batch.append(message)
+            if len(batch) >= 500:
+                file.write(renderer.render(batch))
+                batch.clear()
+
+        file.write(renderer.render(batch))
+        file.write(renderer.postamble())
+
+    return renderer.message_count
+
+
+def merge_json_exports(existing_path: str, new_path: str) -> None:
+    """
+    Appends the messages of the JSON export at `new_path` to the JSON export at
+    `existing_path`, in place. Messages the existing export already has are
+    left out.
+    """
+    last_id = 0
+
+    def existing_messages() -> Iterator[dict[str, typing.Any]]:
+        nonlocal last_id
+        for message in existing.messages():
+            last_id = int(message["id"])
+            yield message
+
+    with (
+        JsonExportReader(existing_path) as existing,
+        JsonExportReader(new_path) as new,
+        write_atomic(existing_path) as file,
+    ):
+        header = existing.header
+        header.pop("messageCount", None)
+        writer = JsonExportWriter(file, header)
+        writer.write(existing_messages())
+        # ids only ever go up, so anything up to the last one is already there
+        writer.write(
+            message for message in new.messages() if int(message["id"]) > last_id
+        )
+        writer.close()
@@ -0,0 +1,93 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable, Iterable
+
+import typing_extensions as typing
+
+from common.archive_queue import FairLimiter
+
+__all__ = ("ExportScheduler",)
+
+T = typing.TypeVar("T")
+
+
+class ExportScheduler:
+    """
+    Runs export jobs concurrently, with at most `max_concurrent` of them running
+    at any given time. That limit can be changed while jobs are running.
+
+    Jobs may depend on other jobs - a job will only start once everything it
+    depends on has finished.
+
+    If a `pool` is given, every job also has to get a slot from it under
+    `pool_key`, so several schedulers can share one set of workers fairly.
+
+    If a `gate` is given, it's awaited before every job starts, and can hold
+    jobs back for as long as it needs to.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int,
+        *,
+        pool: FairLimiter | None = None,
+        pool_key: Hashable = None,
+        gate: Callable[[], Awaitable[None]] | None = None,
+    ) -> None:
+        if max_concurrent < 1:
+            raise ValueError("max_concurrent must be at least 1.")
+
+        self.max_concurrent = max_concurrent
+        self.limiter = FairLimiter(max_concurrent)
+        self.pool = pool
+        self.pool_key = pool_key
+        self.gate = gate
+        self.jobs: list[asyncio.Task] = []
+
+    def submit(
+        self,
+        coro_func: Callable[[], Awaitable[T]],
+        *,
+        depends_on: Iterable[asyncio.Task] = (),
+        bounded: bool = True,
+    ) -> "asyncio.Task[T]":
+        # unbounded jobs are for cheap bookkeeping that should not take up
+        # a slot meant for an actual export
+        task = asyncio.create_task(self._run(coro_func, tuple(depends_on), bounded))
+        self.jobs.append(task)
+        return task
+
+    async def _run(
+        self,
+        coro_func: Callable[[], Awaitable[T]],
+        depends_on: tuple[asyncio.Task, ...],
+        bounded: bool,
+    ) -> T:
+        if depends_on:
+            await asyncio.gather(*depends_on)
+
+        if not bounded:
+            return await coro_func()
+
+        async with self.limiter.slot(None):
+            if self.gate:
+                # waited on before taking a slot from the pool, so a held back
+                # job doesn't hold up other schedulers too
+                await self.gate()
+
+            if not self.pool:
+                return await coro_func()
+
+            async with self.pool.slot(self.pool_key):
+                return await coro_func()
+
+    def resize(self, max_concurrent: int) -> None:
+        self.max_concurrent = max_concurrent
+        self.limiter.set_limit(max_concurrent)
+
+    async def join(self) -> None:
+        # let every job finish before raising, so that no export is left running
+        # in the background
+        results = await asyncio.gather(*self.jobs, return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
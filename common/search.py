@@ -0,0 +1,397 @@
+"""
+A full-text search index for the archive, searched entirely in the browser.
+
+Each category gets its own index under `search/<internal_name>/`:
+* `docs/<id>.json` - every message in a channel or thread, as its id, author,
+  a snippet and which page it's on
+* `index/<shard>.json` - which messages every word appears in, sharded by the
+  word's first character so the page only fetches what a query needs
+
+Parsing pages is the expensive part, so what each export was parsed into is
+cached in `.search_cache`, and only exports whose hash changed get re-parsed.
+"""
+
+import html.parser
+import json
+import os
+import re
+
+import typing_extensions as typing
+
+from common.chatlog import load_pages
+from common.files import write_atomic
+from common.index import write_if_changed
+from common.models import Category, Channel, ExportTarget
+from common.postprocess import VOID_ELEMENTS
+
+__all__ = (
+    "SHARD_COUNT",
+    "build_category_index",
+    "cache_path",
+    "cached_hash",
+    "docs_path",
+    "export_pages",
+    "index_export",
+    "save_export_index",
+    "shard_for",
+    "target_name",
+    "tokenize",
+    "write_search_page",
+)
+
+# the search page has to agree with these, so change them there too
+SHARD_COUNT = 32
+TOKEN_REGEX = re.compile(r"\w+")
+MIN_TOKEN_LENGTH = 2
+SNIPPET_LENGTH = 200
+
+WHITESPACE_REGEX = re.compile(r"\s+")
+
+SEARCH_PAGE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>Search</title>
+<style>
+body { font-family: sans-serif; max-width: 50rem; margin: 2rem auto; padding: 0 1rem; }
+input, select { font-size: 1rem; padding: 0.25rem; }
+li { margin: 0.75rem 0; }
+.where { color: #666; font-size: 0.9rem; }
+</style>
+</head>
+<body>
+<h1>Search</h1>
+<form id="search">
+<input id="query" type="search" placeholder="Search messages" autofocus>
+<select id="category"></select>
+<button type="submit">Search</button>
+</form>
+<p id="status"></p>
+<ol id="results"></ol>
+<script>
+const SHARD_COUNT = 32;
+const MIN_TOKEN_LENGTH = 2;
+const MAX_RESULTS = 200;
+const cache = new Map();
+
+async function fetchJson(url) {
+  if (!cache.has(url)) {
+    cache.set(url, fetch(url).then((response) => (response.ok ? response.json() : {})));
+  }
+  return cache.get(url);
+}
+
+function tokenize(text) {
+  const tokens = text.toLowerCase().match(/[\\p{L}\\p{N}_]+/gu) || [];
+  return [...new Set(tokens.filter((token) => token.length >= MIN_TOKEN_LENGTH))];
+}
+
+async function lookup(category, token, prefix) {
+  const shard = await fetchJson(
+    `search/${category}/index/${token.codePointAt(0) % SHARD_COUNT}.json`
+  );
+  // every message the token - or any word it starts, if it's a prefix - is in
+  const found = new Set();
+  for (const [word, postings] of Object.entries(shard)) {
+    if (word === token || (prefix && word.startsWith(token))) {
+      for (const [targetId, ...indexes] of postings) {
+        for (const index of indexes) found.add(`${targetId}:${index}`);
+      }
+    }
+  }
+  return found;
+}
+
+async function searchCategory(category, tokens) {
+  let matches = null;
+  for (const [i, token] of tokens.entries()) {
+    // the last word is still being typed, so it's matched as a prefix
+    const found = await lookup(category, token, i === tokens.length - 1);
+    matches = matches === null ? found : new Set([...matches].filter((m) => found.has(m)));
+    if (!matches.size) break;
+  }
+  return [...(matches || [])].map((match) => [category, ...match.split(":")]);
+}
+
+async function search(event) {
+  event.preventDefault();
+  const status = document.getElementById("status");
+  const results = document.getElementById("results");
+  results.replaceChildren();
+
+  const tokens = tokenize(document.getElementById("query").value);
+  if (!tokens.length) {
+    status.textContent = "";
+    return;
+  }
+  status.textContent = "Searching...";
+
+  const selected = document.getElementById("category").value;
+  const categories = await fetchJson("search/categories.json");
+  const toSearch = selected ? [selected] : categories.map((c) => c.internal_name);
+  const names = Object.fromEntries(categories.map((c) => [c.internal_name, c.name]));
+
+  const matches = (await Promise.all(toSearch.map((c) => searchCategory(c, tokens)))).flat();
+  status.textContent = `${matches.length.toLocaleString()} message(s) found`;
+
+  for (const [category, targetId, index] of matches.slice(0, MAX_RESULTS)) {
+    const docs = await fetchJson(`search/${category}/docs/${targetId}.json`);
+    const [messageId, author, snippet, page] = docs.messages[index];
+
+    const item = document.createElement("li");
+    const link = document.createElement("a");
+    link.href = `${docs.pages[page]}#chatlog__message-container-${messageId}`;
+    link.textContent = author ? `${author}: ${snippet}` : snippet;
+    const where = document.createElement("div");
+    where.className = "where";
+    where.textContent = `${names[category]} / ${docs.name}`;
+    item.append(link, where);
+    results.append(item);
+  }
+}
+
+fetchJson("search/categories.json").then((categories) => {
+  const select = document.getElementById("category");
+  select.append(new Option("All categories", ""));
+  for (const category of categories) {
+    select.append(new Option(category.name, category.internal_name));
+  }
+});
+document.getElementById("search").addEventListener("submit", search);
+</script>
+</body>
+</html>
+"""
+
+
+class _MessageParser(html.parser.HTMLParser):
+    def __init__(self) -> None:
+        super().__init__()
+        self.messages: list[tuple[int, str, str]] = []
+        self.open_elements: list[str] = []
+        self.group_author = ""
+        self.message_id: int | None = None
+        self.message_author = ""
+        self.content: list[str] = []
+        # how deep the element whose text is being collected is, if any
+        self.author_depth: int | None = None
+        self.author: list[str] = []
+        self.content_depth: int | None = None
+
+    def finish_message(self) -> None:
+        if self.message_id is not None:
+            text = WHITESPACE_REGEX.sub(" ", "".join(self.content)).strip()
+            self.messages.append((self.message_id, self.message_author, text))
+        self.message_id = None
+        self.content = []
+
+    def handle_starttag(
+        self, tag: str, tag_attrs: list[tuple[str, str | None]]
+    ) -> None:
+        if tag in VOID_ELEMENTS:
+            return
+
+        self.open_elements.append(tag)
+        attributes = dict(tag_attrs)
+        classes = (attributes.get("class") or "").split()
+
+        if "chatlog__message-group" in classes:
+            self.finish_message()
+            self.group_author = ""
+        elif "chatlog__message-container" in classes:
+            self.finish_message()
+            if message_id := attributes.get("data-message-id"):
+                self.message_id = int(message_id)
+                # follow-up messages don't repeat their author
+                self.message_author = self.group_author
+        elif "chatlog__author" in classes and self.author_depth is None:
+            self.author_depth = len(self.open_elements)
+            self.author = []
+        elif "chatlog__content" in classes and self.content_depth is None:
+            self.content_depth = len(self.open_elements)
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag not in self.open_elements:
+            return
+
+        while self.open_elements:
+            depth = len(self.open_elements)
+            open_tag = self.open_elements.pop()
+
+            if depth == self.author_depth:
+                self.group_author = "".join(self.author).strip()
+                self.message_author = self.group_author
+                self.author_depth = None
+            elif depth == self.content_depth:
+                self.content.append(" ")
+                self.content_depth = None
+
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data: str) -> None:
+        if self.author_depth is not None:
+            self.author.append(data)
+        elif self.content_depth is not None:
+            self.content.append(data)
+
+    def close(self) -> None:
+        super().close()
+        self.finish_message()
+
+
+def tokenize(text: str) -> set[str]:
+    return {
+        token
+        for token in TOKEN_REGEX.findall(text.lower())
+        if len(token) >= MIN_TOKEN_LENGTH
+    }
+
+
+def shard_for(token: str) -> int:
+    return ord(token[0]) % SHARD_COUNT
+
+
+def cache_path(target: ExportTarget) -> str:
+    return f"{target.profile.archive_location}/.search_cache/{target.id}.json"
+
+
+def docs_path(target: ExportTarget) -> str:
+    return (
+        f"{target.profile.archive_location}/search/{target.category.internal_name}"
+        f"/docs/{target.id}.json"
+    )
+
+
+def cached_hash(target: ExportTarget) -> str | None:
+    # kept apart from the cached index so checking it doesn't mean loading it
+    hash_path = f"{cache_path(target)}.hash"
+    if not os.path.exists(hash_path):
+        return None
+
+    with open(hash_path, encoding="utf-8") as file:
+        return file.read().strip()
+
+
+def save_export_index(
+    target: ExportTarget,
+    export_hash: str,
+    docs: dict[str, typing.Any],
+    tokens: dict[str, list[int]],
+) -> None:
+    for path, data in ((docs_path(target), docs), (cache_path(target), tokens)):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with write_atomic(path) as file:
+            json.dump(data, file, separators=(",", ":"))
+
+    # written last, so a crash part way through means the export is re-parsed
+    write_if_changed(f"{cache_path(target)}.hash", export_hash)
+
+
+def index_export(
+    page_paths: list[str], page_urls: list[str], name: str
+) -> tuple[dict[str, typing.Any], dict[str, list[int]]]:
+    """
+    Parses every page of an export, returning the messages in it and, for
+    every word, the positions of the messages it appears in.
+
+    This is run in worker processes, so it only takes and returns plain data.
+    """
+    messages: list[list[typing.Any]] = []
+    tokens: dict[str, list[int]] = {}
+
+    for page, page_path in enumerate(page_paths):
+        parser = _MessageParser()
+        with open(page_path, encoding="utf-8") as file:
+            # pages can be huge, so they're fed in a bit at a time
+            for chunk in iter(lambda: file.read(1024 * 1024), ""):
+                parser.feed(chunk)
+        parser.close()
+
+        for message_id, author, text in parser.messages:
+            index = len(messages)
+            # ids are kept as strings, as javascript can't hold snowflakes exactly
+            messages.append([str(message_id), author, text[:SNIPPET_LENGTH], page])
+            for token in tokenize(f"{author} {text}"):
+                tokens.setdefault(token, []).append(index)
+
+    return {"name": name, "pages": page_urls, "messages": messages}, tokens
+
+
+def export_pages(target: ExportTarget) -> tuple[list[str], list[str]]:
+    # the paths of every page of an export, and their urls relative to the
+    # search page
+    archive_location = target.profile.archive_location
+    if pages := load_pages(target.pages_path):
+        paths = [f"{target.pages_path}/{page.number}.html" for page in pages]
+    else:
+        paths = [target.path]
+
+    urls = [
+        os.path.relpath(path, archive_location).replace(os.sep, "/") for path in paths
+    ]
+    return paths, urls
+
+
+def target_name(target: ExportTarget) -> str:
+    if isinstance(target, Channel):
+        return target.proper_name
+    return f"{target.channel.proper_name} / {target.name}"
+
+
+def build_category_index(category: Category) -> int:
+    """
+    Merges the cached index of every export in the category into its shards,
+    writing only the shards that changed. Returns how many were written.
+    """
+    search_folder = (
+        f"{category.profile.archive_location}/search/{category.internal_name}"
+    )
+    os.makedirs(f"{search_folder}/index", exist_ok=True)
+
+    shards: list[dict[str, list[list[int]]]] = [{} for _ in range(SHARD_COUNT)]
+    target_ids: set[str] = set()
+
+    for channel in category.channels:
+        for target in (channel, *channel.threads):
+            if not os.path.exists(cache_path(target)):
+                continue
+
+            with open(cache_path(target), encoding="utf-8") as file:
+                tokens: dict[str, list[int]] = json.load(file)
+
+            target_ids.add(str(target.id))
+            for token, indexes in tokens.items():
+                shards[shard_for(token)].setdefault(token, []).append(
+                    [str(target.id), *indexes]
+                )
+
+    # channels and threads that have since been deleted drop out of the search
+    docs_folder = f"{search_folder}/docs"
+    if os.path.exists(docs_folder):
+        for filename in os.listdir(docs_folder):
+            if filename.removesuffix(".json") not in target_ids:
+                os.remove(f"{docs_folder}/{filename}")
+
+    return sum(
+        write_if_changed(
+            f"{search_folder}/index/{shard_num}.json",
+            json.dumps(shard, separators=(",", ":"), sort_keys=True),
+        )
+        for shard_num, shard in enumerate(shards)
+    )
+
+
+def write_search_page(archive_location: str, categories: list[Category]) -> None:
+    os.makedirs(f"{archive_location}/search", exist_ok=True)
+    write_if_changed(
+        f"{archive_location}/search/categories.json",
+        json.dumps(
+            [
+                {"internal_name": category.internal_name, "name": category.name}
+                for category in categories
+            ]
+        ),
+    )
+    write_if_changed(f"{archive_location}/search.html", SEARCH_PAGE)
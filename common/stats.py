@@ -0,0 +1,68 @@
+import json
+import os
+
+import attrs
+import typing_extensions as typing
+
+from common.files import write_atomic
+from common.progress import ExportResult
+
+__all__ = ("ThroughputStats",)
+
+
+@attrs.define()
+class ThroughputStats:
+    """
+    How fast previous runs exported messages, used to project how long future
+    runs will take.
+    """
+
+    path: str = attrs.field()
+    messages: int = attrs.field(default=0)
+    invocations: int = attrs.field(default=0)
+    duration: float = attrs.field(default=0.0)
+    bytes: int = attrs.field(default=0)
+    media_bytes: int = attrs.field(default=0)
+
+    @classmethod
+    def load(cls, path: str) -> "typing.Self":
+        if not os.path.exists(path):
+            return cls(path)
+
+        with open(path, encoding="utf-8") as file:
+            return cls(path, **json.load(file))
+
+    @property
+    def seconds_per_message(self) -> float | None:
+        return self.duration / self.messages if self.messages else None
+
+    @property
+    def bytes_per_message(self) -> float | None:
+        return self.bytes / self.messages if self.bytes else None
+
+    @property
+    def media_bytes_per_message(self) -> float | None:
+        return self.media_bytes / self.messages if self.media_bytes else None
+
+    def record(self, results: list[ExportResult], media_bytes: int = 0) -> None:
+        # failed exports would skew things, as they often fail right away
+        for result in results:
+            if result.succeeded and result.messages:
+                self.messages += result.messages
+                self.invocations += 1
+                self.duration += result.duration
+                self.bytes += result.bytes
+        self.media_bytes += media_bytes
+
+    def save(self) -> None:
+        with write_atomic(self.path) as file:
+            json.dump(
+                {
+                    "messages": self.messages,
+                    "invocations": self.invocations,
+                    "duration": self.duration,
+                    "bytes": self.bytes,
+                    "media_bytes": self.media_bytes,
+                },
+                file,
+            )
@@ -0,0 +1,81 @@
+import logging
+import re
+import time
+
+__all__ = ("RATE_LIMIT_REGEX", "ExportThrottle")
+
+logger = logging.getLogger("kgarchivebot")
+
+# DiscordChatExporter retries rate limits itself, but still mentions them
+RATE_LIMIT_REGEX = re.compile(r"\b429\b|too many requests|rate.?limit", re.IGNORECASE)
+
+
+class ExportThrottle:
+    """
+    Works out how hard exports can push Discord, AIMD-style: every export that
+    finishes cleanly adds a bit more concurrency, and any export that ran into a
+    rate limit or failed halves it.
+
+    Concurrency is added as more concurrent CLI invocations first, and then as
+    a higher `--parallel` for each. Both are halved when backing off, but only
+    once per `cooldown` seconds, as one rate limit tends to hit every running
+    export at once.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_exports: int,
+        max_parallel: int,
+        parallel: int,
+        cooldown: float = 30,
+    ) -> None:
+        self.max_exports = max_exports
+        self.max_parallel = max_parallel
+        self.exports = max_exports
+        self.parallel = min(parallel, max_parallel)
+        self.cooldown = cooldown
+        self.backed_off_at: float | None = None
+        self.rate_limits = 0
+        self.failures = 0
+
+    def record(self, *, rate_limits: int, failed: bool = False) -> bool:
+        """
+        Adjusts things after an export finishes, given how many rate limits it
+        ran into and whether it failed. Returns whether anything changed.
+        """
+        before = (self.exports, self.parallel)
+
+        if rate_limits or failed:
+            self.rate_limits += rate_limits
+            self.failures += failed
+            now = time.monotonic()
+            if self.backed_off_at and now - self.backed_off_at < self.cooldown:
+                return False
+
+            self.backed_off_at = now
+            self.exports = max(self.exports // 2, 1)
+            self.parallel = max(self.parallel // 2, 1)
+            logger.warning(
+                "Exports %s, backing off to %s at a time with --parallel %s.",
+                "ran into rate limits" if rate_limits else "failed",
+                self.exports,
+                self.parallel,
+            )
+        elif self.exports < self.max_exports:
+            self.exports += 1
+        elif self.parallel < self.max_parallel:
+            self.parallel += 1
+
+        return (self.exports, self.parallel) != before
+
+    def describe(self) -> str:
+        line = f"Concurrency: {self.exports} export(s) at a time, --parallel {self.parallel}"
+        problems = []
+        if self.rate_limits:
+            problems.append(f"{self.rate_limits:,} rate limit(s) hit")
+        if self.failures:
+            problems.append(f"{self.failures:,} failed export(s)")
+        if problems:
+            line += f" ({', '.join(problems)})"
+        return line
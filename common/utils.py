@@ -7,6 +7,9 @@ import interactions as ipy
 import typing_extensions as typing
 from interactions.ext import prefixed_commands as prefixed
 
+import common.metrics as metrics
+from common.notifications import NOTIFICATIONS
+
 logger = logging.getLogger("kgarchivebot")
 
 
@@ -30,9 +33,13 @@ def make_embed(description: str) -> ipy.Embed:
 async def error_handle(
     error: Exception, *, ctx: typing.Optional[ipy.BaseContext] = None
 ) -> None:
+    metrics.ERRORS.inc(type=type(error).__name__)
+
     if not isinstance(error, aiohttp.ServerDisconnectedError):
         traceback.print_exception(error)
         logger.error("An error occured.", exc_info=error)
+        # sent in the background, so whatever failed isn't held up any further
+        NOTIFICATIONS.report_error(error)
 
     if ctx:
         if isinstance(ctx, prefixed.PrefixedContext):
@@ -52,19 +59,15 @@ async def error_handle(
             )
 
 
-async def msg_to_owner(
-    bot: ipy.Client,
+def msg_to_owner(
     chunks: list[str] | list[ipy.Embed] | list[str | ipy.Embed] | str | ipy.Embed,
 ) -> None:
     if not isinstance(chunks, list):
         chunks = [chunks]
 
-    # sends a message to the owner
+    # queues up messages to the owner, which are sent in batches
     for chunk in chunks:
-        if isinstance(chunk, ipy.Embed):
-            await bot.owner.send(embeds=chunk)
-        else:
-            await bot.owner.send(chunk)
+        NOTIFICATIONS.notify(chunk)
 
 
 def line_split(content: str, split_by: int = 20) -> list[list[str]]:
@@ -1,214 +1,372 @@
 import asyncio
+import contextlib
 import importlib
 import os
-import urllib.parse
+import sys
+import time
 
-import attrs
 import interactions as ipy
-import tomli
+import typing_extensions as typing
 from interactions.ext import prefixed_commands as prefixed
 
+import common.archive_queue as archive_queue
+import common.config as config
+import common.index as index
+import common.metrics as metrics
+import common.models as models
+import common.pipeline as pipeline
+import common.profiles as profiles
 import common.utils as utils
+from common.budget import format_size
+from common.job import ArchiveJob
+from common.progress import ExportProgress
 
-with open(f"{os.environ["DIRECTORY_OF_FILE"]}/kg_config.toml", "rb") as config_file:
-    CONFIG = tomli.load(config_file)
 
+class ProgressReporter:
+    """Periodically edits a message to show how far along an archive run is."""
 
-@attrs.define()
-class BaseChannel:
-    id: int = attrs.field()
-    name: str = attrs.field()
+    def __init__(
+        self, message: ipy.Message, progress: ExportProgress, interval: float
+    ) -> None:
+        self.message = message
+        self.progress = progress
+        self.interval = interval
+        self.task: asyncio.Task | None = None
 
-    @property
-    def path(self) -> str:
-        return CONFIG["archive_location"]
+    async def update(self) -> None:
+        # a failed edit shouldn't take down the whole archive
+        with contextlib.suppress(ipy.errors.HTTPException):
+            await self.message.edit(embeds=utils.make_embed(self.progress.describe()))
 
-    @property
-    def base_url(self) -> str:
-        return os.environ["WEBSITE_BASE"] + CONFIG["github_name"]
+    async def _report(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.update()
 
+    async def __aenter__(self) -> "typing.Self":
+        self.task = asyncio.create_task(self._report())
+        return self
 
-@attrs.define()
-class Category(BaseChannel):
-    internal_name: str = attrs.field()
-    channels: list["Channel"] = attrs.field(factory=list)
-
-    @property
-    def path(self) -> str:
-        return f"{super().path}/{self.internal_name}"
-
-    @property
-    def url_quote(self) -> str:
-        return urllib.parse.quote(f"{self.internal_name}/{self.internal_name}")
-
-    @property
-    def url_path(self) -> str:
-        return f"{self.base_url}/{self.url_quote}"
-
-    def mkdir(self) -> None:
-        os.mkdir(self.path)
-
-
-@attrs.define()
-class Channel(BaseChannel):
-    category: Category = attrs.field()
-    threads: list["Thread"] = attrs.field(factory=list)
-
-    @property
-    def path(self) -> str:
-        return f"{super().path}/{self.category.internal_name}/{self.id}.html"
-
-    @property
-    def url_quote(self) -> str:
-        return urllib.parse.quote(f"{self.category.internal_name}/{self.id}.html")
-
-    @property
-    def url_path(self) -> str:
-        return f"{self.base_url}/{self.url_quote}"
-
-    @property
-    def folder_path(self) -> str:
-        return self.path.replace(".html", "")
-
-    @property
-    def proper_name(self) -> str:
-        return self.name.replace("-", " ").title()
-
-    def mkdir(self) -> None:
-        os.mkdir(self.folder_path)
-
-
-@attrs.define()
-class Thread(BaseChannel):
-    channel: Channel = attrs.field()
-
-    @property
-    def path(self) -> str:
-        return f"{super().path}/{self.channel.category.internal_name}/{self.channel.id}/{self.id}.html"
-
-    @property
-    def url_quote(self) -> str:
-        return urllib.parse.quote(
-            f"{self.channel.category.internal_name}/{self.channel.id}/{self.id}.html"
-        )
-
-    @property
-    def url_path(self) -> str:
-        return f"{self.base_url}/{self.url_quote}"
+    async def __aexit__(self, *_: typing.Any) -> None:
+        if self.task:
+            self.task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.task
+        await self.update()
 
 
 class Archive(utils.Extension):
     def __init__(self, bot: utils.KGArchiveBase) -> None:
         self.bot: utils.KGArchiveBase = bot
 
-    @prefixed.prefixed_command()
-    @ipy.check(ipy.is_owner())
-    @ipy.check(ipy.guild_only())
-    async def archive(self, ctx: prefixed.PrefixedContext) -> None:
-        categories: list[Category] = []
+    @staticmethod
+    def job_path(profile: profiles.Profile) -> str:
+        return f"{profile.archive_location}/.archive_job.json"
+
+    def get_guild(
+        self, ctx: prefixed.PrefixedContext, guild_id: int | None
+    ) -> ipy.Guild:
+        if guild_id is None:
+            return ctx.guild
+        if not (guild := self.bot.get_guild(guild_id)):
+            raise ipy.errors.BadArgument("I'm not in that server.")
+        return guild
+
+    @staticmethod
+    def get_profile(guild: ipy.Guild) -> profiles.Profile:
+        if not (profile := profiles.get_profile(int(guild.id))):
+            raise ipy.errors.BadArgument(
+                f"There is no archive profile for {guild.name} in the config."
+            )
+
+        # servers without a profile of their own get the default one, whose
+        # categories may well be in another server
+        for category_entry in profile.categories:
+            if not isinstance(
+                guild.get_channel(category_entry["id"]), ipy.GuildCategory
+            ):
+                raise ipy.errors.BadArgument(
+                    f"The category `{category_entry['name']}`"
+                    f" ({category_entry['id']}) in the config is not in"
+                    f" {guild.name}."
+                )
+        return profile
+
+    async def queue_archive(
+        self,
+        ctx: prefixed.PrefixedContext,
+        profile: profiles.Profile,
+        start_text: str,
+        run: typing.Callable[[ipy.Message], typing.Awaitable[None]],
+    ) -> None:
+        if archive_queue.ARCHIVES.position(profile.archive_location) is not None:
+            raise ipy.errors.BadArgument(
+                "An archive of this server is already queued or running."
+            )
+
+        message = await ctx.reply(embeds=utils.make_embed("Getting ready..."))
+
+        async def on_position(position: int) -> None:
+            with contextlib.suppress(ipy.errors.HTTPException):
+                await message.edit(
+                    embeds=utils.make_embed(
+                        f"Queued at position {position}. This will start once an"
+                        " archive of another server finishes."
+                    )
+                )
 
-        await ctx.reply(
-            embeds=utils.make_embed("Here we go. This will take a *long* time.")
+        async def start() -> None:
+            with contextlib.suppress(ipy.errors.HTTPException):
+                await message.edit(embeds=utils.make_embed(start_text))
+            await run(message)
+
+        try:
+            await archive_queue.ARCHIVES.submit(
+                profile.archive_location, start, on_position
+            )
+        except archive_queue.AlreadyQueued:
+            # another archive of this server was queued while we replied
+            with contextlib.suppress(ipy.errors.HTTPException):
+                await message.delete()
+            raise ipy.errors.BadArgument(
+                "An archive of this server is already queued or running."
+            ) from None
+
+    async def run_pipeline(
+        self,
+        ctx: prefixed.PrefixedContext,
+        message: ipy.Message,
+        job: ArchiveJob,
+        profile: profiles.Profile,
+        categories: list[models.Category],
+    ) -> None:
+        archive_pipeline = pipeline.ArchivePipeline(
+            job, profile, pool=archive_queue.EXPORT_POOL, http=self.bot.http
         )
 
-        async with ctx.channel.typing:
-            for category_entry in CONFIG["categories"]:
-                category = Category(
-                    category_entry["id"],
-                    category_entry["name"],
-                    category_entry["internal_name"],
+        # better to find out now than hours in, when the disk fills up
+        archive_plan = await asyncio.to_thread(archive_pipeline.plan, categories)
+        if not archive_plan.fits:
+            needed = (
+                f"This archive needs about {format_size(archive_plan.estimated_bytes)},"
+                f" but only {format_size(archive_plan.available_bytes or 0)} can be"
+                " used."
+            )
+
+            # without previous runs, the estimate's only a guess - not worth
+            # refusing over, as the budget still pauses the run if space runs low
+            if archive_plan.guessed_size:
+                await ctx.reply(
+                    embeds=utils.make_embed(
+                        f"{needed} No previous runs have been recorded, so this"
+                        " is a rough guess - archiving anyway."
+                    )
                 )
-                category.mkdir()
-
-                category_channel: ipy.GuildCategory = ctx.guild.get_channel(
-                    category_entry["id"]
+            else:
+                raise ipy.errors.BadArgument(
+                    f"{needed} Free up some space, lower `min_free_space_mb` or set"
+                    " `export_media = false`, then try again."
                 )
-                for discord_channel in category_channel.text_channels:
-                    channel = Channel(
-                        discord_channel.id, discord_channel.name, category
-                    )
 
-                    threads = await discord_channel.fetch_all_threads()
-
-                    if threads.threads:
-                        channel.mkdir()
-
-                        for discord_thread in threads.threads:
-                            thread = Thread(
-                                discord_thread.id, discord_thread.name, channel
-                            )
-                            channel.threads.append(thread)
-
-                        command_list = [
-                            os.environ["CLI_EXECUTABLE"],
-                            "export -t",
-                            f'"{os.environ["MAIN_TOKEN"]}"',
-                            " -c",
-                            " ".join([str(t.id) for t in channel.threads]),
-                            "-o",
-                            f'"{channel.folder_path}/%c.html"',
-                            "--utc",
-                            "--parallel 10",
-                            "--media --reuse-media --fuck-russia",
-                        ]
-                        command = " ".join(command_list)
-
-                        process = await asyncio.create_subprocess_shell(command)
-                        await process.wait()
-
-                    category.channels.append(channel)
-
-                command_list = [
-                    os.environ["CLI_EXECUTABLE"],
-                    "export -t",
-                    f'"{os.environ["MAIN_TOKEN"]}"',
-                    " -c",
-                    " ".join([str(c.id) for c in category.channels]),
-                    "-o",
-                    f'"{category.path}/%c.html"',
-                    "--utc",
-                    "--parallel 10",
-                    "--media --reuse-media --fuck-russia",
-                ]
-                command = " ".join(command_list)
+        async with ProgressReporter(
+            message,
+            archive_pipeline.progress,
+            profile.get("progress_interval", 15),
+        ):
+            await archive_pipeline.run(categories)
+
+        if failed := archive_pipeline.progress.channels_failed:
+            summary = (
+                f"Done, but {failed} channel(s) failed to export. Check the logs"
+                " for details, then use `archive resume` to retry them."
+            )
+        elif published := archive_pipeline.publish_result:
+            summary = (
+                f"Done! Published {published.files:,} changed file(s) in"
+                f" {published.commits:,} commit(s)."
+            )
+        else:
+            summary = "Done!"
+
+        if archive_pipeline.budget.written:
+            summary += f"\n\nWritten:\n{archive_pipeline.budget.describe()}"
+        await ctx.reply(embeds=utils.make_embed(summary))
 
-                process = await asyncio.create_subprocess_shell(command)
-                await process.wait()
+    @prefixed.prefixed_command()
+    @ipy.check(ipy.is_owner())
+    @ipy.check(ipy.guild_only())
+    async def archive(
+        self, ctx: prefixed.PrefixedContext, guild_id: typing.Optional[int] = None
+    ) -> None:
+        guild = self.get_guild(ctx, guild_id)
+        profile = self.get_profile(guild)
+
+        async def run(message: ipy.Message) -> None:
+            async with ctx.channel.typing:
+                categories = await pipeline.discover(guild, profile)
+
+                os.makedirs(profile.archive_location, exist_ok=True)
+                job = ArchiveJob(
+                    self.job_path(profile),
+                    int(guild.id),
+                    [category.to_dict() for category in categories],
+                )
+                job.save()
 
-                with open(
-                    f"{category.path}/{category.internal_name}.md",
-                    "w",
-                    encoding="utf-8",
-                ) as md_file:
-                    md_file.write(f"# {category.name}\n\nAll Locations:\n")
+                await self.run_pipeline(ctx, message, job, profile, categories)
 
-                    # TODO: add some control over this
-                    # md_file.write(
-                    #     f"# Season {CONFIG['season_num']} - {category.name}\n\nAll"
-                    #     " Locations:\n"
-                    # )
-                    for channel in category.channels:
-                        md_file.write(
-                            f"* [{channel.proper_name}]({channel.url_path})\n"
-                        )
+        await self.queue_archive(
+            ctx, profile, "Here we go. This will take a *long* time.", run
+        )
 
-                        for thread in channel.threads:
-                            md_file.write(f"  * [{thread.name}]({thread.url_path})\n")
-                    md_file.write(f"\n[Back to Home]({channel.base_url})")
+    @archive.subcommand()
+    async def plan(
+        self, ctx: prefixed.PrefixedContext, guild_id: typing.Optional[int] = None
+    ) -> None:
+        guild = self.get_guild(ctx, guild_id)
+        profile = self.get_profile(guild)
 
-                categories.append(category)
+        async with ctx.channel.typing:
+            categories = await pipeline.discover(guild, profile)
+
+            # the job is never saved, it's only there so the pipeline can plan
+            job = ArchiveJob(
+                self.job_path(profile),
+                int(guild.id),
+                [category.to_dict() for category in categories],
+            )
+            archive_plan = await asyncio.to_thread(
+                pipeline.ArchivePipeline(job, profile, http=self.bot.http).plan,
+                categories,
+            )
+
+        await ctx.reply(embeds=utils.make_embed(archive_plan.describe()))
+
+    @archive.subcommand()
+    async def stats(self, ctx: prefixed.PrefixedContext) -> None:
+        await ctx.reply(embeds=utils.make_embed(metrics.summarize()))
+
+    @archive.subcommand()
+    async def resume(
+        self, ctx: prefixed.PrefixedContext, guild_id: typing.Optional[int] = None
+    ) -> None:
+        guild = self.get_guild(ctx, guild_id)
+        profile = self.get_profile(guild)
+
+        job = ArchiveJob.load(self.job_path(profile))
+        if not job or job.finished:
+            raise ipy.errors.BadArgument("There is no unfinished archive to resume.")
+        if job.guild_id != int(guild.id):
+            raise ipy.errors.BadArgument(
+                "The unfinished archive was started in another server."
+            )
+
+        started_at = ipy.Timestamp.fromisoformat(job.started_at)
+
+        async def run(message: ipy.Message) -> None:
+            async with ctx.channel.typing:
+                categories = [
+                    models.Category.from_dict(data, profile) for data in job.tree
+                ]
+                await self.run_pipeline(ctx, message, job, profile, categories)
+
+        await self.queue_archive(
+            ctx,
+            profile,
+            f"Resuming the archive started at <t:{int(started_at.timestamp())}:f>,"
+            f" skipping {len(job.completed)} already exported channel(s).",
+            run,
+        )
 
-            with open(
-                f"{CONFIG['archive_location']}/README.md", "w", encoding="utf-8"
-            ) as md_file:
-                md_file.write("# Home Page\n\nAll Categories:\n")
+    @archive.subcommand()
+    async def rerender(
+        self, ctx: prefixed.PrefixedContext, guild_id: typing.Optional[int] = None
+    ) -> None:
+        guild = self.get_guild(ctx, guild_id)
+        profile = self.get_profile(guild)
+
+        categories = await asyncio.to_thread(index.load_tree, profile)
+        if categories is None:
+            raise ipy.errors.BadArgument(
+                "There is no archive to rerender. Run `archive` first."
+            )
+        if profile.get("export_format", "html") != "json":
+            raise ipy.errors.BadArgument(
+                'Only JSON exports can be rerendered. Set `export_format = "json"`'
+                " in the config, then run `archive` to export everything as JSON."
+            )
+
+        async def run(_: ipy.Message) -> None:
+            started_at = time.perf_counter()
+
+            # the job is never saved, as nothing is exported
+            job = ArchiveJob(
+                self.job_path(profile),
+                int(guild.id),
+                [category.to_dict() for category in categories],
+            )
+            archive_pipeline = pipeline.ArchivePipeline(job, profile)
+            rendered = await archive_pipeline.rerender(categories)
+
+            summary = (
+                f"Rerendered {rendered:,} export(s) in"
+                f" {time.perf_counter() - started_at:.0f}s."
+            )
+            if published := archive_pipeline.publish_result:
+                summary += (
+                    f" Published {published.files:,} changed file(s) in"
+                    f" {published.commits:,} commit(s)."
+                )
+            await ctx.reply(embeds=utils.make_embed(summary))
+
+        await self.queue_archive(ctx, profile, "Rerendering every JSON export...", run)
+
+    def refresh_names(self, categories: list[models.Category]) -> int:
+        # only looks at the cache, so renames are picked up without any requests
+        renamed = 0
+        for category in categories:
+            for channel in category.channels:
+                targets: list[models.ExportTarget] = [channel, *channel.threads]
+                for target in targets:
+                    cached = self.bot.cache.get_channel(target.id)
+                    if cached and cached.name != target.name:
+                        target.name = cached.name
+                        renamed += 1
+        return renamed
 
-                for category in categories:
-                    md_file.write(f"* [{category.name}]({category.url_path})\n")
+    @prefixed.prefixed_command()
+    @ipy.check(ipy.is_owner())
+    @ipy.check(ipy.guild_only())
+    async def rebuild_index(
+        self, ctx: prefixed.PrefixedContext, guild_id: typing.Optional[int] = None
+    ) -> None:
+        started_at = time.perf_counter()
+        profile = self.get_profile(self.get_guild(ctx, guild_id))
+
+        categories = await asyncio.to_thread(index.load_tree, profile)
+        if categories is None:
+            raise ipy.errors.BadArgument(
+                "There is no archive to rebuild the index of. Run `archive` first."
+            )
+
+        if renamed := self.refresh_names(categories):
+            await asyncio.to_thread(index.save_tree, profile, categories)
+        written = await asyncio.to_thread(index.build_indexes, profile, categories)
 
-        await ctx.reply(embeds=utils.make_embed("Done!"))
+        await ctx.reply(
+            embeds=utils.make_embed(
+                f"Rebuilt the index in {(time.perf_counter() - started_at) * 1000:.0f}"
+                f"ms. {renamed} channel(s) were renamed and {written} file(s)"
+                " changed."
+            )
+        )
 
 
 def setup(bot: utils.KGArchiveBase) -> None:
     importlib.reload(utils)
+    importlib.reload(config)
+    importlib.reload(profiles)
+    for module_name in pipeline.RELOADED_MODULES:
+        importlib.reload(sys.modules[module_name])
+    importlib.reload(pipeline)
     Archive(bot)
@@ -0,0 +1,215 @@
+import asyncio
+import importlib
+import logging
+import sys
+import time
+
+import interactions as ipy
+
+import common.archive_queue as archive_queue
+import common.config as config
+import common.index as index
+import common.pipeline as pipeline
+import common.profiles as profiles
+import common.utils as utils
+from common.dirty import DirtyChannels
+from common.job import ArchiveJob
+
+logger = logging.getLogger("kgarchivebot")
+
+# how often the dirty sets are written to disk, in seconds
+SAVE_INTERVAL = 30
+
+
+class AutoArchive(utils.Extension):
+    """
+    Watches for activity in archived categories, and every
+    `auto_archive_interval` minutes archives only the channels that saw any.
+
+    Channels without activity are carried over from the last archive as they
+    were, so a scheduled archive only talks to Discord about what changed.
+    """
+
+    def __init__(self, bot: utils.KGArchiveBase) -> None:
+        self.bot: utils.KGArchiveBase = bot
+        self.task: asyncio.Task | None = None
+        self.dirty: dict[str, DirtyChannels] = {}
+        self.category_profiles: dict[int, profiles.Profile] = {}
+
+        for profile in profiles.PROFILES:
+            self.dirty[profile.archive_location] = DirtyChannels(
+                f"{profile.archive_location}/.archive_dirty.json"
+            )
+            for category_entry in profile.categories:
+                self.category_profiles[category_entry["id"]] = profile
+
+    def mark(
+        self,
+        channel: ipy.BaseChannel | None,
+        *,
+        refresh: bool = False,
+        message_id: ipy.Snowflake_Type | None = None,
+    ) -> None:
+        if not self.task:
+            # nothing would ever archive what's marked
+            return
+
+        # threads are archived as part of their parent channel
+        text_channel = (
+            channel.parent_channel
+            if isinstance(channel, ipy.ThreadChannel)
+            else channel
+        )
+        if not isinstance(text_channel, ipy.GuildText) or not text_channel.parent_id:
+            return
+        if not (profile := self.category_profiles.get(int(text_channel.parent_id))):
+            return
+
+        self.dirty[profile.archive_location].mark(
+            int(text_channel.id),
+            refresh=int(channel.id) if refresh else None,
+            # saves fetching the channel's last message when archiving - threads
+            # have theirs fetched anyway
+            message_id=int(message_id)
+            if message_id and channel.id == text_channel.id
+            else None,
+        )
+
+    @ipy.listen(ipy.events.MessageCreate)
+    async def on_message_create(self, event: ipy.events.MessageCreate) -> None:
+        self.mark(event.message.channel, message_id=event.message.id)
+
+    @ipy.listen(ipy.events.MessageUpdate)
+    async def on_message_update(self, event: ipy.events.MessageUpdate) -> None:
+        if event.after.author.id == self.bot.user.id:
+            # like the progress messages archives keep editing
+            return
+
+        # incremental exports only pick up new messages, not changed ones
+        self.mark(event.after.channel, refresh=True)
+
+    @ipy.listen(ipy.events.MessageDelete)
+    async def on_message_delete(self, event: ipy.events.MessageDelete) -> None:
+        self.mark(event.message.channel, refresh=True)
+
+    @ipy.listen(ipy.events.ThreadCreate)
+    async def on_thread_create(self, event: ipy.events.ThreadCreate) -> None:
+        self.mark(event.thread)
+
+    async def archive_dirty(self, profile: profiles.Profile) -> None:
+        profile_dirty = self.dirty[profile.archive_location]
+
+        if archive_queue.ARCHIVES.position(profile.archive_location) is not None:
+            # whatever's running might not have seen everything, so this waits
+            # for the next time around
+            return
+
+        job_path = f"{profile.archive_location}/.archive_job.json"
+        job = await asyncio.to_thread(ArchiveJob.load, job_path)
+        if job and not job.finished:
+            # that's left for `archive resume`, which would lose track of it
+            # if a scheduled archive replaced the job
+            return
+
+        # channels without activity come from here, so there has to have been
+        # a full archive first
+        previous = await asyncio.to_thread(index.load_tree, profile)
+        category_channel = self.bot.get_channel(profile.categories[0]["id"])
+        if previous is None or not category_channel:
+            return
+
+        guild = category_channel.guild
+        channels, refresh, last_message_ids = profile_dirty.take()
+
+        async def run() -> None:
+            started_at = time.perf_counter()
+            categories = await pipeline.discover(
+                guild,
+                profile,
+                only=channels,
+                previous=previous,
+                last_message_ids=last_message_ids,
+            )
+
+            job = ArchiveJob(
+                job_path,
+                int(guild.id),
+                [category.to_dict() for category in categories],
+            )
+            await asyncio.to_thread(job.save)
+
+            archive_pipeline = pipeline.ArchivePipeline(
+                job,
+                profile,
+                pool=archive_queue.EXPORT_POOL,
+                http=self.bot.http,
+                refresh=refresh,
+            )
+            await archive_pipeline.run(categories)
+
+            if archive_pipeline.progress.channels_failed:
+                # tried again next time around
+                profile_dirty.restore(channels, refresh, last_message_ids)
+            logger.info(
+                "Auto-archived %s active channel(s) of %s in %.1fs, %s failed.",
+                len(channels),
+                guild.name,
+                time.perf_counter() - started_at,
+                archive_pipeline.progress.channels_failed,
+            )
+
+        async def on_position(_: int) -> None:
+            pass
+
+        try:
+            await archive_queue.ARCHIVES.submit(
+                profile.archive_location, run, on_position
+            )
+        except BaseException:
+            profile_dirty.restore(channels, refresh, last_message_ids)
+            raise
+        finally:
+            await asyncio.to_thread(profile_dirty.save)
+
+    async def schedule(self, interval: float) -> None:
+        next_run = time.monotonic() + interval
+
+        while True:
+            await asyncio.sleep(SAVE_INTERVAL)
+            for profile_dirty in self.dirty.values():
+                await asyncio.to_thread(profile_dirty.save)
+
+            if time.monotonic() < next_run:
+                continue
+            next_run = time.monotonic() + interval
+
+            for profile in profiles.PROFILES:
+                if not self.dirty[profile.archive_location]:
+                    continue
+
+                try:
+                    await self.archive_dirty(profile)
+                except Exception as e:
+                    # one server failing shouldn't stop the others
+                    await utils.error_handle(e)
+
+    async def async_start(self) -> None:
+        if interval := config.CONFIG.get("auto_archive_interval", 0):
+            self.task = self.bot.create_task(self.schedule(interval * 60))
+
+    def drop(self) -> None:
+        if self.task:
+            self.task.cancel()
+        for profile_dirty in self.dirty.values():
+            profile_dirty.save()
+        super().drop()
+
+
+def setup(bot: utils.KGArchiveBase) -> None:
+    importlib.reload(utils)
+    importlib.reload(config)
+    importlib.reload(profiles)
+    for module_name in pipeline.RELOADED_MODULES:
+        importlib.reload(sys.modules[module_name])
+    importlib.reload(pipeline)
+    AutoArchive(bot)
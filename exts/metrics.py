@@ -0,0 +1,86 @@
+import importlib
+import logging
+import time
+
+import interactions as ipy
+import typing_extensions as typing
+from aiohttp import web
+from interactions.ext import prefixed_commands as prefixed
+
+import common.config as config
+import common.gateway as gateway
+import common.metrics as metrics
+import common.utils as utils
+
+if typing.TYPE_CHECKING:
+    from interactions.api.http.route import Route
+
+logger = logging.getLogger("kgarchivebot")
+
+
+class Metrics(utils.Extension):
+    """
+    Times every Discord API request, and serves everything in common/metrics.py
+    over HTTP for Prometheus to scrape.
+    """
+
+    def __init__(self, bot: utils.KGArchiveBase) -> None:
+        self.bot: utils.KGArchiveBase = bot
+        self.runner: web.AppRunner | None = None
+        self.original_request = self.bot.http.request
+        self.bot.http.request = self.timed_request
+
+    async def timed_request(
+        self, route: "Route", *args: typing.Any, **kwargs: typing.Any
+    ) -> typing.Any:
+        # this includes any time spent waiting on rate limits, which is usually
+        # what we want to know about anyways
+        labels = {"method": route.method, "route": route.path}
+        result = "success"
+        started_at = time.perf_counter()
+        try:
+            return await self.original_request(route, *args, **kwargs)
+        except Exception:
+            result = "error"
+            raise
+        finally:
+            metrics.REST_SECONDS.observe(time.perf_counter() - started_at, **labels)
+            metrics.REST_REQUESTS.inc(result=result, **labels)
+
+    async def handle_metrics(self, _: web.Request) -> web.Response:
+        return web.Response(
+            text=metrics.REGISTRY.render(),
+            content_type="text/plain",
+            headers={"X-Content-Type-Options": "nosniff"},
+        )
+
+    async def async_start(self) -> None:
+        if not (port := config.CONFIG.get("metrics_port")):
+            return
+
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        host = config.CONFIG.get("metrics_host", "127.0.0.1")
+        await web.TCPSite(self.runner, host, port).start()
+        logger.info("Serving metrics on http://%s:%s/metrics", host, port)
+
+    @prefixed.prefixed_command()
+    @ipy.check(ipy.is_owner())
+    async def memory(self, ctx: prefixed.PrefixedContext) -> None:
+        await ctx.reply(embeds=utils.make_embed(gateway.memory_report(self.bot)))
+
+    def drop(self) -> None:
+        self.bot.http.request = self.original_request
+        if self.runner:
+            self.bot.create_task(self.runner.cleanup())
+        super().drop()
+
+
+def setup(bot: utils.KGArchiveBase) -> None:
+    importlib.reload(utils)
+    importlib.reload(config)
+    importlib.reload(gateway)
+    Metrics(bot)
@@ -1,16 +1,36 @@
+import asyncio
+import hashlib
+import json
+import logging
 import os
 import platform
 import shutil
-import subprocess
+import time
 from pathlib import Path
 from zipfile import ZipFile
 
-import requests
+import aiohttp
 from dotenv import load_dotenv
 
+from common.files import write_atomic
+
 IS_INITIALIZED = False
+CLI_READY = asyncio.Event()
+CLI_LOCK = asyncio.Lock()
+CLI_ERROR: Exception | None = None
+
+RELEASES_URL = "https://api.github.com/repos/Tyrrrz/DiscordChatExporter/releases"
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+__all__ = (
+    "initialize",
+    "is_initialized",
+    "prepare_cli",
+    "set_initialized",
+    "wait_for_cli",
+)
 
-__all__ = ("initialize", "is_initialized", "set_initialized")
+logger = logging.getLogger("kgarchivebot")
 
 
 def is_initialized() -> bool:
@@ -23,6 +43,8 @@ def set_initialized() -> None:
 
 
 def initialize() -> None:
+    # only sets up the environment - preparing the cli is done by prepare_cli
+    # once the bot is running, so that startup never waits on the network
     if is_initialized():
         return
 
@@ -32,85 +54,303 @@ def initialize() -> None:
     os.environ["DIRECTORY_OF_FILE"] = file_location
     os.environ["LOG_FILE_PATH"] = f"{file_location}/discord.log"
 
-    cli_path = Path(__file__).parent.absolute().joinpath("cli")
+    os.environ["CLI_EXECUTABLE"] = (
+        get_cli_path().joinpath("DiscordChatExporter.Cli").as_posix()
+    )
 
-    if os.path.exists(cli_path):
-        output = subprocess.run(
-            [cli_path.joinpath("DiscordChatExporter.Cli").as_posix(), "--version"],
-            capture_output=True,
-            check=True,
-        )
-        version = output.stdout.decode("utf-8").strip()
+    set_initialized()
+
+
+def get_cli_path() -> Path:
+    return Path(__file__).parent.absolute().joinpath("cli")
+
+
+def get_asset_name() -> str:
+    match platform.system():
+        case "Windows":
+            os_name = "win"
+        case "Darwin":
+            os_name = "osx"
+        case "Linux":
+            os_name = "linux"
+        case _:
+            raise ValueError("Unsupported operating system.")
+
+    match platform.machine():
+        case "x86_64":
+            arch = "x64"
+        case "amd64":
+            arch = "x64"
+        case "x86":
+            arch = "x86"
+        case "i386":
+            arch = "x86"
+        case "i686":
+            arch = "x86"
+        case "armv7l":
+            arch = "arm"
+        case "armv6l":
+            arch = "arm"
+        case "aarch64":
+            arch = "arm64"
+        case "arm64":
+            arch = "arm64"
+        case _:
+            raise ValueError("Unsupported architecture.")
+
+    if os_name != "win" and arch == "x86":
+        raise ValueError("Unsupported operating system or architecture.")
+
+    return f"DiscordChatExporter.Cli.{os_name}-{arch}.zip"
+
+
+def normalize_version(version: str) -> str:
+    version = version.removeprefix("v")
+    if version.count(".") == 1:
+        version += ".0"
+    return f"v{version}"
+
+
+def hash_file(path: Path) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(DOWNLOAD_CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def read_metadata(cli_path: Path) -> dict[str, str] | None:
+    # lets us know what is installed without launching the cli
+    metadata_path = cli_path.joinpath("metadata.json")
+    if (
+        not metadata_path.exists()
+        or not cli_path.joinpath("DiscordChatExporter.Cli").exists()
+    ):
+        return None
 
-        response = requests.get(
-            "https://api.github.com/repos/Tyrrrz/DiscordChatExporter/releases/latest"
+    with open(metadata_path, encoding="utf-8") as file:
+        metadata = json.load(file)
+
+    # the install is useless if we've moved to a different machine
+    if metadata.get("asset") != get_asset_name():
+        return None
+    return metadata
+
+
+def write_metadata(cli_path: Path, version: str, sha256: str) -> None:
+    with open(cli_path.joinpath("metadata.json"), "w", encoding="utf-8") as file:
+        json.dump(
+            {"version": version, "asset": get_asset_name(), "sha256": sha256}, file
         )
+
+
+async def get_installed_version(executable: Path) -> str | None:
+    if not executable.exists():
+        return None
+
+    process = await asyncio.create_subprocess_exec(
+        executable.as_posix(),
+        "--version",
+        stdout=asyncio.subprocess.PIPE,
+    )
+    stdout, _ = await process.communicate()
+    if process.returncode != 0:
+        return None
+    return stdout.decode("utf-8").strip()
+
+
+async def fetch_release(session: aiohttp.ClientSession, url: str) -> dict[str, str]:
+    async with session.get(url, timeout=aiohttp.ClientTimeout(total=15)) as response:
         response.raise_for_status()
-        json_data = response.json()
-        latest_version: str = json_data["tag_name"]
-
-        if latest_version.count(".") == 1:
-            latest_version += ".0"
-
-        latest_version = f"v{latest_version}"
-
-        if version != latest_version:
-            shutil.rmtree(cli_path)
-
-    if not os.path.exists(cli_path):
-        os.mkdir(cli_path)
-
-        match platform.system():
-            case "Windows":
-                os_name = "win"
-            case "Darwin":
-                os_name = "osx"
-            case "Linux":
-                os_name = "linux"
-            case _:
-                raise ValueError("Unsupported operating system.")
-
-        match platform.machine():
-            case "x86_64":
-                arch = "x64"
-            case "amd64":
-                arch = "x64"
-            case "x86":
-                arch = "x86"
-            case "i386":
-                arch = "x86"
-            case "i686":
-                arch = "x86"
-            case "armv7l":
-                arch = "arm"
-            case "armv6l":
-                arch = "arm"
-            case "aarch64":
-                arch = "arm64"
-            case "arm64":
-                arch = "arm64"
-            case _:
-                raise ValueError("Unsupported architecture.")
-
-        if os_name != "win" and arch == "x86":
-            raise ValueError("Unsupported operating system or architecture.")
-
-        url = f"https://github.com/Tyrrrz/DiscordChatExporter/releases/latest/download/DiscordChatExporter.Cli.{os_name}-{arch}.zip"
-
-        response = requests.get(url)
-        response.raise_for_status()
+        json_data = await response.json()
 
-        with open(cli_path.joinpath("cli.zip"), "wb") as file:
-            file.write(response.content)
+    asset_name = get_asset_name()
+    asset = next((a for a in json_data["assets"] if a["name"] == asset_name), None)
+    if not asset:
+        raise ValueError(f"Release {json_data['tag_name']} has no {asset_name}.")
 
-        with ZipFile(cli_path.joinpath("cli.zip"), "r") as zip_ref:
-            zip_ref.extractall(cli_path)
+    return {
+        "checked_at": time.time(),
+        "version": normalize_version(json_data["tag_name"]),
+        "url": asset["browser_download_url"],
+        # older releases do not have a digest listed
+        "digest": (asset.get("digest") or "").removeprefix("sha256:"),
+    }
 
-        os.remove(cli_path.joinpath("cli.zip"))
-        os.chmod(cli_path.joinpath("DiscordChatExporter.Cli"), 0o755)  # noqa: S103
 
-    os.environ["CLI_EXECUTABLE"] = cli_path.joinpath(
-        "DiscordChatExporter.Cli"
-    ).as_posix()
+def read_release_cache(cache_path: Path) -> dict[str, str] | None:
+    # a cache that can't be read, like after a crash mid-write, is as good as
+    # no cache
+    try:
+        with open(cache_path, encoding="utf-8") as file:
+            cached = json.load(file)
+    except (OSError, ValueError):
+        return None
 
-    set_initialized()
+    if not isinstance(cached, dict) or not isinstance(
+        cached.get("checked_at"), int | float
+    ):
+        return None
+    return cached
+
+
+async def get_latest_release(session: aiohttp.ClientSession) -> dict[str, str]:
+    # github rate limits unauthenticated requests, so the result is cached
+    cache_path = Path(os.environ["DIRECTORY_OF_FILE"]).joinpath(".cli_release.json")
+    cache_ttl = int(os.environ.get("CLI_RELEASE_CHECK_TTL", 86400))
+
+    cached = read_release_cache(cache_path)
+    if cached and time.time() - cached["checked_at"] < cache_ttl:
+        return cached
+
+    release = await fetch_release(session, f"{RELEASES_URL}/latest")
+
+    with write_atomic(str(cache_path)) as file:
+        json.dump(release, file)
+
+    return release
+
+
+def extract_cli(zip_path: Path, destination: Path) -> None:
+    with ZipFile(zip_path, "r") as zip_ref:
+        zip_ref.extractall(destination)
+
+
+def install_from_zip(zip_path: Path, cli_path: Path) -> None:
+    new_cli_path = cli_path.with_name("cli.new")
+    shutil.rmtree(new_cli_path, ignore_errors=True)
+    extract_cli(zip_path, new_cli_path)
+
+    # swap the new version in only once it's fully extracted
+    if cli_path.exists():
+        shutil.rmtree(cli_path)
+    os.replace(new_cli_path, cli_path)
+    os.chmod(cli_path.joinpath("DiscordChatExporter.Cli"), 0o755)  # noqa: S103
+
+
+async def download_cli(
+    session: aiohttp.ClientSession, release: dict[str, str], cli_path: Path
+) -> None:
+    zip_path = cli_path.with_name("cli.zip")
+    sha256 = hashlib.sha256()
+
+    try:
+        # the zip is streamed to disk rather than held in memory
+        async with session.get(
+            release["url"],
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=15, sock_read=60),
+        ) as response:
+            response.raise_for_status()
+            with open(zip_path, "wb") as file:
+                async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                    sha256.update(chunk)
+                    file.write(chunk)
+
+        if release["digest"] and sha256.hexdigest() != release["digest"]:
+            raise ValueError("The downloaded DiscordChatExporter failed its checksum.")
+
+        await asyncio.to_thread(install_from_zip, zip_path, cli_path)
+    finally:
+        if zip_path.exists():
+            os.remove(zip_path)
+
+    write_metadata(cli_path, release["version"], sha256.hexdigest())
+
+
+async def prepare_local_cli(zip_path: Path, cli_path: Path) -> None:
+    sha256 = await asyncio.to_thread(hash_file, zip_path)
+
+    metadata = read_metadata(cli_path)
+    if metadata and metadata["sha256"] == sha256:
+        return
+
+    logger.info("Installing DiscordChatExporter from %s.", zip_path)
+    await asyncio.to_thread(install_from_zip, zip_path, cli_path)
+
+    # the only time the cli needs to be launched to know its version
+    version = await get_installed_version(cli_path.joinpath("DiscordChatExporter.Cli"))
+    write_metadata(cli_path, version or "unknown", sha256)
+
+
+async def _prepare_cli() -> None:
+    cli_path = get_cli_path()
+
+    if zip_path := os.environ.get("CLI_ZIP_PATH"):
+        await prepare_local_cli(Path(zip_path), cli_path)
+        return
+
+    metadata = read_metadata(cli_path)
+    installed_version = metadata["version"] if metadata else None
+    pinned_tag = os.environ.get("CLI_VERSION", "").removeprefix("v")
+
+    # a pinned version that is already installed never needs the network
+    if pinned_tag and installed_version == normalize_version(pinned_tag):
+        return
+
+    async with aiohttp.ClientSession() as session:
+        try:
+            if pinned_tag:
+                release = await fetch_release(
+                    session, f"{RELEASES_URL}/tags/{pinned_tag}"
+                )
+            else:
+                release = await get_latest_release(session)
+        except (aiohttp.ClientError, TimeoutError, ValueError, KeyError) as e:
+            if not installed_version:
+                raise
+
+            logger.warning(
+                "Could not check for DiscordChatExporter updates, using %s.",
+                installed_version,
+                exc_info=e,
+            )
+            return
+
+        if installed_version == release["version"]:
+            return
+
+        logger.info("Installing DiscordChatExporter %s.", release["version"])
+        try:
+            await download_cli(session, release, cli_path)
+        except (aiohttp.ClientError, TimeoutError, ValueError) as e:
+            # the old install is only swapped out once the new one is ready, so
+            # it's still there to fall back on
+            if not installed_version:
+                raise
+
+            logger.warning(
+                "Could not download DiscordChatExporter %s, using %s.",
+                release["version"],
+                installed_version,
+                exc_info=e,
+            )
+
+
+async def prepare_cli() -> None:
+    global CLI_ERROR
+
+    try:
+        await _prepare_cli()
+    except Exception as e:
+        CLI_ERROR = e
+        logger.error("Could not prepare DiscordChatExporter.", exc_info=e)
+    else:
+        CLI_ERROR = None
+    finally:
+        CLI_READY.set()
+
+
+async def wait_for_cli() -> str:
+    await CLI_READY.wait()
+
+    if CLI_ERROR:
+        # whatever went wrong (like github being down) may have cleared up by now
+        async with CLI_LOCK:
+            # another archive may have sorted it out while this one waited
+            if CLI_ERROR:
+                await prepare_cli()
+
+    if CLI_ERROR:
+        raise RuntimeError("DiscordChatExporter could not be prepared.") from CLI_ERROR
+
+    return os.environ["CLI_EXECUTABLE"]
@@ -8,10 +8,12 @@ import interactions as ipy
 import typing_extensions as typing
 from interactions.ext import prefixed_commands as prefixed
 
-from initialize import initialize
+from initialize import initialize, prepare_cli
 
 initialize()
 
+import common.config as config
+import common.gateway as gateway
 import common.utils as utils
 
 logger = logging.getLogger("kgarchivebot")
@@ -38,7 +40,8 @@ class KGArchiveBot(utils.KGArchiveBase):
             else f"Reconnected at {time_format}!"
         )
 
-        await self.owner.send(connect_msg)
+        # a reconnect loop would otherwise send one of these every time
+        utils.msg_to_owner(connect_msg)
 
         self.init_load = False
 
@@ -71,10 +74,11 @@ class KGArchiveBot(utils.KGArchiveBase):
         return task
 
     async def stop(self) -> None:
+        # anything still waiting to go out is sent while we still can
+        await utils.NOTIFICATIONS.flush(self)
         await super().stop()
 
 
-intents = ipy.Intents.DEFAULT | ipy.Intents.MESSAGE_CONTENT
 mentions = ipy.AllowedMentions.all()
 
 bot = KGArchiveBot(
@@ -86,11 +90,13 @@ bot = KGArchiveBot(
     sync_ext=False,
     disable_dm_commands=True,
     allowed_mentions=mentions,
-    intents=intents,
     auto_defer=ipy.AutoDefer(enabled=True, time_until_defer=0),
     logger=logger,
+    # sets the intents, and the caches too in lean mode
+    **gateway.client_options(config.CONFIG),
 )
 bot.init_load = True
+bot.background_tasks = set()
 prefixed.setup(bot)
 
 
@@ -103,6 +109,9 @@ async def start() -> None:
         except ipy.errors.ExtensionLoadException:
             raise
 
+    # the cli is prepared in the background so the bot can connect right away
+    bot.create_task(prepare_cli())
+    bot.create_task(utils.NOTIFICATIONS.run(bot))
     await bot.astart(os.environ["MAIN_TOKEN"])
 
 
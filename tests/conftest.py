@@ -0,0 +1,6 @@
+import os
+import pathlib
+
+# common.config reads kg_config.toml from here as soon as it's imported, which
+# some of the modules under test do
+os.environ.setdefault("DIRECTORY_OF_FILE", str(pathlib.Path(__file__).parent))
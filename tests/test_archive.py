@@ -0,0 +1,66 @@
+import asyncio
+
+import interactions as ipy
+import pytest
+
+import common.archive_queue as archive_queue
+from common.profiles import Profile
+from exts.archive import Archive
+
+
+class FakeMessage:
+    def __init__(self) -> None:
+        self.deleted = False
+
+    async def edit(self, **_: object) -> None:
+        pass
+
+    async def delete(self) -> None:
+        self.deleted = True
+
+
+class FakeContext:
+    def __init__(self) -> None:
+        self.messages: list[FakeMessage] = []
+
+    async def reply(self, **_: object) -> FakeMessage:
+        # lets the other invocation run while this one waits on discord
+        await asyncio.sleep(0)
+        message = FakeMessage()
+        self.messages.append(message)
+        return message
+
+
+def test_queue_archive_twice_at_once(monkeypatch: pytest.MonkeyPatch) -> None:
+    profile = Profile(
+        None,
+        {"archive_location": "archive", "github_name": "Test", "categories": []},
+    )
+
+    async def run() -> None:
+        monkeypatch.setattr(archive_queue, "ARCHIVES", archive_queue.ArchiveQueue(2))
+        finish = asyncio.Event()
+        started: list[FakeMessage] = []
+
+        async def archive(message: FakeMessage) -> None:
+            started.append(message)
+            await finish.wait()
+
+        ctx = FakeContext()
+        # queue_archive doesn't touch the extension itself
+        first = asyncio.create_task(
+            Archive.queue_archive(None, ctx, profile, "Starting", archive)  # type: ignore
+        )
+        second = asyncio.create_task(
+            Archive.queue_archive(None, ctx, profile, "Starting", archive)  # type: ignore
+        )
+
+        with pytest.raises(ipy.errors.BadArgument, match="already queued or running"):
+            await second
+        assert ctx.messages[1].deleted
+
+        finish.set()
+        await first
+        assert started == [ctx.messages[0]]
+
+    asyncio.run(run())
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from common.archive_queue import FairLimiter
+
+
+async def take_turns(limiter: FairLimiter, keys: list[str]) -> list[str]:
+    order: list[str] = []
+    release = asyncio.Event()
+
+    async def use_slot(key: str) -> None:
+        async with limiter.slot(key):
+            order.append(key)
+            await release.wait()
+
+    tasks = []
+    for key in keys:
+        tasks.append(asyncio.create_task(use_slot(key)))
+        # so the slots are asked for in this order
+        await asyncio.sleep(0)
+
+    release.set()
+    await asyncio.gather(*tasks)
+    return order
+
+
+def test_fair_limiter_takes_turns() -> None:
+    async def run() -> list[str]:
+        limiter = FairLimiter(1)
+        order = await take_turns(limiter, ["a", "a", "a", "b", "b", "c"])
+        assert limiter.in_use == 0
+        assert not limiter.waiters
+        return order
+
+    # the first "a" gets the free slot, then every key gets one in turn
+    assert asyncio.run(run()) == ["a", "a", "b", "c", "a", "b"]
+
+
+def test_fair_limiter_limit() -> None:
+    async def run() -> int:
+        limiter = FairLimiter(2)
+        active = peak = 0
+
+        async def use_slot(key: str) -> None:
+            nonlocal active, peak
+            async with limiter.slot(key):
+                active += 1
+                peak = max(peak, active)
+                await asyncio.sleep(0.01)
+                active -= 1
+
+        await asyncio.gather(*(use_slot(key) for key in "aabbcc"))
+        return peak
+
+    assert asyncio.run(run()) == 2
+
+
+def test_fair_limiter_cancelled_waiter() -> None:
+    async def run() -> None:
+        limiter = FairLimiter(1)
+        await limiter.acquire("a")
+
+        waiter = asyncio.create_task(limiter.acquire("b"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+        assert not limiter.waiters
+        limiter.release()
+        assert limiter.in_use == 0
+
+    asyncio.run(run())
+
+
+def test_fair_limiter_set_limit() -> None:
+    async def run() -> None:
+        limiter = FairLimiter(1)
+        await limiter.acquire("a")
+
+        waiter = asyncio.create_task(limiter.acquire("b"))
+        await asyncio.sleep(0)
+        assert not waiter.done()
+
+        # raising the limit hands the new slot out straight away
+        limiter.set_limit(2)
+        await asyncio.wait_for(waiter, 1)
+        assert limiter.in_use == 2
+
+    asyncio.run(run())
+
+    with pytest.raises(ValueError):
+        FairLimiter(0)
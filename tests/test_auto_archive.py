@@ -0,0 +1,120 @@
+import asyncio
+import functools
+import pathlib
+import types
+
+import interactions as ipy
+
+from common.dirty import DirtyChannels
+from common.profiles import Profile
+from exts.auto_archive import AutoArchive
+
+BOT_ID = 1
+
+
+def make_extension(
+    archive_location: str,
+) -> tuple[types.SimpleNamespace, DirtyChannels]:
+    profile = Profile(
+        None,
+        {
+            "archive_location": archive_location,
+            "github_name": "Test",
+            "categories": [{"id": 1}],
+        },
+    )
+    dirty = DirtyChannels(f"{archive_location}/.archive_dirty.json")
+    # the listeners only need what mark() looks at
+    extension = types.SimpleNamespace(
+        task=object(),
+        dirty={profile.archive_location: dirty},
+        category_profiles={1: profile},
+        bot=types.SimpleNamespace(user=types.SimpleNamespace(id=BOT_ID)),
+    )
+    extension.mark = functools.partial(AutoArchive.mark, extension)
+    return extension, dirty
+
+
+def make_channels() -> tuple[ipy.GuildText, ipy.GuildText, ipy.ThreadChannel]:
+    channels: dict[int, ipy.BaseChannel] = {}
+    client = types.SimpleNamespace(
+        cache=types.SimpleNamespace(get_channel=lambda i: channels.get(int(i)))
+    )
+    channel = ipy.GuildText.from_dict(
+        {"id": "10", "type": 0, "parent_id": "1", "guild_id": "5", "name": "a"},
+        client,
+    )
+    # in a category that isn't archived
+    other = ipy.GuildText.from_dict(
+        {"id": "20", "type": 0, "parent_id": "2", "guild_id": "5", "name": "b"},
+        client,
+    )
+    thread = ipy.GuildPublicThread.from_dict(
+        {"id": "11", "type": 11, "parent_id": "10", "guild_id": "5", "name": "c"},
+        client,
+    )
+    channels.update({10: channel, 20: other})
+    return channel, other, thread
+
+
+def message(channel: ipy.BaseChannel, message_id: int, author_id: int = 2) -> object:
+    return types.SimpleNamespace(
+        id=message_id, channel=channel, author=types.SimpleNamespace(id=author_id)
+    )
+
+
+def test_new_messages_are_marked(tmp_path: pathlib.Path) -> None:
+    extension, dirty = make_extension(str(tmp_path))
+    channel, other, thread = make_channels()
+
+    for event_message in (
+        message(channel, 100),
+        message(thread, 200),
+        message(other, 300),
+    ):
+        asyncio.run(
+            AutoArchive.on_message_create.callback(
+                extension, types.SimpleNamespace(message=event_message)
+            )
+        )
+
+    # threads are archived with their channel, and have their own last message
+    assert dirty.take() == ({10}, set(), {10: 100})
+
+
+def test_edits_and_deletes_force_a_refresh(tmp_path: pathlib.Path) -> None:
+    extension, dirty = make_extension(str(tmp_path))
+    channel, _, thread = make_channels()
+
+    asyncio.run(
+        AutoArchive.on_message_update.callback(
+            extension, types.SimpleNamespace(after=message(thread, 200))
+        )
+    )
+    asyncio.run(
+        AutoArchive.on_message_delete.callback(
+            extension, types.SimpleNamespace(message=message(channel, 100))
+        )
+    )
+    # like the progress messages archives keep editing
+    asyncio.run(
+        AutoArchive.on_message_update.callback(
+            extension, types.SimpleNamespace(after=message(channel, 300, BOT_ID))
+        )
+    )
+
+    assert dirty.take() == ({10}, {10, 11}, {})
+
+
+def test_nothing_is_marked_without_a_schedule(tmp_path: pathlib.Path) -> None:
+    extension, dirty = make_extension(str(tmp_path))
+    extension.task = None
+    channel, _, _ = make_channels()
+
+    asyncio.run(
+        AutoArchive.on_message_create.callback(
+            extension, types.SimpleNamespace(message=message(channel, 100))
+        )
+    )
+
+    assert not dirty
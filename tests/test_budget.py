@@ -0,0 +1,71 @@
+import asyncio
+import pathlib
+
+import pytest
+
+from common.budget import DiskBudget, format_size
+from common.scheduler import ExportScheduler
+
+
+def test_free_bytes_before_the_archive_exists(tmp_path: pathlib.Path) -> None:
+    budget = DiskBudget(str(tmp_path / "archive" / "category"), 0)
+
+    assert budget.free_bytes() > 0
+    assert budget.has_space()
+
+
+def test_available_bytes(monkeypatch: pytest.MonkeyPatch) -> None:
+    budget = DiskBudget("archive", 100)
+
+    monkeypatch.setattr(budget, "free_bytes", lambda: 150)
+    assert budget.available_bytes() == 50
+    monkeypatch.setattr(budget, "free_bytes", lambda: 50)
+    assert budget.available_bytes() == 0
+    assert not budget.has_space()
+
+
+def test_wait_for_space_pauses_exports(monkeypatch: pytest.MonkeyPatch) -> None:
+    budget = DiskBudget("archive", 100, poll_interval=0)
+    free = [0]
+    checks = 0
+
+    def free_bytes() -> int:
+        nonlocal checks
+        checks += 1
+        return free[0]
+
+    monkeypatch.setattr(budget, "free_bytes", free_bytes)
+
+    async def run() -> None:
+        scheduler = ExportScheduler(2, gate=budget.wait_for_space)
+        exported: list[int] = []
+
+        async def export(number: int) -> None:
+            exported.append(number)
+
+        for number in range(3):
+            scheduler.submit(lambda number=number: export(number))
+        for _ in range(10):
+            await asyncio.sleep(0)
+        assert not exported
+        # only one export polls the disk, the rest wait behind it
+        assert budget.lock.locked()
+
+        free[0] = 100
+        await scheduler.join()
+        assert sorted(exported) == [0, 1, 2]
+
+    asyncio.run(run())
+    assert checks >= 2
+
+
+def test_record() -> None:
+    budget = DiskBudget("archive", 0)
+
+    budget.record("category", 1024)
+    budget.record("category", 1024)
+    budget.record("other", 10)
+
+    assert budget.written == {"category": 2048, "other": 10}
+    assert budget.describe() == "- `category`: 2.0 KiB\n- `other`: 10.0 B"
+    assert format_size(3 * 1024**4) == "3.0 TiB"
@@ -0,0 +1,136 @@
+import pathlib
+
+from common import chatlog
+
+PREAMBLE = """<!DOCTYPE html>
+<html lang="en">
+<body>
+<div class="preamble">Channel</div>
+<div class="chatlog">
+"""
+
+POSTAMBLE = """</div>
+<div class="postamble">
+<div class="postamble__entry">Exported {message_count:,} message(s)</div>
+</div>
+</body>
+</html>
+"""
+
+
+def write_export(
+    path: pathlib.Path, message_ids: list[int], *, group_size: int = 1
+) -> None:
+    # shaped like DiscordChatExporter's html, down to what the parsing relies on
+    groups = [
+        message_ids[index : index + group_size]
+        for index in range(0, len(message_ids), group_size)
+    ]
+    body = "".join(
+        f"{chatlog.MESSAGE_GROUP_START}\n"
+        + "".join(
+            f'<div id="chatlog__message-container-{message_id}"'
+            f' class="chatlog__message-container" data-message-id="{message_id}">'
+            f"<div>Message {message_id}</div></div>\n"
+            for message_id in group
+        )
+        + "</div>\n"
+        for group in groups
+    )
+    path.write_text(
+        PREAMBLE + body + POSTAMBLE.format(message_count=len(message_ids)),
+        encoding="utf-8",
+    )
+
+
+def message_ids(path: pathlib.Path) -> list[int]:
+    return [
+        int(message_id)
+        for message_id in chatlog.MESSAGE_ID_REGEX.findall(path.read_text("utf-8"))
+    ]
+
+
+def test_split_export(tmp_path: pathlib.Path) -> None:
+    export_path = tmp_path / "export.html"
+    write_export(export_path, list(range(1, 11)))
+
+    pages = chatlog.split_export(str(export_path), str(tmp_path / "pages"), 4)
+
+    assert [page.messages for page in pages] == [4, 4, 2]
+    assert [(page.first_message_id, page.last_message_id) for page in pages] == [
+        (1, 4),
+        (5, 8),
+        (9, 10),
+    ]
+    assert message_ids(tmp_path / "pages" / "2.html") == [5, 6, 7, 8]
+    assert chatlog.count_messages(str(tmp_path / "pages" / "3.html")) == 2
+
+
+def test_split_export_keeps_groups_together(tmp_path: pathlib.Path) -> None:
+    export_path = tmp_path / "export.html"
+    write_export(export_path, list(range(1, 7)), group_size=3)
+
+    pages = chatlog.split_export(str(export_path), str(tmp_path / "pages"), 2)
+
+    assert [page.messages for page in pages] == [3, 3]
+
+
+def test_split_export_empty(tmp_path: pathlib.Path) -> None:
+    export_path = tmp_path / "export.html"
+    write_export(export_path, [])
+
+    pages = chatlog.split_export(str(export_path), str(tmp_path / "pages"), 100)
+
+    assert pages == [chatlog.Page(1, 0, None, None)]
+    assert chatlog.is_complete(str(tmp_path / "pages" / "1.html"))
+
+
+def test_split_export_from_page(tmp_path: pathlib.Path) -> None:
+    export_path = tmp_path / "export.html"
+    write_export(export_path, list(range(1, 4)))
+
+    pages = chatlog.split_export(
+        str(export_path), str(tmp_path / "pages"), 2, first_page=5
+    )
+
+    assert [page.number for page in pages] == [5, 6]
+    assert (tmp_path / "pages" / "6.html").exists()
+
+
+def test_merge_exports(tmp_path: pathlib.Path) -> None:
+    existing_path = tmp_path / "existing.html"
+    new_path = tmp_path / "new.html"
+    write_export(existing_path, [1, 2, 3])
+    write_export(new_path, [4, 5])
+
+    chatlog.merge_exports(str(existing_path), str(new_path))
+
+    assert message_ids(existing_path) == [1, 2, 3, 4, 5]
+    assert chatlog.count_messages(str(existing_path)) == 5
+    assert chatlog.is_complete(str(existing_path))
+
+
+def test_merge_exports_drops_seen_messages(tmp_path: pathlib.Path) -> None:
+    existing_path = tmp_path / "existing.html"
+    new_path = tmp_path / "new.html"
+    write_export(existing_path, [1, 2, 3, 4], group_size=2)
+    # the first group is only partly new
+    write_export(new_path, [3, 4, 5, 6, 7], group_size=3)
+
+    chatlog.merge_exports(str(existing_path), str(new_path))
+
+    assert message_ids(existing_path) == [1, 2, 3, 4, 5, 6, 7]
+    assert chatlog.count_messages(str(existing_path)) == 7
+    assert chatlog.last_message_id(str(existing_path)) == 7
+
+
+def test_merge_exports_nothing_new(tmp_path: pathlib.Path) -> None:
+    existing_path = tmp_path / "existing.html"
+    new_path = tmp_path / "new.html"
+    write_export(existing_path, [1, 2])
+    write_export(new_path, [])
+
+    chatlog.merge_exports(str(existing_path), str(new_path))
+
+    assert message_ids(existing_path) == [1, 2]
+    assert chatlog.count_messages(str(existing_path)) == 2
@@ -0,0 +1,54 @@
+import pathlib
+
+from common.dirty import DirtyChannels
+
+
+def test_mark_and_take(tmp_path: pathlib.Path) -> None:
+    dirty = DirtyChannels(str(tmp_path / ".archive_dirty.json"))
+    assert not dirty
+
+    dirty.mark(10, message_id=100)
+    dirty.mark(10, message_id=90)
+    dirty.mark(10, refresh=11)
+    dirty.mark(20)
+
+    assert dirty
+    # the newest message wins, whatever order they were seen in
+    assert dirty.take() == ({10, 20}, {11}, {10: 100})
+    assert not dirty
+    assert (dirty.refresh, dirty.last_message_ids) == (set(), {})
+
+
+def test_restore(tmp_path: pathlib.Path) -> None:
+    dirty = DirtyChannels(str(tmp_path / ".archive_dirty.json"))
+    dirty.mark(10, refresh=10, message_id=100)
+    taken = dirty.take()
+
+    # more activity while the failed archive was running
+    dirty.mark(10, message_id=120)
+    dirty.mark(30, refresh=31)
+    dirty.restore(*taken)
+
+    assert dirty.take() == ({10, 30}, {10, 31}, {10: 120})
+
+
+def test_save_and_load(tmp_path: pathlib.Path) -> None:
+    path = tmp_path / "archive" / ".archive_dirty.json"
+    dirty = DirtyChannels(str(path))
+    dirty.mark(10, refresh=11, message_id=100)
+    dirty.save()
+    assert not dirty.unsaved
+
+    path.unlink()
+    # nothing changed since, so there's nothing to write
+    dirty.save()
+    assert not path.exists()
+
+    dirty.mark(20)
+    dirty.save()
+    loaded = DirtyChannels(str(path))
+    assert (loaded.channels, loaded.refresh, loaded.last_message_ids) == (
+        {10, 20},
+        {11},
+        {10: 100},
+    )
@@ -0,0 +1,73 @@
+import asyncio
+import pathlib
+
+import pytest
+
+from common import exporter
+from common.exporter import Exporter
+
+
+def test_build_args() -> None:
+    cli = Exporter("cli", "token", parallel=4, media_folder="archive/.media_cache")
+
+    assert cli.build_args([1, 2], "archive/category") == [
+        "export",
+        "-c",
+        "1",
+        "2",
+        "-o",
+        "archive/category/%c.html",
+        "--utc",
+        "--parallel",
+        "4",
+        "--fuck-russia",
+        "--media",
+        "--reuse-media",
+        "--media-dir",
+        "archive/.media_cache",
+    ]
+
+
+def test_build_args_json_without_media() -> None:
+    cli = Exporter("cli", "token", media=False, export_json=True)
+
+    args = cli.build_args([1], "archive/category", after=123)
+
+    assert args[args.index("-o") + 1] == "archive/category/%c.json"
+    assert args[-4:] == ["--format", "Json", "--after", "123"]
+    assert "--media" not in args
+
+
+def test_batch() -> None:
+    cli = Exporter("cli", "token", max_batch_size=2)
+
+    assert cli.batch([1, 2, 3, 4, 5]) == [[1, 2], [3, 4], [5]]
+    assert cli.batch([]) == []
+
+
+def test_batch_argument_length(monkeypatch: pytest.MonkeyPatch) -> None:
+    # every id takes up its length plus a space
+    monkeypatch.setattr(exporter, "MAX_ARGUMENT_LENGTH", 10)
+    cli = Exporter("cli", "token")
+
+    assert cli.batch([1000, 2000, 3000]) == [[1000, 2000], [3000]]
+
+
+def test_start_without_a_shell(tmp_path: pathlib.Path) -> None:
+    executable = tmp_path / "cli"
+    executable.write_text(
+        '#!/bin/sh\necho "$DISCORD_TOKEN"\nfor arg; do echo "$arg"; done\n'
+    )
+    executable.chmod(0o755)
+    cli = Exporter(str(executable), "secret token", media=False)
+
+    async def run() -> list[str]:
+        process = await cli.start([1], "folder with spaces; $(echo oops)")
+        stdout, _ = await process.communicate()
+        return stdout.decode().splitlines()
+
+    output = asyncio.run(run())
+    # the token is only ever in the environment
+    assert output[0] == "secret token"
+    assert "secret token" not in output[1:]
+    assert "folder with spaces; $(echo oops)/%c.html" in output
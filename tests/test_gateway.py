@@ -0,0 +1,49 @@
+import types
+
+import interactions as ipy
+from interactions.client.utils.cache import NullCache
+
+from common.gateway import LEAN_INTENTS, client_options, memory_report
+
+
+def test_client_options_default() -> None:
+    assert client_options({}) == {
+        "intents": ipy.Intents.DEFAULT | ipy.Intents.MESSAGE_CONTENT
+    }
+
+
+def test_client_options_lean() -> None:
+    options = client_options(
+        {"lean_mode": True, "member_cache_ttl": 60, "member_cache_size": 2}
+    )
+
+    assert options["intents"] == LEAN_INTENTS
+    assert not options["intents"] & ipy.Intents.GUILD_PRESENCES
+    assert isinstance(options["message_cache"], NullCache)
+
+    # the member cache never grows past its limit
+    member_cache = options["member_cache"]
+    for member_id in range(5):
+        member_cache[member_id] = member_id
+    assert len(member_cache) == 2
+
+
+def test_memory_report() -> None:
+    bot = types.SimpleNamespace(
+        intents=LEAN_INTENTS,
+        cache=types.SimpleNamespace(
+            guild_cache={1: None},
+            channel_cache={1: None, 2: None, 3: None},
+            member_cache={},
+            user_cache={},
+            role_cache={},
+            message_cache=NullCache(),
+        ),
+    )
+
+    report = memory_report(bot)  # type: ignore
+
+    assert report.startswith("RSS: ")
+    assert "Intents: lean" in report
+    assert "- Channels: 3" in report
+    assert "- Messages: 0" in report
@@ -0,0 +1,60 @@
+from common.metrics import MetricsRegistry
+
+
+def test_counter() -> None:
+    registry = MetricsRegistry()
+    counter = registry.counter("test_total", "Things counted.")
+
+    counter.inc(result="success", category="a")
+    counter.inc(2, result="failure", category="a")
+    counter.inc(0.5, result="success", category='b"\n')
+
+    assert counter.get() == 3.5
+    assert counter.get(result="success") == 1.5
+    assert counter.by_label("category") == {"a": 3, 'b"\n': 0.5}
+    assert registry.render() == (
+        "# HELP test_total Things counted.\n"
+        "# TYPE test_total counter\n"
+        'test_total{category="a",result="success"} 1\n'
+        'test_total{category="a",result="failure"} 2\n'
+        'test_total{category="b\\"\\n",result="success"} 0.5\n'
+    )
+
+
+def test_histogram() -> None:
+    registry = MetricsRegistry()
+    histogram = registry.histogram("test_seconds", "Time taken.", (0.5, 1))
+
+    histogram.observe(0.25, stage="exports")
+    histogram.observe(1, stage="exports")
+    histogram.observe(5, stage="exports")
+    histogram.observe(2, stage="search")
+
+    assert histogram.get() == (4, 8.25)
+    assert histogram.get(stage="exports") == (3, 6.25)
+    # buckets count everything up to and including their bound
+    assert registry.render() == (
+        "# HELP test_seconds Time taken.\n"
+        "# TYPE test_seconds histogram\n"
+        'test_seconds_bucket{stage="exports",le="0.5"} 1\n'
+        'test_seconds_bucket{stage="exports",le="1"} 2\n'
+        'test_seconds_bucket{stage="exports",le="+Inf"} 3\n'
+        'test_seconds_sum{stage="exports"} 6.25\n'
+        'test_seconds_count{stage="exports"} 3\n'
+        'test_seconds_bucket{stage="search",le="0.5"} 0\n'
+        'test_seconds_bucket{stage="search",le="1"} 0\n'
+        'test_seconds_bucket{stage="search",le="+Inf"} 1\n'
+        'test_seconds_sum{stage="search"} 2.0\n'
+        'test_seconds_count{stage="search"} 1\n'
+    )
+
+
+def test_histogram_time() -> None:
+    histogram = MetricsRegistry().histogram("test_seconds", "Time taken.")
+
+    with histogram.time(stage="exports"):
+        pass
+
+    count, total = histogram.get(stage="exports")
+    assert count == 1
+    assert 0 <= total < 1
@@ -0,0 +1,116 @@
+import asyncio
+import pathlib
+
+import pytest
+
+from common import chatlog, native_export, render
+from common.models import Category, Channel
+from common.native_export import NativeExporter
+from common.profiles import Profile
+
+
+def make_message(message_id: int, **fields: object) -> dict:
+    return {
+        "id": str(message_id),
+        "type": 0,
+        "timestamp": "2024-01-01T00:00:00+00:00",
+        "content": f"Message {message_id}",
+        "author": {"id": "1", "username": "kaede", "avatar": None},
+        **fields,
+    }
+
+
+class FakeHTTP:
+    def __init__(self, messages: list[dict]) -> None:
+        self.messages = messages
+        self.requests: list[tuple[int, int]] = []
+
+    async def get_channel_messages(
+        self, channel_id: int, limit: int, *, after: int
+    ) -> list[dict]:
+        self.requests.append((channel_id, after))
+        page = [m for m in self.messages if int(m["id"]) > after][:limit]
+        # newest first, like discord
+        return page[::-1]
+
+
+def test_convert_message() -> None:
+    message = make_message(
+        10,
+        type=19,
+        content="<@2> said <a:wave:3> and <@!4>",
+        mentions=[{"id": "2", "username": "mika", "global_name": "Mika"}],
+        member={"nick": "Kaede!"},
+        edited_timestamp="2024-01-02T00:00:00+00:00",
+        attachments=[{"id": "5", "url": "https://cdn/a.png", "filename": "a.png"}],
+        embeds=[
+            {"title": "Title", "color": 255, "fields": [{"name": "n", "value": "v"}]}
+        ],
+        sticker_items=[{"id": "6", "name": "sticker", "format_type": 4}],
+        reactions=[{"emoji": {"id": None, "name": "👍"}, "count": 2}],
+        message_reference={"message_id": "9", "channel_id": "8"},
+    )
+
+    converted = asyncio.run(NativeExporter(None).convert_message(message))  # type: ignore
+
+    assert converted["type"] == "Reply"
+    # unknown mentions are left alone
+    assert converted["content"] == "@Mika said :wave: and <@!4>"
+    assert converted["inlineEmojis"] == [
+        {
+            "id": "3",
+            "name": "wave",
+            "isAnimated": True,
+            "imageUrl": "https://cdn.discordapp.com/emojis/3.gif",
+        }
+    ]
+    assert converted["author"]["nickname"] == "Kaede!"
+    assert converted["author"]["avatarUrl"].endswith("/embed/avatars/0.png")
+    assert converted["timestampEdited"] == "2024-01-02T00:00:00+00:00"
+    # without a media folder, attachments link back to discord
+    assert converted["attachments"][0]["url"] == "https://cdn/a.png"
+    assert converted["embeds"][0]["color"] == "#0000ff"
+    assert converted["embeds"][0]["fields"][0]["isInline"] is False
+    assert converted["stickers"][0]["sourceUrl"].endswith("/6.gif")
+    assert converted["reactions"] == [
+        {"emoji": {"id": None, "name": "👍", "isAnimated": False}, "count": 2}
+    ]
+    assert converted["reference"]["messageId"] == "9"
+
+
+def test_convert_system_message() -> None:
+    converted = asyncio.run(
+        NativeExporter(None).convert_message(make_message(10, type=7))  # type: ignore
+    )
+
+    assert (converted["type"], converted["content"]) == (
+        "GuildMemberJoin",
+        "Joined the server.",
+    )
+
+
+@pytest.mark.parametrize("extension", ["html", "json"])
+def test_export(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch, extension: str
+) -> None:
+    monkeypatch.setattr(native_export, "PAGE_SIZE", 2)
+    profile = Profile(None, {"archive_location": str(tmp_path), "github_name": "Test"})
+    channel = Channel(
+        1, "channel", Category(2, "Category", "category", profile=profile)
+    )
+    http = FakeHTTP([make_message(message_id) for message_id in range(10, 15)])
+    output_path = tmp_path / "category" / f"1.{extension}"
+
+    message_count = asyncio.run(
+        NativeExporter(http).export(channel, str(output_path), after=10)  # type: ignore
+    )
+
+    assert message_count == 4
+    # pages are fetched oldest first, each starting after the last
+    assert http.requests == [(1, 10), (1, 12), (1, 14)]
+    if extension == "json":
+        with render.JsonExportReader(str(output_path)) as reader:
+            assert [m["id"] for m in reader.messages()] == ["11", "12", "13", "14"]
+    else:
+        assert chatlog.count_messages(str(output_path)) == 4
+        assert chatlog.last_message_id(str(output_path)) == 14
@@ -0,0 +1,78 @@
+import pathlib
+
+import pytest
+
+from common.job import ArchiveJob
+from common.models import Category, Channel
+from common.pipeline import ArchivePipeline
+from common.profiles import Profile
+
+
+def make_pipeline(
+    archive: pathlib.Path, refresh: set[int] | None = None, **settings: object
+) -> tuple[ArchivePipeline, Category]:
+    profile = Profile(
+        None,
+        {
+            "archive_location": str(archive),
+            "github_name": "Test",
+            "categories": [],
+            **settings,
+        },
+    )
+    category = Category(1, "Category", "category", profile=profile)
+    job = ArchiveJob(str(archive / ".archive_job.json"), 0, [])
+    return ArchivePipeline(job, profile, refresh=refresh), category
+
+
+def exported(
+    pipeline: ArchivePipeline, channel: Channel, last_message_id: int | None
+) -> None:
+    path = pathlib.Path(channel.path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text("<html></html>", encoding="utf-8")
+    pipeline.manifest.record(channel.id, last_message_id, channel.path, messages=1)
+
+
+@pytest.fixture(autouse=True)
+def environment(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("CLI_EXECUTABLE", "DiscordChatExporter.Cli")
+    monkeypatch.setenv("MAIN_TOKEN", "token")
+
+
+def test_plan_exports(tmp_path: pathlib.Path) -> None:
+    pipeline, category = make_pipeline(tmp_path, refresh={13})
+    channels = {
+        channel_id: Channel(channel_id, "channel", category, last_message_id=20)
+        for channel_id in range(10, 17)
+    }
+    # 10 has never been exported
+    exported(pipeline, channels[11], 15)
+    exported(pipeline, channels[12], 20)
+    # messages in 13 were edited, so it's exported again from scratch
+    exported(pipeline, channels[13], 15)
+    # 14 was deleted from disk since
+    exported(pipeline, channels[14], 15)
+    pathlib.Path(channels[14].path).unlink()
+    exported(pipeline, channels[15], None)
+    exported(pipeline, channels[16], 15)
+    pipeline.job.mark_completed(16)
+
+    incremental, batches = pipeline.plan_exports(list(channels.values()))
+
+    assert incremental == [(channels[11], 15)]
+    assert batches == [[channels[10], channels[13], channels[14], channels[15]]]
+
+
+@pytest.mark.parametrize(
+    "settings", [{"messages_per_page": 100}, {"export_format": "json"}]
+)
+def test_plan_exports_settings_changed(
+    tmp_path: pathlib.Path, settings: dict[str, object]
+) -> None:
+    # there are no pages or json to add the new messages to yet
+    pipeline, category = make_pipeline(tmp_path, **settings)
+    channel = Channel(10, "channel", category, last_message_id=20)
+    exported(pipeline, channel, 15)
+
+    assert pipeline.plan_exports([channel]) == ([], [[channel]])
@@ -0,0 +1,117 @@
+import pathlib
+
+from common.manifest import ExportManifest, ManifestEntry
+from common.models import Category, Channel, Thread
+from common.plan import (
+    DISCORD_EPOCH,
+    MILLISECONDS_PER_DAY,
+    ArchivePlan,
+    PlannedExport,
+    estimate_messages,
+    format_duration,
+    messages_per_day,
+)
+from common.profiles import Profile
+
+PROFILE = Profile(
+    None, {"archive_location": "archive", "github_name": "Test", "categories": []}
+)
+CATEGORY = Category(1, "Category", "category", profile=PROFILE)
+
+
+def snowflake(day: float) -> int:
+    return round(day * MILLISECONDS_PER_DAY - DISCORD_EPOCH) << 22
+
+
+def entry(last_message_id: int | None, messages: int | None) -> ManifestEntry:
+    return ManifestEntry(last_message_id, "", "", "", messages)
+
+
+def test_estimate_messages_thread() -> None:
+    thread = Thread(
+        snowflake(20000),
+        "thread",
+        Channel(1, "channel", CATEGORY),
+        last_message_id=snowflake(20001),
+        message_count=50,
+    )
+
+    assert estimate_messages(thread, None, 100) == 50
+    assert estimate_messages(thread, entry(snowflake(20000.5), 30), 100) == 20
+    # messages were deleted since the last export
+    assert estimate_messages(thread, entry(snowflake(20000.5), 60), 100) == 0
+
+
+def test_estimate_messages_channel() -> None:
+    channel = Channel(
+        snowflake(20000), "channel", CATEGORY, last_message_id=snowflake(20010)
+    )
+
+    assert estimate_messages(channel, None, 100) == 1000
+    assert estimate_messages(channel, entry(snowflake(20008), 500), 100) == 200
+    # there's always at least one new message to export
+    assert estimate_messages(channel, entry(snowflake(20010), 500), 100) == 1
+    channel.last_message_id = None
+    assert estimate_messages(channel, None, 100) == 0
+
+
+def test_messages_per_day(tmp_path: pathlib.Path) -> None:
+    manifest = ExportManifest(str(tmp_path / ".archive_manifest.json"))
+    assert messages_per_day(manifest) == 100
+
+    manifest.entries = {
+        snowflake(20000): entry(snowflake(20010), 500),
+        snowflake(20000.5): entry(snowflake(20000.5), 10),
+        # never exported anything, so it says nothing about how busy it is
+        snowflake(20005): entry(None, 0),
+    }
+    # a channel younger than a day still counts as one
+    assert messages_per_day(manifest) == 510 / 11
+
+
+def test_archive_plan() -> None:
+    archive_plan = ArchivePlan(
+        2,
+        0.5,
+        1024,
+        available_bytes=100 * 1024,
+        categories=1,
+        channels=3,
+        threads=1,
+        skipped=1,
+        exports=[
+            PlannedExport("category", [1, 2], 100, incremental=False),
+            PlannedExport("category", [3], 20, incremental=True),
+            PlannedExport("category", [4], 10, incremental=False, native=True),
+        ],
+    )
+
+    assert archive_plan.messages == 130
+    # the run can't be quicker than its longest export
+    assert archive_plan.projected_duration == 50
+    assert archive_plan.estimated_bytes == 130 * 1024
+    assert not archive_plan.fits
+    assert not archive_plan.guessed_size
+
+    description = archive_plan.describe()
+    assert "CLI invocations: 2, 2 at a time" in description
+    assert "Exported through the bot: 1" in description
+    assert "this might not fit!" in description
+    assert (
+        "- `category`: 2 full export(s) (2, 1 channel(s)), 1 incremental export(s),"
+        " ~130 message(s)"
+    ) in description
+
+
+def test_archive_plan_without_previous_runs() -> None:
+    archive_plan = ArchivePlan(4, None)
+    archive_plan.exports.append(PlannedExport("category", [1], 100, False))
+
+    assert archive_plan.guessed_size
+    assert archive_plan.fits
+    assert "rough guess" in archive_plan.describe()
+
+
+def test_format_duration() -> None:
+    assert format_duration(59) == "0m 59s"
+    assert format_duration(3725) == "1h 2m"
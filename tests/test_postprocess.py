@@ -0,0 +1,78 @@
+import gzip
+import pathlib
+
+from common import chatlog, postprocess
+from common.render import ChatlogRenderer
+
+CONTENT = "  indented\n\n    code   and  spaces  "
+
+
+def write_page(path: pathlib.Path) -> None:
+    renderer = ChatlogRenderer()
+    messages = [
+        {
+            "id": str(message_id),
+            "timestamp": "2024-01-01T00:00:00+00:00",
+            "content": CONTENT,
+            "author": {"id": "1", "name": "Kaede"},
+        }
+        for message_id in (1, 2, 3)
+    ]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(
+        renderer.preamble("channel")
+        + "<!-- a comment -->\n"
+        + renderer.render(messages)
+        + renderer.postamble(),
+        encoding="utf-8",
+    )
+
+
+def test_minify_html() -> None:
+    content = (
+        "<div>\n    <span>a   b</span>\n    <!-- gone -->\n"
+        '<pre>  kept\n  as is</pre><br/>\n<p class="chatlog__markdown-preserve">'
+        "  kept  </p>  &amp; &#39;\n</div>"
+    )
+
+    minified = postprocess.minify_html(content)
+
+    assert minified == (
+        "<div>\n<span>a b</span>\n\n<pre>  kept\n  as is</pre><br/>\n"
+        '<p class="chatlog__markdown-preserve">  kept  </p> &amp; &#39;\n</div>'
+    )
+
+
+def test_process_file(tmp_path: pathlib.Path) -> None:
+    page_path = tmp_path / "category" / "1.html"
+    write_page(page_path)
+    original_size = page_path.stat().st_size
+    options = postprocess.PostProcessOptions(
+        minify=True, stylesheet_folder=str(tmp_path / "styles"), compress=True
+    )
+
+    before, after = postprocess.process_file(str(page_path), options)
+
+    content = page_path.read_text("utf-8")
+    assert (before, after) == (original_size, page_path.stat().st_size)
+    assert after < before
+    assert "<style>" not in content
+    assert "a comment" not in content
+    assert CONTENT in content
+    assert gzip.decompress((tmp_path / "category" / "1.html.gz").read_bytes()) == (
+        content.encode()
+    )
+
+    # the page still reads the same way to everything that looks at it later
+    assert chatlog.count_messages(str(page_path)) == 3
+    assert chatlog.last_message_id(str(page_path)) == 3
+    assert chatlog.is_complete(str(page_path))
+
+    # every page shares the one stylesheet
+    (stylesheet,) = (tmp_path / "styles").iterdir()
+    assert f'<link rel="stylesheet" href="../styles/{stylesheet.name}">' in content
+    other_path = tmp_path / "category" / "2" / "3.html"
+    write_page(other_path)
+    postprocess.process_file(str(other_path), options)
+    assert list((tmp_path / "styles").iterdir()) == [stylesheet]
+    assert f"../../styles/{stylesheet.name}" in other_path.read_text("utf-8")
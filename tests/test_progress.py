@@ -0,0 +1,61 @@
+import asyncio
+
+from common.progress import ActiveExport, ExportProgress, iter_lines
+
+
+def test_iter_lines() -> None:
+    async def run() -> list[str]:
+        stream = asyncio.StreamReader()
+        # progress bars redraw over themselves, and chunks end anywhere
+        stream.feed_data(b"\x1b[32mExporting\x1b[0m  10%\r  5")
+        stream.feed_data(b"0%\r100%\n\nSuccessfully exported 2 channel(s).")
+        stream.feed_eof()
+        return [line async for line in iter_lines(stream)]
+
+    assert asyncio.run(run()) == [
+        "Exporting  10%",
+        "50%",
+        "100%",
+        "Successfully exported 2 channel(s).",
+    ]
+
+
+def test_active_export_feed() -> None:
+    export = ActiveExport("category", [1, 2, 3])
+
+    export.feed("")
+    export.feed("Exporting channel... 42.5%")
+    assert export.percent == 42.5
+
+    export.feed("Rate limited, waiting 5 seconds")
+    export.feed("Successfully exported 2 channel(s).")
+    export.feed("Failed to export 1 channel(s).")
+
+    assert (export.exported, export.failed, export.rate_limits) == (2, 1, 1)
+    assert list(export.output)[-1] == "Failed to export 1 channel(s)."
+
+
+def test_export_progress() -> None:
+    progress = ExportProgress()
+    progress.queue(3)
+
+    first = progress.start("category", [1, 2])
+    first.feed("Successfully exported 1 channel(s).")
+    first.feed("Failed to export 1 channel(s).")
+    second = progress.start("category/threads", [3, 4])
+    # older versions of the cli don't say how it went, so the exit code does
+    third = progress.start("other", [5])
+    progress.finish(first, 1, messages=100, size=1000)
+    result = progress.finish(second, 0, messages=50)
+    progress.finish(third, 1, messages=0)
+
+    assert (result.exported, result.failed, result.succeeded) == (2, 0, True)
+    assert (progress.channels_exported, progress.channels_failed) == (3, 2)
+    assert progress.messages == 150
+    assert not progress.active
+
+    progress.notice = "Paused"
+    description = progress.describe()
+    assert description.startswith("**Paused**")
+    assert "Exports: 3/3 done, 0 running" in description
+    assert "Channels: 3 exported, 2 failed" in description
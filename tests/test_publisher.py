@@ -0,0 +1,82 @@
+import asyncio
+import pathlib
+import subprocess
+
+from common.manifest import ExportManifest
+from common.models import Category
+from common.profiles import Profile
+from common.publisher import GitPublisher
+
+
+def git(*args: str) -> str:
+    return subprocess.run(
+        ("git", *args), check=True, capture_output=True, text=True
+    ).stdout
+
+
+def write(path: pathlib.Path, content: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content, encoding="utf-8")
+
+
+def test_publish(tmp_path: pathlib.Path) -> None:
+    remote = tmp_path / "remote.git"
+    archive = tmp_path / "archive"
+    git("init", "--quiet", "--bare", str(remote))
+    git("init", "--quiet", str(archive))
+    git("-C", str(archive), "config", "user.name", "Test")
+    git("-C", str(archive), "config", "user.email", "test@example.com")
+
+    profile = Profile(
+        None,
+        {"archive_location": str(archive), "github_name": "Test", "categories": []},
+    )
+    category = Category(1, "Category", "category", profile=profile)
+    manifest = ExportManifest(str(archive / ".archive_manifest.json"))
+
+    write(archive / "README.md", "# Archive")
+    write(archive / "category" / "category.md", "- channel")
+    write(archive / "category" / "2.html", "<html>channel</html>")
+    manifest.record(2, 10, str(archive / "category" / "2.html"), messages=1)
+    write(archive / "media" / "ab" / "abc.png", "not really a png")
+    write(archive / "search" / "index.json", "{}")
+    # none of these are ever published
+    write(archive / "search" / ".search_cache" / "2.json", "{}")
+    write(archive / ".search_cache" / "2.json", "{}")
+    write(archive / ".media_cache" / "avatar.png", "not really a png")
+    write(archive / "category" / ".incremental" / "2" / "2.html", "<html></html>")
+
+    # every file is bigger than a batch, so each gets a commit of its own
+    publisher = GitPublisher(
+        str(archive), remote=str(remote), branch="main", max_batch_size=1
+    )
+    result = asyncio.run(publisher.publish(manifest, [category]))
+
+    published = {
+        "README.md",
+        "category/2.html",
+        "category/category.md",
+        "media/ab/abc.png",
+        "search/index.json",
+    }
+    assert (result.files, result.commits) == (5, 5)
+    assert git("--git-dir", str(remote), "rev-list", "--count", "main").strip() == "5"
+    assert (
+        set(
+            git(
+                "--git-dir", str(remote), "ls-tree", "-r", "--name-only", "main"
+            ).split()
+        )
+        == published
+    )
+    assert publisher.load_published_at() is not None
+
+    # only exports made since the last publish are looked at again
+    write(archive / "category" / "2.html", "<html>channel, again</html>")
+    result = asyncio.run(publisher.publish(manifest, [category]))
+    assert result.commits == 0
+
+    manifest.record(2, 11, str(archive / "category" / "2.html"), messages=2)
+    result = asyncio.run(publisher.publish(manifest, [category]))
+    assert (result.files, result.commits) == (1, 1)
+    assert git("--git-dir", str(remote), "rev-list", "--count", "main").strip() == "6"
@@ -0,0 +1,120 @@
+import json
+import pathlib
+
+import pytest
+
+from common import chatlog, render
+
+
+def make_message(message_id: int) -> dict:
+    return {
+        "id": str(message_id),
+        "timestamp": "2024-01-01T00:00:00+00:00",
+        "content": f"Message {message_id}, with a ] and a }} in it",
+        "author": {"id": "1", "name": "Kaede"},
+        "attachments": [],
+        "embeds": [],
+    }
+
+
+def write_export(path: pathlib.Path, message_ids: list[int]) -> None:
+    # indented like DiscordChatExporter's own
+    path.write_text(
+        json.dumps(
+            {
+                "guild": {"id": "0", "name": "Guild"},
+                "channel": {"id": "1", "category": "Category", "name": "channel"},
+                "messages": [make_message(message_id) for message_id in message_ids],
+                "messageCount": len(message_ids),
+            },
+            indent=2,
+        ),
+        encoding="utf-8",
+    )
+
+
+def read_ids(path: pathlib.Path) -> list[int]:
+    with render.JsonExportReader(str(path)) as reader:
+        return [int(message["id"]) for message in reader.messages()]
+
+
+@pytest.mark.parametrize("read_size", [7, 64 * 1024])
+def test_json_export_reader(
+    tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch, read_size: int
+) -> None:
+    # small reads cut messages off partway through
+    monkeypatch.setattr(render, "READ_SIZE", read_size)
+    export_path = tmp_path / "export.json"
+    write_export(export_path, list(range(1, 51)))
+
+    with render.JsonExportReader(str(export_path)) as reader:
+        assert reader.header["channel"]["name"] == "channel"
+        messages = list(reader.messages())
+
+    assert messages == [make_message(message_id) for message_id in range(1, 51)]
+
+
+def test_json_export_reader_empty(tmp_path: pathlib.Path) -> None:
+    export_path = tmp_path / "export.json"
+    write_export(export_path, [])
+
+    assert read_ids(export_path) == []
+
+
+def test_json_export_reader_not_an_export(tmp_path: pathlib.Path) -> None:
+    export_path = tmp_path / "export.json"
+    export_path.write_text('{"guild": {"id": "0"}}', encoding="utf-8")
+
+    with pytest.raises(ValueError, match="does not look like"):
+        render.JsonExportReader(str(export_path))
+
+
+def test_merge_json_exports(tmp_path: pathlib.Path) -> None:
+    existing_path = tmp_path / "existing.json"
+    new_path = tmp_path / "new.json"
+    write_export(existing_path, [1, 2, 3])
+    write_export(new_path, [3, 4, 5])
+
+    render.merge_json_exports(str(existing_path), str(new_path))
+
+    assert read_ids(existing_path) == [1, 2, 3, 4, 5]
+    data = json.loads(existing_path.read_text("utf-8"))
+    assert data["messageCount"] == 5
+    assert data["channel"]["name"] == "channel"
+
+
+def test_render_export(tmp_path: pathlib.Path) -> None:
+    export_path = tmp_path / "export.json"
+    html_path = tmp_path / "export.html"
+    write_export(export_path, [1, 2, 3])
+
+    assert render.render_export(str(export_path), str(html_path)) == 3
+    assert chatlog.count_messages(str(html_path)) == 3
+    assert chatlog.last_message_id(str(html_path)) == 3
+    assert chatlog.is_complete(str(html_path))
+
+
+@pytest.mark.parametrize(
+    ("content", "rendered"),
+    [
+        ("**a *b* c**", "<strong>a <em>b</em> c</strong>"),
+        # the spans overlap, so the one closed first wins and the other is text
+        ("**a *b** c*", "<strong>a *b</strong> c*"),
+        ("*a **b* c**", "<em>a **b</em> c**"),
+        ("||a ~~b|| c~~", '<span class="chatlog__markdown-spoiler">a ~~b</span> c~~'),
+        ("snake_case_name", "snake_case_name"),
+        ("* not italic *", "* not italic *"),
+        ("**<b>**", "<strong>&lt;b&gt;</strong>"),
+        (
+            "`**code**` **bold**",
+            (
+                '<code class="chatlog__markdown-pre chatlog__markdown-pre--inline">'
+                "**code**</code> <strong>bold</strong>"
+            ),
+        ),
+        # spans never run past a quote
+        ("**a\n> b**", '**a\n<div class="chatlog__markdown-quote">b**</div>'),
+    ],
+)
+def test_render_markdown(content: str, rendered: str) -> None:
+    assert render.render_markdown(content) == rendered
@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+from common.scheduler import ExportScheduler
+
+
+def test_scheduler_limit() -> None:
+    async def run() -> int:
+        scheduler = ExportScheduler(2)
+        running = 0
+        most_running = 0
+
+        async def export() -> None:
+            nonlocal running, most_running
+            running += 1
+            most_running = max(most_running, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        for _ in range(6):
+            scheduler.submit(export)
+        await scheduler.join()
+        return most_running
+
+    assert asyncio.run(run()) == 2
+
+
+def test_scheduler_dependencies() -> None:
+    async def run() -> list[str]:
+        scheduler = ExportScheduler(4)
+        order: list[str] = []
+
+        async def export(name: str, delay: float) -> None:
+            await asyncio.sleep(delay)
+            order.append(name)
+
+        category = scheduler.submit(lambda: export("category", 0.02))
+        thread = scheduler.submit(lambda: export("thread", 0), depends_on=[category])
+        scheduler.submit(lambda: export("channel", 0))
+        scheduler.submit(lambda: export("index", 0), depends_on=[thread])
+        await scheduler.join()
+        return order
+
+    # the threads of a channel wait for the channel, however quick they are
+    assert asyncio.run(run()) == ["channel", "category", "thread", "index"]
+
+
+def test_scheduler_resize_and_unbounded() -> None:
+    async def run() -> None:
+        scheduler = ExportScheduler(1)
+        release = asyncio.Event()
+        started: list[int] = []
+
+        async def export(number: int) -> None:
+            started.append(number)
+            await release.wait()
+
+        for number in range(3):
+            scheduler.submit(lambda number=number: export(number))
+        # unbounded jobs never wait for a slot
+        scheduler.submit(lambda: export(3), bounded=False)
+        await asyncio.sleep(0)
+        assert started == [0, 3]
+
+        scheduler.resize(3)
+        await asyncio.sleep(0)
+        assert sorted(started) == [0, 1, 2, 3]
+
+        release.set()
+        await scheduler.join()
+
+    asyncio.run(run())
+
+
+def test_scheduler_gate() -> None:
+    async def run() -> None:
+        opened = asyncio.Event()
+        started: list[int] = []
+
+        async def gate() -> None:
+            await opened.wait()
+
+        async def export() -> None:
+            started.append(1)
+
+        scheduler = ExportScheduler(2, gate=gate)
+        scheduler.submit(export)
+        await asyncio.sleep(0.01)
+        assert not started
+
+        opened.set()
+        await scheduler.join()
+        assert started == [1]
+
+    asyncio.run(run())
+
+
+def test_scheduler_join_waits_before_raising() -> None:
+    async def run() -> list[str]:
+        scheduler = ExportScheduler(2)
+        finished: list[str] = []
+
+        async def fail() -> None:
+            raise RuntimeError("export failed")
+
+        async def export() -> None:
+            await asyncio.sleep(0.01)
+            finished.append("export")
+
+        scheduler.submit(fail)
+        scheduler.submit(export)
+        with pytest.raises(RuntimeError, match="export failed"):
+            await scheduler.join()
+        return finished
+
+    assert asyncio.run(run()) == ["export"]
+
+
+def test_scheduler_needs_a_slot() -> None:
+    with pytest.raises(ValueError, match="at least 1"):
+        ExportScheduler(0)
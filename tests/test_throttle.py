@@ -0,0 +1,54 @@
+import pytest
+
+from common import throttle
+from common.throttle import ExportThrottle
+
+
+def test_throttle_adds_exports_then_parallel() -> None:
+    export_throttle = ExportThrottle(max_exports=4, max_parallel=6, parallel=4)
+    export_throttle.exports = 2
+
+    changes = [export_throttle.record(rate_limits=0) for _ in range(5)]
+
+    assert changes == [True, True, True, True, False]
+    assert (export_throttle.exports, export_throttle.parallel) == (4, 6)
+
+
+@pytest.mark.parametrize(("rate_limits", "failed"), [(1, False), (0, True), (3, True)])
+def test_throttle_backs_off(rate_limits: int, failed: bool) -> None:
+    export_throttle = ExportThrottle(max_exports=8, max_parallel=16, parallel=10)
+
+    assert export_throttle.record(rate_limits=rate_limits, failed=failed)
+
+    assert (export_throttle.exports, export_throttle.parallel) == (4, 5)
+    assert export_throttle.rate_limits == rate_limits
+    assert export_throttle.failures == failed
+
+
+def test_throttle_backs_off_once_per_cooldown(monkeypatch: pytest.MonkeyPatch) -> None:
+    now = 1000.0
+    monkeypatch.setattr(throttle.time, "monotonic", lambda: now)
+    export_throttle = ExportThrottle(
+        max_exports=8, max_parallel=16, parallel=16, cooldown=30
+    )
+
+    export_throttle.record(rate_limits=1)
+    # the rest of the exports hit by the same rate limit don't halve it again
+    assert not export_throttle.record(rate_limits=1)
+    assert not export_throttle.record(rate_limits=0, failed=True)
+    assert (export_throttle.exports, export_throttle.parallel) == (4, 8)
+
+    now += 31
+    assert export_throttle.record(rate_limits=1)
+    assert (export_throttle.exports, export_throttle.parallel) == (2, 4)
+    assert "3 rate limit(s) hit, 1 failed export(s)" in export_throttle.describe()
+
+
+def test_throttle_never_goes_below_one() -> None:
+    export_throttle = ExportThrottle(
+        max_exports=1, max_parallel=1, parallel=1, cooldown=0
+    )
+
+    export_throttle.record(rate_limits=1)
+
+    assert (export_throttle.exports, export_throttle.parallel) == (1, 1)